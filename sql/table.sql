@@ -58,12 +58,106 @@ CREATE TABLE pgqueuer_statistics (
 CREATE TABLE journal (
     message_id SERIAL PRIMARY KEY,
     topic TEXT NOT NULL,
-    text TEXT NOT NULL,
+    text TEXT,
     qos INTEGER,
     retain INTEGER,
-    time TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    time TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    value DOUBLE PRECISION,
+    unit TEXT,
+    dedup_key BYTEA,
+    topic_levels TEXT[],
+    broker TEXT,
+    payload_hash BYTEA
+);
+
+COMMENT ON COLUMN journal.value is 'Numeric value extracted from the payload (see "extract_values" config)';
+COMMENT ON COLUMN journal.unit is 'Unit of the extracted value';
+COMMENT ON COLUMN journal.dedup_key is 'Hash of broker, topic, payload and receive time window (see "dedup" config), unique if set';
+COMMENT ON COLUMN journal.topic_levels is 'Topic split into levels for wildcard queries (see "topic_levels" config)';
+COMMENT ON COLUMN journal.broker is 'Name of the receiving broker (see "broker_column" config)';
+COMMENT ON COLUMN journal.payload_hash is 'SHA-256 of a large payload stored in journal_payloads, "text" is NULL then (see "payload_store" config)';
+
+-- upgrade existing journal tables
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS value DOUBLE PRECISION;
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS unit TEXT;
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS dedup_key BYTEA;
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS topic_levels TEXT[];
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS broker TEXT;
+ALTER TABLE journal ADD COLUMN IF NOT EXISTS payload_hash BYTEA;
+ALTER TABLE journal ALTER COLUMN text DROP NOT NULL;
+
+-- a hypertable (TimescaleDB) can't have this index (it lacks the time column), drop it before converting:
+-- duplicates missed by the in-memory filter are stored then
+CREATE UNIQUE INDEX IF NOT EXISTS journal_dedup_key_idx ON journal ( dedup_key ) WHERE dedup_key IS NOT NULL;
+
+-- MQTT wildcard queries (see "--query"), rows without topic levels are not indexed
+CREATE INDEX IF NOT EXISTS journal_topic_levels_idx ON journal USING GIN ( topic_levels ) WHERE topic_levels IS NOT NULL;
+
+-- large payloads are stored once (see "payload_store" config), the text of a row is COALESCE(journal.text, journal_payloads.text)
+CREATE INDEX IF NOT EXISTS journal_payload_hash_idx ON journal ( payload_hash ) WHERE payload_hash IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS journal_payloads (
+    hash BYTEA PRIMARY KEY,
+    text TEXT NOT NULL,
+    created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
 );
 
+-- upgrade existing payload tables
+ALTER TABLE journal_payloads ADD COLUMN IF NOT EXISTS last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+COMMENT ON TABLE journal_payloads is 'Large payloads by content hash, unreferenced ones are deleted by the archiver';
+COMMENT ON COLUMN journal_payloads.last_used is 'Last time a writer sent the payload, recently used ones are not deleted';
+
+CREATE TABLE IF NOT EXISTS journal_latency (
+    time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    lane TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    count BIGINT NOT NULL,
+    avg_ms DOUBLE PRECISION,
+    p50_ms DOUBLE PRECISION,
+    p95_ms DOUBLE PRECISION,
+    p99_ms DOUBLE PRECISION,
+    max_ms DOUBLE PRECISION
+);
+
+COMMENT ON TABLE journal_latency is 'Periodic latency summaries (see "latency_stats_interval_seconds" config)';
+COMMENT ON COLUMN journal_latency.kind is '"receive" (received to committed) or "publish" (published to committed)';
+
+CREATE INDEX IF NOT EXISTS journal_latency_time_idx ON journal_latency ( time );
+
+CREATE TABLE IF NOT EXISTS journal_topic_stats (
+    time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    period_start TIMESTAMP WITH TIME ZONE,
+    broker TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    messages BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    drops BIGINT NOT NULL,
+    first_seen TIMESTAMP WITH TIME ZONE,
+    last_seen TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE journal_topic_stats is 'Received messages per topic and period, counted by the listener (see "topic_stats_interval_seconds" config)';
+COMMENT ON COLUMN journal_topic_stats.drops is 'Received but not stored (dedup, rate limits)';
+COMMENT ON COLUMN journal_topic_stats.topic is '"#": all topics beyond "topic_stats_max_topics"';
+
+CREATE INDEX IF NOT EXISTS journal_topic_stats_time_idx ON journal_topic_stats ( time );
+CREATE INDEX IF NOT EXISTS journal_topic_stats_topic_idx ON journal_topic_stats ( topic, time );
+
+CREATE TABLE IF NOT EXISTS journal_maintenance (
+    table_name TEXT NOT NULL,
+    job TEXT NOT NULL,
+    last_run TIMESTAMP WITH TIME ZONE NOT NULL,
+    duration_seconds DOUBLE PRECISION,
+    status TEXT,
+    instance TEXT,
+    PRIMARY KEY (table_name, job)
+);
+
+COMMENT ON TABLE journal_maintenance is 'Last run of every maintenance job, shared by all logger instances (see "maintenance" config)';
+
 -- manual test
 -- INSERT INTO pgqueuer (message_id, topic, text, qos, retain) values (1, 'topic', '{"a": "json"}', 1, 0);
 -- SELECT * FROM pgqueuer;
@@ -0,0 +1,109 @@
+import asyncio
+import collections
+import logging
+from collections.abc import Callable
+
+from src.message_record import ACK, MessageRecord
+
+_logger = logging.getLogger(__name__)
+
+
+class AckTracker:
+	"""
+	Holds back the acknowledgements (PUBACK) of received QoS 1 messages until they are committed
+	by every database target.
+
+	Acknowledgements are sent in the order the messages were received (as MQTT demands), so a
+	slow lane delays the acknowledgements of faster ones. The number of unacknowledged messages is
+	bounded by `max_unacked`: `wait_for_room` blocks the receiving until batches got committed.
+
+	A message a database rejected is never acknowledged, neither are the following ones: the
+	tracker `failed`, the listener reconnects and the broker redelivers all of them.
+
+	QoS 2 is not covered: paho sends PUBREC as soon as the message arrives (the broker's part of the
+	delivery is done), only PUBCOMP waits for the manual acknowledgement, so it is sent at once.
+	The listener subscribes with QoS 1, brokers deliver QoS 2 publications with QoS 1 then.
+	"""
+
+	DEFAULT_MAX_UNACKED = 10000
+
+	# entry: [pending copies, mid, qos, failed]
+	COPIES = 0
+	FAILED = 3
+
+	def __init__(self, ack: Callable[[int, int], None], max_unacked: int, copies: int = 1):
+		self._ack = ack
+		self._max_unacked = max_unacked
+		self._copies = copies
+		self._entries: collections.deque[list] = collections.deque()
+		self._room = asyncio.Event()
+		self._room.set()
+		self._failed = False
+
+	@property
+	def unacked(self) -> int:
+		return len(self._entries)
+
+	@property
+	def full(self) -> bool:
+		return len(self._entries) >= self._max_unacked
+
+	@property
+	def failed(self) -> bool:
+		"""A message was not stored, its redelivery needs a new connection."""
+		return self._failed
+
+	def track(self, mid: int, qos: int) -> list | None:
+		"""Returns the entry to be passed along with the record (`ACK`)."""
+		if qos == 0:
+			return None
+		if qos == 2:
+			self._ack(mid, qos)  # PUBCOMP, see above
+			return None
+		entry = [self._copies, mid, qos, False]
+		self._entries.append(entry)
+		if len(self._entries) >= self._max_unacked:
+			self._room.clear()
+		return entry
+
+	def release(self, records: list[MessageRecord]) -> None:
+		"""Called by every database target for records which are done."""
+		self.count_done(records)
+		self.send_acks()
+
+	@classmethod
+	def count_done(cls, records: list[MessageRecord], stored: bool = True) -> None:
+		"""
+		`release` for records of several trackers, followed by `send_acks` of each tracker.
+		Records which were not `stored` (rejected) keep their acknowledgement back.
+		"""
+		for record in records:
+			if len(record) > ACK and record[ACK] is not None:
+				record[ACK][cls.COPIES] -= 1
+				if not stored:
+					record[ACK][cls.FAILED] = True
+
+	def discard(self, record: MessageRecord) -> None:
+		"""The record won't be stored (e.g. rate limited)."""
+		if len(record) > ACK and record[ACK] is not None:
+			record[ACK][self.COPIES] = 0
+			self.send_acks()
+
+	def send_acks(self) -> None:
+		entries = self._entries
+		while entries and entries[0][self.COPIES] <= 0:
+			if entries[0][self.FAILED]:
+				if not self._failed:
+					self._failed = True
+					_logger.warning("message %d was not stored, acknowledgements held", entries[0][1])
+				self._room.set()  # wakes the receiving, which reconnects
+				return
+			_, mid, qos, _ = entries.popleft()
+			self._ack(mid, qos)
+		if len(entries) < self._max_unacked:
+			self._room.set()
+
+	async def wait_for_room(self) -> None:
+		if not self._room.is_set():
+			_logger.debug("%d messages unacknowledged, waiting for commits", len(self._entries))
+			await self._room.wait()
@@ -9,6 +9,7 @@ from src.constants import CONFIG_JSONSCHEMA
 class AppConfig:
 	def __init__(self, config_file: str):
 		self._config_data = {}
+		self._config_file = config_file
 
 		self.check_config_file_access(config_file)
 
@@ -22,14 +23,36 @@ class AppConfig:
 
 		validate(file_data, CONFIG_JSONSCHEMA)
 
+	@property
+	def config_file(self) -> str:
+		return self._config_file
+
 	def get_database_config(self):
-		return self._config_data["database"]
+		"""The first (primary) database target"""
+		return self.get_database_configs()[0]
+
+	def get_database_configs(self) -> list[dict]:
+		"""`database` is either one target or a list of targets"""
+		database = self._config_data["database"]
+		return database if isinstance(database, list) else [database]
 
 	def get_logging_config(self):
 		return self._config_data["logging"]
 
 	def get_mqtt_config(self):
-		return self._config_data["mqtt"]
+		"""The first (primary) broker"""
+		return self.get_mqtt_configs()[0]
+
+	def get_mqtt_configs(self) -> list[dict]:
+		"""`mqtt` is either one broker or a list of brokers"""
+		mqtt = self._config_data["mqtt"]
+		return mqtt if isinstance(mqtt, list) else [mqtt]
+
+	def get_live_tail_config(self) -> dict | None:
+		return self._config_data.get("live_tail")
+
+	def get_current_values_config(self) -> dict | None:
+		return self._config_data.get("current_values")
 
 	@classmethod
 	def check_config_file_access(cls, config_file: str):
@@ -0,0 +1,359 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import logging
+import os
+import urllib.parse
+from collections.abc import Awaitable, Callable
+
+from src.database import Database, DatabaseConfKey
+from src.payload_store import PayloadStore
+
+_logger = logging.getLogger(__name__)
+
+
+class ArchiveFormat:
+	CSV_GZ = "csv.gz"
+	PARQUET = "parquet"
+
+	ALL = [CSV_GZ, PARQUET]
+
+
+def to_pg_array(values: list) -> str:
+	"""Array literal as Postgres prints it, e.g. `{a,"b c",NULL}`"""
+	elements = []
+	for value in values:
+		if value is None:
+			elements.append("NULL")
+			continue
+		text = str(value)
+		if not text or text.upper() == "NULL" or any(c in text for c in '{},"\\ \t\n'):
+			text = '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+		elements.append(text)
+	return "{" + ",".join(elements) + "}"
+
+
+class CsvArchiveFile:
+	"""
+	gzip compressed CSV, written row by row. Values are written as Postgres text (bytea as
+	`\\x<hex>`, arrays as `{a,b}`), so `COPY ... CSV HEADER` loads them back.
+	"""
+
+	def __init__(self, path: str, columns: list[str], pg_types: list[str]):
+		self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+		self._writer = csv.writer(self._file)
+		self._writer.writerow(columns)
+		# columns needing a conversion: (index, converter)
+		self._converters = [
+			(index, self.to_bytea_text if pg_type == "bytea" else to_pg_array)
+			for index, pg_type in enumerate(pg_types)
+			if pg_type == "bytea" or pg_type.startswith("_")
+		]
+
+	@staticmethod
+	def to_bytea_text(value: bytes) -> str:
+		return "\\x" + value.hex()
+
+	def write_rows(self, rows: list[tuple]) -> None:
+		if self._converters:
+			rows = [self.convert(row) for row in rows]
+		self._writer.writerows(rows)
+
+	def convert(self, row: tuple) -> list:
+		row = list(row)
+		for index, converter in self._converters:
+			if row[index] is not None:
+				row[index] = converter(row[index])
+		return row
+
+	def close(self) -> None:
+		self._file.close()
+
+
+class ParquetArchiveFile:
+	"""Parquet (zstd compressed), every written chunk becomes a row group. Requires `pyarrow`."""
+
+	PG_TO_ARROW = {
+		"bool": "bool_",
+		"int2": "int16",
+		"int4": "int32",
+		"int8": "int64",
+		"float4": "float32",
+		"float8": "float64",
+		"text": "string",
+		"varchar": "string",
+		"json": "string",
+		"jsonb": "string",
+		"bytea": "binary",
+	}
+
+	def __init__(self, path: str, columns: list[str], pg_types: list[str]):
+		try:
+			import pyarrow
+			import pyarrow.parquet
+		except ImportError as ex:
+			raise RuntimeError(
+				f"archive format '{ArchiveFormat.PARQUET}' requires the package 'pyarrow'!"
+			) from ex
+
+		self._pa = pyarrow
+		self._columns = columns
+		self._schema = pyarrow.schema(
+			[
+				(column, self._to_arrow_type(pg_type))
+				for column, pg_type in zip(columns, pg_types, strict=True)
+			]
+		)
+		self._writer = pyarrow.parquet.ParquetWriter(path, self._schema, compression="zstd")
+
+	def _to_arrow_type(self, pg_type: str):
+		if pg_type == "timestamptz":
+			return self._pa.timestamp("us", tz="UTC")
+		if pg_type == "_text":
+			return self._pa.list_(self._pa.string())
+		return getattr(self._pa, self.PG_TO_ARROW.get(pg_type, "string"))()
+
+	def write_rows(self, rows: list[tuple]) -> None:
+		data = {
+			column: [self._to_arrow_value(row[index], field.type) for row in rows]
+			for index, (column, field) in enumerate(zip(self._columns, self._schema, strict=True))
+		}
+		self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+
+	def _to_arrow_value(self, value, arrow_type):
+		if value is None or not self._pa.types.is_string(arrow_type) or isinstance(value, str):
+			return value
+		return str(value)
+
+	def close(self) -> None:
+		self._writer.close()
+
+
+ARCHIVE_FILE_CLASSES = {
+	ArchiveFormat.CSV_GZ: CsvArchiveFile,
+	ArchiveFormat.PARQUET: ParquetArchiveFile,
+}
+
+
+class Archiver:
+	"""
+	Moves expired messages (older than `clean_up_after_days`) into compressed files.
+
+	Whole days are archived, one transaction per day: the rows are streamed with a server side
+	cursor in chunks into one file per topic prefix (hive style partitions:
+	`<archive_dir>/day=<date>/prefix=<prefix>/`) and deleted afterwards. The transaction runs in
+	"repeatable read", so only archived rows get deleted. The files are written in a thread (see
+	`run_blocking`), not on the event loop.
+
+	With `payload_store` the files get the stored payloads as text, payloads which are no longer
+	referenced are deleted along with the rows.
+
+	Without `archive_dir` the expired messages are just deleted by `clean_up` (day by day too, see
+	the `maintenance` jobs).
+	"""
+
+	DEFAULT_CHUNK_SIZE = 10000
+	DEFAULT_CLEAN_UP_AFTER_DAYS = 14
+	DEFAULT_FORMAT = ArchiveFormat.CSV_GZ
+	DEFAULT_TOPIC_LEVELS = 1
+	PAYLOAD_TEXT_COLUMN = "payload_text"
+
+	def __init__(self, database: Database, config: dict):
+		self._database = database
+		self._archive_dir: str | None = config.get(DatabaseConfKey.ARCHIVE_DIR)
+		self._format: str = config.get(DatabaseConfKey.ARCHIVE_FORMAT, self.DEFAULT_FORMAT)
+		self._topic_levels: int = config.get(
+			DatabaseConfKey.ARCHIVE_TOPIC_LEVELS, self.DEFAULT_TOPIC_LEVELS
+		)
+		self._chunk_size: int = config.get(DatabaseConfKey.ARCHIVE_CHUNK_SIZE, self.DEFAULT_CHUNK_SIZE)
+		self._interval_minutes: int = config.get(DatabaseConfKey.ARCHIVE_INTERVAL_MINUTES, 0)
+		self._clean_up_after_days: int = config.get(
+			DatabaseConfKey.CLEAN_UP_AFTER_DAYS, self.DEFAULT_CLEAN_UP_AFTER_DAYS
+		)
+		self._payloads = PayloadStore(config.get(DatabaseConfKey.PAYLOAD_STORE))
+
+	@property
+	def enabled(self) -> bool:
+		return bool(self._archive_dir) and self._clean_up_after_days > 0
+
+	@property
+	def periodic(self) -> bool:
+		"""`archive_interval_minutes`, run as maintenance job (see `MaintenanceScheduler`)"""
+		return self.enabled and self._interval_minutes > 0
+
+	@property
+	def interval_minutes(self) -> int:
+		return self._interval_minutes
+
+	def get_cutoff(self) -> datetime.datetime:
+		"""Start of the first day which is kept."""
+		expired = self._database._now() - datetime.timedelta(days=self._clean_up_after_days)
+		return expired.replace(hour=0, minute=0, second=0, microsecond=0)
+
+	def get_prefix(self, topic: str) -> str:
+		return "/".join(topic.split("/")[: self._topic_levels])
+
+	def get_query(self) -> str:
+		table_name = self._database.table_name
+		if not self._payloads:
+			return f"SELECT * FROM {table_name} WHERE time >= $1 AND time < $2"
+		return (
+			f"SELECT j.*, p.text AS {self.PAYLOAD_TEXT_COLUMN} FROM {table_name} j "
+			f"LEFT JOIN {self._payloads.table_name} p ON p.hash = j.{PayloadStore.HASH_COLUMN} "
+			"WHERE j.time >= $1 AND j.time < $2"
+		)
+
+	def get_file_path(self, day: datetime.date, prefix: str, file_name: str) -> str:
+		prefix_dir = "prefix=" + urllib.parse.quote(prefix, safe="")
+		return os.path.join(self._archive_dir, f"day={day.isoformat()}", prefix_dir, file_name)
+
+	async def archive(self) -> int:
+		if not self.enabled:
+			raise ValueError(
+				f"archiving needs '{DatabaseConfKey.ARCHIVE_DIR}' "
+				f"and a positive '{DatabaseConfKey.CLEAN_UP_AFTER_DAYS}'!"
+			)
+		return await self._process_expired(self.archive_range)
+
+	async def clean_up(self) -> int:
+		"""Archives (if `archive_dir` is set) or deletes the expired messages."""
+		if self.enabled:
+			return await self.archive()
+		if self._clean_up_after_days <= 0:
+			return 0
+		return await self._process_expired(self.delete_range)
+
+	async def _process_expired(
+		self, process_range: Callable[[datetime.datetime, datetime.datetime], Awaitable[int]]
+	) -> int:
+		"""Processes the expired messages day by day, returns the number of messages."""
+		cutoff = self.get_cutoff()
+		table_name = self._database.table_name
+
+		async with self._database.pool.acquire() as connection:
+			first_time = await connection.fetchval(
+				f"SELECT min(time) FROM {table_name} WHERE time < $1", cutoff
+			)
+
+		if first_time is None:
+			_logger.info("clean up: nothing to do (cutoff: %s)", cutoff)
+			return 0
+
+		total_count = 0
+		day_start = first_time.astimezone(cutoff.tzinfo)
+		day_start = day_start.replace(hour=0, minute=0, second=0, microsecond=0)
+		while day_start < cutoff:
+			day_end = min(day_start + datetime.timedelta(days=1), cutoff)
+			total_count += await process_range(day_start, day_end)
+			day_start = day_end
+
+		return total_count
+
+	async def delete_range(self, start: datetime.datetime, end: datetime.datetime) -> int:
+		table_name = self._database.table_name
+		async with self._database.pool.acquire() as connection:
+			async with connection.transaction():
+				status = await connection.execute(
+					f"DELETE FROM {table_name} WHERE time >= $1 AND time < $2", start, end
+				)
+				if self._payloads:
+					await connection.execute(self._payloads.get_prune_query(table_name), end)
+
+		count = int(status.rsplit(" ", 1)[-1])  # "DELETE <count>"
+		if count:
+			_logger.info("deleted %d expired messages (%s - %s)", count, start, end)
+		return count
+
+	@staticmethod
+	def resolve_payload(row: tuple, text_index: int, payload_index: int) -> tuple:
+		"""Replaces the empty text by the stored payload (last column)."""
+		row, payload_text = row[:payload_index], row[payload_index]
+		if payload_text is not None and row[text_index] is None:
+			end = text_index + 1
+			row = (*row[:text_index], payload_text, *row[end:])
+		return row
+
+	@staticmethod
+	async def run_blocking(function: Callable, *args) -> None:
+		"""
+		Runs file writes (compression) in a thread, so ingest goes on meanwhile. A cancellation
+		(e.g. the `max_seconds` of maintenance jobs) waits for the running call, the files are not
+		closed or removed under it.
+		"""
+		task = asyncio.ensure_future(asyncio.to_thread(function, *args))
+		try:
+			await asyncio.shield(task)
+		except asyncio.CancelledError:
+			await asyncio.wait([task])
+			raise
+
+	async def archive_range(self, start: datetime.datetime, end: datetime.datetime) -> int:
+		table_name = self._database.table_name
+		file_name = f"{table_name}-{int(self._database._now().timestamp())}.{self._format}"
+		file_class = ARCHIVE_FILE_CLASSES[self._format]
+
+		files = {}
+		paths = []
+		count = 0
+
+		def write_chunk(rows: list, columns: list[str], pg_types: list[str]) -> None:
+			by_prefix: dict[str, list[tuple]] = {}
+			for row in rows:
+				row = tuple(row)
+				if payload_index is not None:
+					row = self.resolve_payload(row, text_index, payload_index)
+				by_prefix.setdefault(self.get_prefix(row[topic_index]), []).append(row)
+
+			for prefix, prefix_rows in by_prefix.items():
+				archive_file = files.get(prefix)
+				if archive_file is None:
+					path = self.get_file_path(start.date(), prefix, file_name)
+					os.makedirs(os.path.dirname(path), exist_ok=True)
+					paths.append(path)
+					archive_file = files[prefix] = file_class(path, columns, pg_types)
+				archive_file.write_rows(prefix_rows)
+
+		def close_files() -> None:
+			for archive_file in files.values():
+				archive_file.close()
+
+		async with self._database.pool.acquire() as connection:
+			try:
+				async with connection.transaction(isolation="repeatable_read"):
+					statement = await connection.prepare(self.get_query())
+					attributes = statement.get_attributes()
+					columns = [attribute.name for attribute in attributes]
+					pg_types = [attribute.type.name for attribute in attributes]
+					topic_index = columns.index("topic")
+					payload_index = text_index = None
+					if self._payloads:  # the stored payload goes into "text"
+						payload_index, text_index = len(columns) - 1, columns.index("text")
+						columns, pg_types = columns[:payload_index], pg_types[:payload_index]
+
+					try:
+						cursor = await statement.cursor(start, end)
+						while rows := await cursor.fetch(self._chunk_size):
+							await self.run_blocking(write_chunk, rows, columns, pg_types)
+							count += len(rows)
+					finally:
+						await self.run_blocking(close_files)
+
+					await connection.execute(
+						f"DELETE FROM {table_name} WHERE time >= $1 AND time < $2", start, end
+					)
+					if self._payloads:
+						status = await connection.execute(
+							self._payloads.get_prune_query(table_name), end
+						)
+						_logger.debug("archive: payloads pruned (%s)", status)
+			except BaseException:
+				# the rows are still in the database, don't leave duplicates behind
+				for path in paths:
+					if os.path.exists(path):
+						os.remove(path)
+				raise
+
+		if count:
+			_logger.info("archived %d messages (%s - %s) into %d file(s)", count, start, end, len(files))
+		return count
@@ -0,0 +1,123 @@
+import logging
+import math
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class AdaptiveConfKey:
+	ADAPTIVE = "adaptive"
+	BATCH_SIZE_MIN = "batch_size_min"
+	BATCH_SIZE_MAX = "batch_size_max"
+	WAIT_MIN_SECONDS = "wait_min_seconds"
+	TARGET_LATENCY_SECONDS = "target_latency_seconds"
+
+
+class AdaptiveBatchController:
+	"""
+	Tunes batch size and flush interval of a `BatchWriter` from the observed arrival rate and COPY
+	duration.
+
+	The flush interval is what is left of the target latency after storing a batch
+	(`target - copy duration`), the batch size is what arrives within that interval. A backlog in the
+	queue raises the batch size up to `batch_size_max`, as large batches store faster in total. All
+	values are kept within the configured bounds (`wait_max_seconds` is the upper bound of the
+	interval).
+	"""
+
+	SMOOTHING = 0.2  # weight of the latest measurement (exponential moving average)
+	LOG_INTERVAL_SECONDS = 60
+
+	DEFAULT_BATCH_SIZE_MIN = 1
+	DEFAULT_BATCH_SIZE_MAX = 10000
+	DEFAULT_WAIT_MIN_SECONDS = 0.01
+	DEFAULT_TARGET_LATENCY_SECONDS = 1.0
+
+	def __init__(self, config: dict, batch_size: int, wait_max_seconds: float, name: str = "default"):
+		self._name = name
+		self._batch_size_min: int = config.get(
+			AdaptiveConfKey.BATCH_SIZE_MIN, self.DEFAULT_BATCH_SIZE_MIN
+		)
+		self._batch_size_max: int = config.get(
+			AdaptiveConfKey.BATCH_SIZE_MAX, self.DEFAULT_BATCH_SIZE_MAX
+		)
+		self._wait_min_seconds: float = config.get(
+			AdaptiveConfKey.WAIT_MIN_SECONDS, self.DEFAULT_WAIT_MIN_SECONDS
+		)
+		self._wait_max_seconds = max(wait_max_seconds, self._wait_min_seconds)
+		self._target_latency: float = config.get(
+			AdaptiveConfKey.TARGET_LATENCY_SECONDS, self.DEFAULT_TARGET_LATENCY_SECONDS
+		)
+
+		self._batch_size = self._clamp(batch_size, self._batch_size_min, self._batch_size_max)
+		self._wait_seconds = self._clamp(
+			self._target_latency, self._wait_min_seconds, self._wait_max_seconds
+		)
+
+		self._arrival_rate: float | None = None  # messages per second
+		self._copy_seconds: float | None = None
+		self._received_count = 0
+		self._last_update: float | None = None
+		self._last_log = 0.0
+
+	@property
+	def batch_size(self) -> int:
+		return self._batch_size
+
+	@property
+	def wait_seconds(self) -> float:
+		return self._wait_seconds
+
+	@property
+	def stats(self) -> dict:
+		return {
+			"batch_size": self._batch_size,
+			"wait_seconds": self._wait_seconds,
+			"arrival_rate": self._arrival_rate,
+			"copy_seconds": self._copy_seconds,
+		}
+
+	@staticmethod
+	def _clamp(value, lower, upper):
+		return max(lower, min(upper, value))
+
+	def _smooth(self, current: float | None, measured: float) -> float:
+		if current is None:
+			return measured
+		return current + self.SMOOTHING * (measured - current)
+
+	def on_received(self) -> None:
+		self._received_count += 1
+
+	def on_stored(self, copy_seconds: float, backlog: int, now: float | None = None) -> None:
+		now = time.monotonic() if now is None else now
+
+		if self._last_update is not None and now > self._last_update:
+			self._arrival_rate = self._smooth(
+				self._arrival_rate, self._received_count / (now - self._last_update)
+			)
+		self._received_count = 0
+		self._last_update = now
+
+		self._copy_seconds = self._smooth(self._copy_seconds, copy_seconds)
+
+		if self._arrival_rate is None:
+			return
+
+		self._wait_seconds = self._clamp(
+			self._target_latency - self._copy_seconds, self._wait_min_seconds, self._wait_max_seconds
+		)
+		batch_size = max(math.ceil(self._arrival_rate * self._wait_seconds), backlog)
+		self._batch_size = self._clamp(batch_size, self._batch_size_min, self._batch_size_max)
+
+		if now - self._last_log >= self.LOG_INTERVAL_SECONDS:
+			self._last_log = now
+			_logger.info(
+				"%s: adaptive batch_size=%d, wait=%.3fs (arrival rate: %.1f/s, copy: %.3fs, backlog: %d)",
+				self._name,
+				self._batch_size,
+				self._wait_seconds,
+				self._arrival_rate,
+				self._copy_seconds,
+				backlog,
+			)
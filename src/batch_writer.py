@@ -0,0 +1,422 @@
+import asyncio
+import collections
+import logging
+import time
+from collections.abc import Callable
+
+import asyncpg
+
+from src.batch_controller import AdaptiveBatchController, AdaptiveConfKey
+from src.database import Database, DatabaseConfKey
+from src.job_feeder import JobFeeder
+from src.latency_tracker import LatencyTracker
+from src.message_record import ACK, BROKER, DEDUP_KEY, PUBLISHED, TEXT, TOPIC, MessageRecord
+from src.payload_store import PayloadStore
+from src.profiler import Stage, profiler
+from src.spill_buffer import SpillBuffer
+from src.value_extractor import ValueExtractor
+
+_logger = logging.getLogger(__name__)
+
+
+class BatchWriter:
+	"""
+	Queues received messages and stores them batch wise via COPY.
+
+	A batch is flushed as soon as `batch_size` records are queued or the oldest queued record
+	waited `wait_max_seconds`. In adaptive mode both values are tuned continuously by an
+	`AdaptiveBatchController`.
+
+	Failures stay within the writer: batches are retried (with growing delays) as long as the
+	database is unreachable. Batches the database rejects are split in halves and retried, so only
+	the rejected rows are dropped. Beyond `max_queue_size` queued records go into the spill buffer
+	(`spill_dir`) or get dropped, except for records awaiting their acknowledgement
+	(`ack_after_commit`): they are bounded by `max_unacked_messages` already and must not be
+	acknowledged before they were committed.
+
+	Messages matching the `jobs` rules are enqueued into the `pgqueuer` table in the same
+	transaction (see `JobFeeder`), so are new large payloads (see `PayloadStore`).
+	"""
+
+	DEFAULT_BATCH_SIZE = 100
+	DEFAULT_WAIT_MAX_SECONDS = 1
+	DEFAULT_WRITER_CONCURRENCY = 1
+	DEFAULT_MAX_QUEUE_SIZE = 0  # unbounded
+
+	RETRY_MIN_SECONDS = 1
+	RETRY_MAX_SECONDS = 60
+	DROP_LOG_INTERVAL_SECONDS = 60
+
+	RETRY_ERRORS = (
+		OSError,
+		asyncpg.InterfaceError,
+		asyncpg.PostgresConnectionError,
+		asyncpg.exceptions.OperatorInterventionError,
+		asyncpg.exceptions.InsufficientResourcesError,
+	)
+
+	COLUMNS = ["topic", "text", "qos", "retain", "time"]
+	VALUE_COLUMNS = ["value", "unit"]
+	TOPIC_LEVELS_COLUMN = "topic_levels"
+	BROKER_COLUMN = "broker"
+	DEDUP_KEY_COLUMN = "dedup_key"
+
+	def __init__(self, database: Database, config: dict, name: str = "default"):
+		self._database = database
+		self._name = name
+		self._batch_size: int = config.get(DatabaseConfKey.BATCH_SIZE, self.DEFAULT_BATCH_SIZE)
+		self._wait_max_seconds: float = config.get(
+			DatabaseConfKey.WAIT_MAX_SECONDS, self.DEFAULT_WAIT_MAX_SECONDS
+		)
+		self._concurrency: int = config.get(
+			DatabaseConfKey.WRITER_CONCURRENCY, self.DEFAULT_WRITER_CONCURRENCY
+		)
+
+		self._controller: AdaptiveBatchController | None = None
+		if config.get(AdaptiveConfKey.ADAPTIVE):
+			self._controller = AdaptiveBatchController(
+				config, self._batch_size, self._wait_max_seconds, name
+			)
+
+		self._extractor = ValueExtractor(config.get(DatabaseConfKey.EXTRACT_VALUES))
+		self._columns = self.COLUMNS + (self.VALUE_COLUMNS if self._extractor else [])
+		self._topic_levels: bool = config.get(DatabaseConfKey.TOPIC_LEVELS, False)
+		if self._topic_levels:
+			self._columns.append(self.TOPIC_LEVELS_COLUMN)
+		self._broker_column: bool = config.get(DatabaseConfKey.BROKER_COLUMN, False)
+		if self._broker_column:
+			self._columns.append(self.BROKER_COLUMN)
+		self._payloads = PayloadStore(config.get(DatabaseConfKey.PAYLOAD_STORE))
+		if self._payloads:
+			self._columns.append(PayloadStore.HASH_COLUMN)
+		self._jobs = JobFeeder(
+			config.get(DatabaseConfKey.JOBS),
+			config.get(DatabaseConfKey.JOBS_TABLE, JobFeeder.DEFAULT_TABLE_NAME),
+			config.get(DatabaseConfKey.JOBS_CHANNEL, JobFeeder.DEFAULT_CHANNEL),
+		)
+
+		self._latency: LatencyTracker | None = None
+		if config.get(DatabaseConfKey.LATENCY_STATS_INTERVAL_SECONDS):
+			self._latency = LatencyTracker(name, database.table_name)
+
+		self._max_queue_size: int = config.get(
+			DatabaseConfKey.MAX_QUEUE_SIZE, self.DEFAULT_MAX_QUEUE_SIZE
+		)
+		self._spill: SpillBuffer | None = None
+		if config.get(DatabaseConfKey.SPILL_DIR):
+			self._spill = SpillBuffer(config[DatabaseConfKey.SPILL_DIR], name)
+		self._spill_lock = asyncio.Lock()
+		self._stored_count = 0
+		self._dropped_count = 0
+		self._duplicate_count = 0
+		self._drop_log_time = 0.0
+		self._on_done: Callable[[list[MessageRecord], bool], None] | None = None
+
+		self._queue: asyncio.Queue[MessageRecord] = asyncio.Queue()
+
+	@property
+	def name(self) -> str:
+		return self._name
+
+	@property
+	def queue_size(self) -> int:
+		return self._queue.qsize()
+
+	@property
+	def controller(self) -> AdaptiveBatchController | None:
+		return self._controller
+
+	@property
+	def latency(self) -> LatencyTracker | None:
+		return self._latency
+
+	@property
+	def spill(self) -> SpillBuffer | None:
+		return self._spill
+
+	@property
+	def payloads(self) -> PayloadStore:
+		return self._payloads
+
+	@property
+	def jobs(self) -> JobFeeder:
+		return self._jobs
+
+	@property
+	def stored_count(self) -> int:
+		"""Messages committed by this writer (duplicates included)"""
+		return self._stored_count
+
+	@property
+	def dropped_count(self) -> int:
+		return self._dropped_count
+
+	@property
+	def duplicate_count(self) -> int:
+		return self._duplicate_count
+
+	def set_on_done(self, callback: Callable[[list[MessageRecord], bool], None] | None) -> None:
+		"""`callback(records, stored)` gets the committed (`True`) and the rejected records."""
+		self._on_done = callback
+
+	def put(self, record: MessageRecord) -> None:
+		if self._max_queue_size and self._queue.qsize() >= self._max_queue_size:
+			if len(record) <= ACK or record[ACK] is None:  # otherwise bounded by `max_unacked`
+				if self._spill is not None:
+					self._spill.append(record)
+				else:
+					self._drop(1, "queue full")
+				return
+
+		self._queue.put_nowait(record)
+		if self._controller:
+			self._controller.on_received()
+
+	def _drop(self, count: int, reason: str) -> None:
+		self._dropped_count += count
+		now = time.monotonic()
+		if now - self._drop_log_time >= self.DROP_LOG_INTERVAL_SECONDS:
+			self._drop_log_time = now
+			_logger.warning(
+				"%s: messages dropped (%s, %d in total)", self._name, reason, self._dropped_count
+			)
+
+	async def run(self) -> None:
+		async with asyncio.TaskGroup() as tg:
+			for _ in range(self._concurrency):
+				tg.create_task(self._run_worker())
+			if self._spill is not None:
+				tg.create_task(self._spill.run_sync())
+
+	async def _run_worker(self) -> None:
+		# a batch is removed from `pending` only after it was stored, so nothing gets lost if the task
+		# is cancelled while waiting or storing.
+		pending: list[MessageRecord] = []
+		loop = asyncio.get_running_loop()
+		try:
+			while True:
+				if self._spill is not None and self._spill.pending and self._has_room():
+					await self._store_spilled()
+
+				await self._collect_batch(pending)
+
+				start_time = loop.time()
+				start_ns = time.perf_counter_ns() if profiler.enabled else 0
+				stored = await self._store(pending)
+				if start_ns and profiler.enabled:
+					profiler.lap(Stage.COPY, start_ns)
+				if self._controller:
+					self._controller.on_stored(loop.time() - start_time, self._queue.qsize())
+				if self._latency and stored:
+					self._latency.on_committed(pending, self._database._now_utc())
+
+				pending.clear()
+		except asyncio.CancelledError:
+			while not self._queue.empty():
+				pending.append(self._queue.get_nowait())
+			if pending:
+				try:
+					await self.flush(pending)
+				except Exception:
+					if self._spill is None:
+						raise
+					for record in pending:
+						self._spill.append(record)
+					_logger.warning("%s: %d messages spilled on shutdown", self._name, len(pending))
+			if self._spill is not None:
+				self._spill.close()
+			raise
+
+	def _has_room(self) -> bool:
+		return not self._max_queue_size or self._queue.qsize() < self._max_queue_size // 2
+
+	async def _store(self, records: list[MessageRecord]) -> bool:
+		"""Returns `False` if the database rejected records (dropped)."""
+		delay = self.RETRY_MIN_SECONDS
+		while True:
+			try:
+				await self.flush(records)
+				self._stored_count += len(records)
+				if self._on_done is not None:
+					self._on_done(records, True)
+				return True
+			except self.RETRY_ERRORS as ex:
+				_logger.warning(
+					"%s: storing %d messages failed, retry in %ds (%s)",
+					self._name,
+					len(records),
+					delay,
+					ex,
+				)
+				await self._database.expire_connections()
+				await asyncio.sleep(delay)
+				delay = min(delay * 2, self.RETRY_MAX_SECONDS)
+			except Exception as ex:
+				if len(records) > 1:
+					# one bad row fails the whole COPY, the halves are retried to drop only the bad rows
+					_logger.warning(
+						"%s: database rejected %d messages, retrying in halves (%s)",
+						self._name,
+						len(records),
+						ex,
+					)
+					middle = len(records) // 2
+					first = await self._store(records[:middle])
+					second = await self._store(records[middle:])
+					return first and second
+				_logger.error(
+					"%s: database rejected a message (%s: %s)", self._name, records[0][TOPIC], ex
+				)
+				self._drop(1, "rejected")
+				if self._on_done is not None:
+					self._on_done(records, False)
+				return False
+
+	async def _store_spilled(self) -> None:
+		if self._spill_lock.locked():
+			return  # another worker is on it
+		async with self._spill_lock:
+			path = self._spill.take()
+			if path is None:
+				return
+			count = 0
+			for chunk in SpillBuffer.read_chunks(path, self._batch_size):
+				await self._store(chunk)
+				count += len(chunk)
+			SpillBuffer.remove(path)
+			_logger.info("%s: %d spilled messages stored", self._name, count)
+
+	async def _collect_batch(self, pending: list[MessageRecord]) -> None:
+		queue = self._queue
+		if self._controller:
+			batch_size, wait_seconds = self._controller.batch_size, self._controller.wait_seconds
+		else:
+			batch_size, wait_seconds = self._batch_size, self._wait_max_seconds
+
+		pending.append(await queue.get())
+
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + wait_seconds
+		while len(pending) < batch_size:
+			if not queue.empty():
+				pending.append(queue.get_nowait())
+				continue
+
+			timeout = deadline - loop.time()
+			if timeout <= 0:
+				break
+			try:
+				pending.append(await asyncio.wait_for(queue.get(), timeout))
+			except TimeoutError:
+				break
+
+	async def flush(self, records: list[MessageRecord]) -> None:
+		rows = records
+		if self._extractor:
+			values, units = self._extractor.extract(
+				[record[TOPIC] for record in records], [record[TEXT] for record in records]
+			)
+			rows = [
+				(*record[:PUBLISHED], value, unit)
+				for record, value, unit in zip(records, values, units, strict=True)
+			]
+		elif any(len(record) > PUBLISHED for record in records):  # brokers may differ in length
+			rows = [record[:PUBLISHED] for record in records]
+
+		if self._topic_levels:
+			levels: dict[str, list[str]] = {}  # topics repeat within a batch
+			rows = [
+				(*row, levels.get(row[TOPIC]) or levels.setdefault(row[TOPIC], row[TOPIC].split("/")))
+				for row in rows
+			]
+		if self._broker_column:
+			rows = [
+				(*row, record[BROKER] if len(record) > BROKER else None)
+				for row, record in zip(rows, records, strict=True)
+			]
+
+		payloads = None
+		if self._payloads:
+			rows, payloads = self._payloads.prepare(rows)
+
+		if any(len(record) > DEDUP_KEY and record[DEDUP_KEY] for record in records):
+			rows = [
+				(*row, record[DEDUP_KEY] if len(record) > DEDUP_KEY else None)
+				for row, record in zip(rows, records, strict=True)
+			]
+			await self._insert_deduplicated(rows, records, payloads)
+		else:
+			jobs = self._jobs.create_jobs(records) if self._jobs else None
+			async with self._database.pool.acquire() as connection:
+				if jobs or payloads:
+					async with connection.transaction():
+						if payloads:
+							await self._payloads.store(connection, payloads)
+						await connection.copy_records_to_table(
+							self._database.table_name, records=rows, columns=self._columns
+						)
+						if jobs:
+							await self._jobs.enqueue(connection, jobs, self._database._now_utc())
+				else:
+					await connection.copy_records_to_table(
+						self._database.table_name, records=rows, columns=self._columns
+					)
+			_logger.debug("%s: stored %d messages", self._name, len(rows))
+
+		if payloads:
+			self._payloads.remember(payloads)  # committed
+
+	async def _insert_deduplicated(
+		self,
+		rows: list[tuple],
+		records: list[MessageRecord],
+		payloads: dict[bytes, str] | None,
+	) -> None:
+		"""
+		COPY into a staging table, rows with known dedup keys are skipped by the unique index.
+		Without the index (impossible on a TimescaleDB hypertable) all rows are inserted.
+		Jobs are enqueued for the inserted rows only.
+		"""
+		table_name = self._database.table_name
+		staging_table = f"{table_name}_staging"
+		columns = ", ".join(self._columns + [self.DEDUP_KEY_COLUMN])
+
+		async with self._database.pool.acquire() as connection:
+			async with connection.transaction():
+				if payloads:
+					await self._payloads.store(connection, payloads)
+				await connection.execute(
+					f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging_table} "
+					f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+				)
+				await connection.copy_records_to_table(
+					staging_table, records=rows, columns=self._columns + [self.DEDUP_KEY_COLUMN]
+				)
+				inserted_keys = await connection.fetch(
+					f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table} "
+					f"ON CONFLICT DO NOTHING RETURNING {self.DEDUP_KEY_COLUMN}"
+				)
+				if self._jobs:
+					inserted_records = self.get_inserted(records, [row[0] for row in inserted_keys])
+					jobs = self._jobs.create_jobs(inserted_records)
+					if jobs:
+						await self._jobs.enqueue(connection, jobs, self._database._now_utc())
+
+		inserted = len(inserted_keys)
+		duplicates = len(rows) - inserted
+		self._duplicate_count += duplicates
+		_logger.debug("%s: stored %d messages (%d duplicates)", self._name, inserted, duplicates)
+
+	@staticmethod
+	def get_inserted(records: list[MessageRecord], keys: list[bytes | None]) -> list[MessageRecord]:
+		"""The records of the returned dedup keys, a key is inserted once (the first record)."""
+		remaining = collections.Counter(key for key in keys if key is not None)
+		inserted = []
+		for record in records:
+			key = record[DEDUP_KEY] if len(record) > DEDUP_KEY else None
+			if key is None:
+				inserted.append(record)
+			elif remaining[key] > 0:
+				remaining[key] -= 1
+				inserted.append(record)
+		return inserted
@@ -1,7 +1,19 @@
+from src.archiver import ArchiveFormat
+from src.batch_controller import AdaptiveConfKey
+from src.current_values import CurrentValuesConfKey
 from src.database import DatabaseConfKey
+from src.dedup_filter import DedupConfKey
+from src.job_feeder import JobConfKey
+from src.live_tail import LiveTailConfKey
+from src.maintenance import MaintenanceConfKey, MaintenanceJobConfKey, MaintenanceJobKind
+from src.payload_store import PayloadStoreConfKey
+from src.rate_limiter import RateLimitConfKey, RateLimitMode
+from src.value_extractor import ExtractConfKey
+from src.writer_pipeline import LaneConfKey
 
 
 class MqttConfKey:
+	NAME = "name"
 	CLIENT_ID = "client_id"
 	HOST = "host"
 	PORT = "port"
@@ -18,6 +30,16 @@ class MqttConfKey:
 	SUBSCRIPTIONS = "subscriptions"
 	SKIP_SUBSCRIPTION_REGEXES = "skip_subscription_regexes"
 
+	RATE_LIMITS = "rate_limits"
+	RATE_LIMIT_MAX_TOPICS = "rate_limit_max_topics"
+	PUBLISH_TIME_PROPERTY = "publish_time_property"
+	ACK_AFTER_COMMIT = "ack_after_commit"
+	MAX_UNACKED_MESSAGES = "max_unacked_messages"
+	DEDUP = "dedup"
+	RECONNECT_MAX_SECONDS = "reconnect_max_seconds"
+	TOPIC_STATS_INTERVAL_SECONDS = "topic_stats_interval_seconds"
+	TOPIC_STATS_MAX_TOPICS = "topic_stats_max_topics"
+
 	TEST_SUBSCRIPTION_BASE = "test_subscription_base"  # Test only
 
 
@@ -37,6 +59,59 @@ SKIP_SUBSCRIPTION_JSONSCHEMA = {
 	},
 }
 
+RATE_LIMITS_JSONSCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {
+			RateLimitConfKey.TOPIC: {
+				"type": "string",
+				"minLength": 1,
+				"description": "MQTT topic filter, every matching topic is limited separately",
+			},
+			RateLimitConfKey.RATE: {
+				"type": "number",
+				"exclusiveMinimum": 0,
+				"description": "Messages per second and topic",
+			},
+			RateLimitConfKey.BURST: {
+				"type": "number",
+				"minimum": 1,
+				"description": "Messages per topic which may exceed the rate at once (default: rate)",
+			},
+			RateLimitConfKey.MODE: {
+				"type": "string",
+				"enum": RateLimitMode.ALL,
+				"description": "'drop' excess messages or store only the 'latest' per interval",
+			},
+		},
+		"additionalProperties": False,
+		"required": [RateLimitConfKey.TOPIC, RateLimitConfKey.RATE],
+	},
+}
+
+DEDUP_JSONSCHEMA = {
+	"type": "object",
+	"properties": {
+		DedupConfKey.WINDOW_SECONDS: {
+			"type": "number",
+			"exclusiveMinimum": 0,
+			"description": "Duplicates are detected within this time (default: 60)",
+		},
+		DedupConfKey.CAPACITY: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Expected messages per window, sizes the filter (default: 1000000)",
+		},
+		DedupConfKey.TOPICS: {
+			"type": "array",
+			"items": {"type": "string", "minLength": 1},
+			"description": "Topic filters to deduplicate (default: all)",
+		},
+	},
+	"additionalProperties": False,
+}
+
 MQTT_JSONSCHEMA = {
 	"type": "object",
 	"properties": {
@@ -53,6 +128,47 @@ MQTT_JSONSCHEMA = {
 		MqttConfKey.PASSWORD: {"type": "string"},
 		MqttConfKey.SUBSCRIPTIONS: SUBSCRIPTION_JSONSCHEMA,
 		MqttConfKey.SKIP_SUBSCRIPTION_REGEXES: SKIP_SUBSCRIPTION_JSONSCHEMA,
+		MqttConfKey.RATE_LIMITS: RATE_LIMITS_JSONSCHEMA,
+		MqttConfKey.RATE_LIMIT_MAX_TOPICS: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Max. number of topics whose rate limit state is kept (LRU)",
+		},
+		MqttConfKey.PUBLISH_TIME_PROPERTY: {
+			"type": "string",
+			"minLength": 1,
+			"description": "MQTT v5 user property carrying the publisher timestamp (unix time or ISO 8601)",
+		},
+		MqttConfKey.ACK_AFTER_COMMIT: {
+			"type": "boolean",
+			"description": "Acknowledge QoS 1 messages after they were committed (needs 'client_id')",
+		},
+		MqttConfKey.MAX_UNACKED_MESSAGES: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Max. unacknowledged messages (ack_after_commit), receiving waits for commits",
+		},
+		MqttConfKey.DEDUP: DEDUP_JSONSCHEMA,
+		MqttConfKey.NAME: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Name of the broker (logs, 'broker_column'), default: <host>:<port>",
+		},
+		MqttConfKey.RECONNECT_MAX_SECONDS: {
+			"type": "number",
+			"minimum": 1,
+			"description": "Max delay between reconnect attempts, doubled from 1s (default: 60)",
+		},
+		MqttConfKey.TOPIC_STATS_INTERVAL_SECONDS: {
+			"type": "number",
+			"minimum": 0,
+			"description": "Store per topic message counts periodically. 0: disabled",
+		},
+		MqttConfKey.TOPIC_STATS_MAX_TOPICS: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Max. topics counted per period, the rest is summed up as '#'",
+		},
 		MqttConfKey.TEST_SUBSCRIPTION_BASE: {
 			"type": "string",
 			"minLength": 1,
@@ -64,6 +180,205 @@ MQTT_JSONSCHEMA = {
 	"required": [MqttConfKey.HOST, MqttConfKey.PORT, MqttConfKey.SUBSCRIPTIONS],
 }
 
+EXTRACT_VALUES_JSONSCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {
+			ExtractConfKey.TOPIC: {
+				"type": "string",
+				"minLength": 1,
+				"description": "MQTT topic filter (wildcards '+' and '#' allowed), the first matching rule is used",
+			},
+			ExtractConfKey.POINTER: {
+				"type": "string",
+				"pattern": "^/",
+				"description": "JSON pointer to the numeric value. Without a pointer the payload is parsed as plain number.",
+			},
+			ExtractConfKey.UNIT: {
+				"type": "string",
+				"minLength": 1,
+				"description": "Fixed unit stored along with extracted values",
+			},
+			ExtractConfKey.UNIT_POINTER: {
+				"type": "string",
+				"pattern": "^/",
+				"description": "JSON pointer to the unit (overrides a fixed unit if found)",
+			},
+		},
+		"additionalProperties": False,
+		"required": [ExtractConfKey.TOPIC],
+	},
+}
+
+JOBS_JSONSCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {
+			JobConfKey.TOPIC: {
+				"type": "string",
+				"minLength": 1,
+				"description": "MQTT topic filter (wildcards '+' and '#' allowed), the first matching rule is used",
+			},
+			JobConfKey.ENTRYPOINT: {
+				"type": "string",
+				"minLength": 1,
+				"description": "pgqueuer entrypoint processing the job",
+			},
+			JobConfKey.PRIORITY: {
+				"type": "integer",
+				"description": "Job priority, higher values first (default: 0)",
+			},
+		},
+		"additionalProperties": False,
+		"required": [JobConfKey.TOPIC, JobConfKey.ENTRYPOINT],
+	},
+}
+
+PAYLOAD_STORE_JSONSCHEMA = {
+	"type": "object",
+	"properties": {
+		PayloadStoreConfKey.MIN_SIZE: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Min. characters of payloads stored once by hash (default: 1024)",
+		},
+		PayloadStoreConfKey.TABLE: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Table of the payloads (default: journal_payloads)",
+		},
+		PayloadStoreConfKey.CACHE_SIZE: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Hashes of stored payloads kept in memory (default: 10000)",
+		},
+	},
+	"additionalProperties": False,
+}
+
+MAINTENANCE_JSONSCHEMA = {
+	"type": "object",
+	"properties": {
+		MaintenanceConfKey.JOBS: {
+			"type": "array",
+			"items": {
+				"type": "object",
+				"properties": {
+					MaintenanceJobConfKey.JOB: {
+						"type": "string",
+						"enum": MaintenanceJobKind.ALL,
+						"description": "clean_up: archive or delete expired messages, vacuum",
+					},
+					MaintenanceJobConfKey.INTERVAL_MINUTES: {
+						"type": "number",
+						"exclusiveMinimum": 0,
+						"description": "Minutes between runs (of all instances), default: 1440",
+					},
+					MaintenanceJobConfKey.WINDOW: {
+						"type": "string",
+						"pattern": "^\\s*\\d{2}:\\d{2}\\s*-\\s*\\d{2}:\\d{2}\\s*$",
+						"description": "Local time window 'HH:MM-HH:MM', default: always",
+					},
+					MaintenanceJobConfKey.MAX_SECONDS: {
+						"type": "number",
+						"exclusiveMinimum": 0,
+						"description": "Runtime limit, the job is cancelled afterwards",
+					},
+				},
+				"additionalProperties": False,
+				"required": [MaintenanceJobConfKey.JOB],
+			},
+		},
+		MaintenanceConfKey.TABLE: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Table of the last runs (default: journal_maintenance)",
+		},
+		MaintenanceConfKey.MAX_QUEUED_MESSAGES: {
+			"type": "integer",
+			"minimum": 0,
+			"description": "Jobs are postponed while more messages are queued (default: 10000)",
+		},
+	},
+	"additionalProperties": False,
+}
+
+BATCH_SIZE_JSONSCHEMA = {
+	"type": "integer",
+	"minimum": 1,
+	"description": "Database batch size: message are queued until batch size is reached",
+}
+
+WAIT_MAX_SECONDS_JSONSCHEMA = {
+	"type": "number",
+	"minimum": 0,
+	"description": "Wait (seconds) Queued messages are stored into database even the batch size is not reached.",
+}
+
+WRITER_CONCURRENCY_JSONSCHEMA = {
+	"type": "integer",
+	"minimum": 1,
+	"description": "Number of batches stored in parallel (each one needs a pool connection)",
+}
+
+ADAPTIVE_JSONSCHEMA_PROPERTIES = {
+	AdaptiveConfKey.ADAPTIVE: {
+		"type": "boolean",
+		"description": "Tune batch size and wait time continuously from arrival rate and COPY duration",
+	},
+	AdaptiveConfKey.BATCH_SIZE_MIN: {
+		"type": "integer",
+		"minimum": 1,
+		"description": "Adaptive mode: lower bound of the batch size",
+	},
+	AdaptiveConfKey.BATCH_SIZE_MAX: {
+		"type": "integer",
+		"minimum": 1,
+		"description": "Adaptive mode: upper bound of the batch size",
+	},
+	AdaptiveConfKey.WAIT_MIN_SECONDS: {
+		"type": "number",
+		"minimum": 0,
+		"description": "Adaptive mode: lower bound of the wait time (upper bound: wait_max_seconds)",
+	},
+	AdaptiveConfKey.TARGET_LATENCY_SECONDS: {
+		"type": "number",
+		"exclusiveMinimum": 0,
+		"description": "Adaptive mode: targeted time from receiving a message to storing it",
+	},
+}
+
+MAX_QUEUE_SIZE_JSONSCHEMA = {
+	"type": "integer",
+	"minimum": 0,
+	"description": "Max. queued messages, the rest is spilled (spill_dir) or dropped. 0: unbounded",
+}
+
+LANES_JSONSCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {
+			LaneConfKey.NAME: {"type": "string", "minLength": 1},
+			LaneConfKey.TOPICS: {
+				"type": "array",
+				"items": {"type": "string", "minLength": 1},
+				"minItems": 1,
+				"description": "MQTT topic filters routed into this lane (the first matching lane wins)",
+			},
+			DatabaseConfKey.BATCH_SIZE: BATCH_SIZE_JSONSCHEMA,
+			DatabaseConfKey.WAIT_MAX_SECONDS: WAIT_MAX_SECONDS_JSONSCHEMA,
+			DatabaseConfKey.WRITER_CONCURRENCY: WRITER_CONCURRENCY_JSONSCHEMA,
+			DatabaseConfKey.MAX_QUEUE_SIZE: MAX_QUEUE_SIZE_JSONSCHEMA,
+			**ADAPTIVE_JSONSCHEMA_PROPERTIES,
+		},
+		"additionalProperties": False,
+		"required": [LaneConfKey.NAME, LaneConfKey.TOPICS],
+	},
+}
+
 DATABASE_JSONSCHEMA = {
 	"type": "object",
 	"properties": {
@@ -102,20 +417,123 @@ DATABASE_JSONSCHEMA = {
 			"minLength": 1,
 			"description": "Predefined session timezone",
 		},
-		DatabaseConfKey.BATCH_SIZE: {
+		DatabaseConfKey.SYNCHRONOUS_COMMIT: {
+			"type": "string",
+			"enum": ["on", "off", "local", "remote_write", "remote_apply"],
+			"description": "Session setting; 'off' speeds up commits (risk: last commits lost on crash)",
+		},
+		DatabaseConfKey.APPLICATION_NAME: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Session setting, shown in pg_stat_activity (default: mqtt-pg-logger)",
+		},
+		DatabaseConfKey.POOL_MIN_SIZE: {"type": "integer", "minimum": 0},
+		DatabaseConfKey.POOL_MAX_SIZE: {"type": "integer", "minimum": 1},
+		DatabaseConfKey.POOL_MAX_QUERIES: {
 			"type": "integer",
 			"minimum": 1,
-			"description": "Database batch size: message are queued until batch size is reached",
+			"description": "Pool connections are replaced after this number of queries",
 		},
-		DatabaseConfKey.WAIT_MAX_SECONDS: {
+		DatabaseConfKey.MAX_INACTIVE_CONNECTION_LIFETIME: {
+			"type": "number",
+			"minimum": 0,
+			"description": "Idle pool connections are closed after (seconds). 0: never",
+		},
+		DatabaseConfKey.STATEMENT_CACHE_SIZE: {
 			"type": "integer",
 			"minimum": 0,
-			"description": "Wait (seconds) Queued messages are stored into database even the batch size is not reached.",
+			"description": "Prepared statements cached per connection. 0: disabled (e.g. pgbouncer)",
+		},
+		DatabaseConfKey.COMMAND_TIMEOUT: {
+			"type": "number",
+			"exclusiveMinimum": 0,
+			"description": "Queries (COPY) exceeding this time (seconds) fail and get retried",
 		},
+		DatabaseConfKey.BATCH_SIZE: BATCH_SIZE_JSONSCHEMA,
+		DatabaseConfKey.WAIT_MAX_SECONDS: WAIT_MAX_SECONDS_JSONSCHEMA,
+		DatabaseConfKey.WRITER_CONCURRENCY: WRITER_CONCURRENCY_JSONSCHEMA,
+		DatabaseConfKey.LANES: LANES_JSONSCHEMA,
+		**ADAPTIVE_JSONSCHEMA_PROPERTIES,
 		DatabaseConfKey.CLEAN_UP_AFTER_DAYS: {
 			"type": "integer",
 			"description": "Delete entries older than <n> days. Deactivate clean up with values values <= 0.",
 		},
+		DatabaseConfKey.EXTRACT_VALUES: EXTRACT_VALUES_JSONSCHEMA,
+		DatabaseConfKey.BROKER_COLUMN: {
+			"type": "boolean",
+			"description": "Store the broker name of every message (column 'broker'), see mqtt 'name'",
+		},
+		DatabaseConfKey.TOPIC_LEVELS: {
+			"type": "boolean",
+			"description": "Store the topic levels (column 'topic_levels', GIN index) for wildcard queries (--query)",
+		},
+		DatabaseConfKey.ARCHIVE_DIR: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Expired messages are moved into compressed files in this directory (instead of being deleted).",
+		},
+		DatabaseConfKey.ARCHIVE_FORMAT: {
+			"type": "string",
+			"enum": ArchiveFormat.ALL,
+			"description": "Archive file format ('parquet' requires the package 'pyarrow')",
+		},
+		DatabaseConfKey.ARCHIVE_TOPIC_LEVELS: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Number of topic levels used as prefix to partition the archive files",
+		},
+		DatabaseConfKey.ARCHIVE_CHUNK_SIZE: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Rows fetched per chunk from the server side cursor",
+		},
+		DatabaseConfKey.ARCHIVE_INTERVAL_MINUTES: {
+			"type": "integer",
+			"minimum": 0,
+			"description": (
+				"Archive expired messages periodically while the service is running "
+				"(on one instance, like the maintenance job 'clean_up'). Deactivate with 0."
+			),
+		},
+		DatabaseConfKey.NAME: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Name of the database target (logs), default: <host>/<database>",
+		},
+		DatabaseConfKey.MAX_QUEUE_SIZE: MAX_QUEUE_SIZE_JSONSCHEMA,
+		DatabaseConfKey.SPILL_DIR: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Directory for queue overflow (beyond max_queue_size), one per database target",
+		},
+		DatabaseConfKey.LATENCY_STATS_INTERVAL_SECONDS: {
+			"type": "number",
+			"minimum": 0,
+			"description": "Store latency summaries (receive/publish to commit) periodically. 0: disabled",
+		},
+		DatabaseConfKey.LATENCY_STATS_TABLE: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Table of the latency summaries (default: journal_latency)",
+		},
+		DatabaseConfKey.TOPIC_STATS_TABLE: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Table of the per topic stats (default: journal_topic_stats)",
+		},
+		DatabaseConfKey.JOBS: JOBS_JSONSCHEMA,
+		DatabaseConfKey.PAYLOAD_STORE: PAYLOAD_STORE_JSONSCHEMA,
+		DatabaseConfKey.MAINTENANCE: MAINTENANCE_JSONSCHEMA,
+		DatabaseConfKey.JOBS_TABLE: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Job queue table (default: pgqueuer)",
+		},
+		DatabaseConfKey.JOBS_CHANNEL: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Channel notified once per batch with enqueued jobs (default: ch_pgqueuer)",
+		},
 	},
 	"additionalProperties": False,
 	"required": [DatabaseConfKey.HOST, DatabaseConfKey.PORT, DatabaseConfKey.DATABASE],
@@ -148,12 +566,84 @@ LOGGING_JSONSCHEMA = {
 	},
 }
 
+LIVE_TAIL_JSONSCHEMA = {
+	"type": "object",
+	"properties": {
+		LiveTailConfKey.HOST: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Listen address of the websocket server (default: 127.0.0.1), no authentication!",
+		},
+		LiveTailConfKey.PORT: {"type": "integer", "minimum": 1, "description": "default: 8080"},
+		LiveTailConfKey.PATH: {
+			"type": "string",
+			"pattern": "^/",
+			"description": "Websocket path (default: /tail)",
+		},
+		LiveTailConfKey.MAX_BUFFER: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Messages buffered per client, a slow client loses the oldest ones (default: 1000)",
+		},
+	},
+	"additionalProperties": False,
+}
+
+CURRENT_VALUES_JSONSCHEMA = {
+	"type": "object",
+	"properties": {
+		CurrentValuesConfKey.HOST: {
+			"type": "string",
+			"minLength": 1,
+			"description": "Listen address (default: 127.0.0.1), no authentication!",
+		},
+		CurrentValuesConfKey.PORT: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "HTTP port (default: 8081)",
+		},
+		CurrentValuesConfKey.PATH: {
+			"type": "string",
+			"pattern": "^/",
+			"description": "HTTP path (default: /values)",
+		},
+		CurrentValuesConfKey.MAX_TOPICS: {
+			"type": "integer",
+			"minimum": 1,
+			"description": "Topics kept, the least recently updated are evicted (default: 10000)",
+		},
+	},
+	"additionalProperties": False,
+}
+
 CONFIG_JSONSCHEMA = {
 	"type": "object",
 	"properties": {
-		"database": DATABASE_JSONSCHEMA,
+		"database": {
+			"oneOf": [
+				DATABASE_JSONSCHEMA,
+				{
+					"type": "array",
+					"items": DATABASE_JSONSCHEMA,
+					"minItems": 1,
+					"description": "Multiple database targets, every message is stored in each",
+				},
+			],
+		},
 		"logging": LOGGING_JSONSCHEMA,
-		"mqtt": MQTT_JSONSCHEMA,
+		"mqtt": {
+			"oneOf": [
+				MQTT_JSONSCHEMA,
+				{
+					"type": "array",
+					"items": MQTT_JSONSCHEMA,
+					"minItems": 1,
+					"description": "Multiple brokers, all feeding the same database targets",
+				},
+			],
+		},
+		"live_tail": LIVE_TAIL_JSONSCHEMA,
+		"current_values": CURRENT_VALUES_JSONSCHEMA,
 	},
 	"additionalProperties": False,
 	"required": ["database", "mqtt"],
@@ -0,0 +1,121 @@
+import asyncio
+import collections
+import json
+import logging
+
+from quart import Quart, Response, request
+
+from src.message_record import TOPIC, MessageRecord, to_dict
+from src.topic_filter import TopicFilter
+
+_logger = logging.getLogger(__name__)
+
+
+class CurrentValuesConfKey:
+	HOST = "host"
+	PORT = "port"
+	PATH = "path"
+	MAX_TOPICS = "max_topics"
+
+
+class CurrentValues:
+	"""
+	The last received message per topic, answered over HTTP without any database query.
+
+	Every update gets a new version (a counter). `GET <path>?filter=<topic filter>` returns the
+	matching topics (`filter` may be repeated, default: "#") with their versions and the current
+	version, `since=<version>` returns only the topics updated afterwards. The response carries an
+	ETag, polling with `If-None-Match` is answered by "304 Not Modified" while nothing changed.
+
+	At most `max_topics` topics are kept, the least recently updated ones are evicted. The server
+	has no authentication, bind it to a trusted interface (default: localhost).
+	"""
+
+	DEFAULT_HOST = "127.0.0.1"
+	DEFAULT_PORT = 8081
+	DEFAULT_PATH = "/values"
+	DEFAULT_MAX_TOPICS = 10000
+
+	def __init__(self, config: dict | None):
+		self._enabled = config is not None
+		config = config or {}
+		self._host: str = config.get(CurrentValuesConfKey.HOST, self.DEFAULT_HOST)
+		self._port: int = config.get(CurrentValuesConfKey.PORT, self.DEFAULT_PORT)
+		self._path: str = config.get(CurrentValuesConfKey.PATH, self.DEFAULT_PATH)
+		self._max_topics: int = config.get(CurrentValuesConfKey.MAX_TOPICS, self.DEFAULT_MAX_TOPICS)
+		# topic: (version, record), least recently updated first
+		self._values: collections.OrderedDict[str, tuple[int, MessageRecord]] = (
+			collections.OrderedDict()
+		)
+		self._version = 0
+
+	def __bool__(self) -> bool:
+		return self._enabled
+
+	def __len__(self) -> int:
+		return len(self._values)
+
+	@property
+	def version(self) -> int:
+		return self._version
+
+	def update(self, record: MessageRecord) -> None:
+		"""Called per received message: O(1)"""
+		self._version += 1
+		values = self._values
+		topic = record[TOPIC]
+		if topic in values:
+			values.move_to_end(topic)
+		elif len(values) >= self._max_topics:
+			values.popitem(last=False)
+		values[topic] = (self._version, record)
+
+	def lookup(self, topic_filters: list[str], since: int = 0) -> list[tuple[int, MessageRecord]]:
+		"""Raises `ValueError` for invalid topic filters."""
+		filters = [TopicFilter(topic_filter) for topic_filter in topic_filters]
+		values = self._values
+		if not any(topic_filter.has_wildcards for topic_filter in filters):
+			entries = [values.get(topic_filter.filter) for topic_filter in filters]
+			found = [entry for entry in entries if entry is not None]
+		else:
+			found = [
+				entry
+				for topic, entry in values.items()
+				if any(topic_filter.matches(topic) for topic_filter in filters)
+			]
+		return [entry for entry in found if entry[0] > since]
+
+	@staticmethod
+	def get_etag(entries: list[tuple[int, MessageRecord]]) -> str:
+		"""Changes with every update (max. version) and eviction (count) of the matching topics."""
+		return f'"{max((entry[0] for entry in entries), default=0)}-{len(entries)}"'
+
+	def create_app(self) -> Quart:
+		app = Quart(__name__)
+		app.route(self._path, methods=["GET"])(self._serve)
+		return app
+
+	async def run(self) -> None:
+		_logger.info("current values on http://%s:%d%s", self._host, self._port, self._path)
+		# stopped by cancellation only, so the server doesn't install signal handlers
+		stopped = asyncio.Event()
+		await self.create_app().run_task(self._host, self._port, shutdown_trigger=stopped.wait)
+
+	async def _serve(self) -> Response:
+		topic_filters = request.args.getlist("filter") or ["#"]
+		try:
+			since = int(request.args.get("since", 0))
+			entries = self.lookup(topic_filters, since)
+		except ValueError as ex:
+			return Response(json.dumps({"error": str(ex)}), 400, mimetype="application/json")
+
+		etag = self.get_etag(entries)
+		headers = {"ETag": etag, "Cache-Control": "no-cache"}
+		if etag in request.headers.get("If-None-Match", ""):
+			return Response("", 304, headers=headers)
+
+		body = {
+			"version": self._version,
+			"values": [{**to_dict(record), "version": version} for version, record in entries],
+		}
+		return Response(json.dumps(body), 200, headers=headers, mimetype="application/json")
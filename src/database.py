@@ -19,12 +19,56 @@ class DatabaseConfKey:
 
 	BATCH_SIZE = "batch_size"
 	WAIT_MAX_SECONDS = "wait_max_seconds"
+	WRITER_CONCURRENCY = "writer_concurrency"
+	LANES = "lanes"
 	CLEAN_UP_AFTER_DAYS = "clean_up_after_days"
+	EXTRACT_VALUES = "extract_values"
+	TOPIC_LEVELS = "topic_levels"
+	BROKER_COLUMN = "broker_column"
+
+	ARCHIVE_DIR = "archive_dir"
+	ARCHIVE_FORMAT = "archive_format"
+	ARCHIVE_TOPIC_LEVELS = "archive_topic_levels"
+	ARCHIVE_CHUNK_SIZE = "archive_chunk_size"
+	ARCHIVE_INTERVAL_MINUTES = "archive_interval_minutes"
+
+	POOL_MIN_SIZE = "pool_min_size"
+	POOL_MAX_SIZE = "pool_max_size"
+	POOL_MAX_QUERIES = "pool_max_queries"
+	MAX_INACTIVE_CONNECTION_LIFETIME = "max_inactive_connection_lifetime"
+	STATEMENT_CACHE_SIZE = "statement_cache_size"
+	COMMAND_TIMEOUT = "command_timeout"
+	SYNCHRONOUS_COMMIT = "synchronous_commit"
+	APPLICATION_NAME = "application_name"
+
+	NAME = "name"
+	MAX_QUEUE_SIZE = "max_queue_size"
+	SPILL_DIR = "spill_dir"
+
+	LATENCY_STATS_INTERVAL_SECONDS = "latency_stats_interval_seconds"
+	LATENCY_STATS_TABLE = "latency_stats_table"
+	TOPIC_STATS_TABLE = "topic_stats_table"
+
+	JOBS = "jobs"
+	JOBS_TABLE = "jobs_table"
+	JOBS_CHANNEL = "jobs_channel"
+
+	PAYLOAD_STORE = "payload_store"
+	MAINTENANCE = "maintenance"
+
+	CONNECTION_KEYS = (HOST, USER, PORT, PASSWORD, DATABASE)
 
 
 class Database(abc.ABC):
 	DEFAULT_TABLE_NAME = "journal"
 
+	DEFAULT_POOL_MIN_SIZE = 1
+	DEFAULT_POOL_MAX_SIZE = 10
+	DEFAULT_POOL_MAX_QUERIES = 50000  # connections are replaced after this number of queries
+	DEFAULT_MAX_INACTIVE_CONNECTION_LIFETIME = 300.0  # idle connections are closed after (seconds)
+	DEFAULT_STATEMENT_CACHE_SIZE = 100
+	DEFAULT_APPLICATION_NAME = "mqtt-pg-logger"
+
 	def __init__(self, config: dict) -> None:
 		self._config = config
 		self._last_connect_time: datetime.datetime | None = None
@@ -33,31 +77,100 @@ class Database(abc.ABC):
 			DatabaseConfKey.TABLE_NAME, self.DEFAULT_TABLE_NAME
 		)  # define by SQL scripts
 		self._timezone: str | None = config.get(DatabaseConfKey.TIMEZONE)
+		self._name: str = config.get(DatabaseConfKey.NAME) or (
+			f"{config.get(DatabaseConfKey.HOST)}/{config.get(DatabaseConfKey.DATABASE)}"
+		)
 
-	@staticmethod
-	def get_default_time_zone() -> str:
-		return str(get_localzone())
+	_local_zone: datetime.tzinfo | None = None
 
-	@staticmethod
-	def _now() -> datetime.datetime:
+	@classmethod
+	def get_local_zone(cls) -> datetime.tzinfo:
+		"""resolved once, `get_localzone` is too expensive to be called per message"""
+		if Database._local_zone is None:
+			Database._local_zone = get_localzone()
+		return Database._local_zone
+
+	@classmethod
+	def get_default_time_zone(cls) -> str:
+		return str(cls.get_local_zone())
+
+	@classmethod
+	def _now(cls) -> datetime.datetime:
 		"""overwritable `datetime.now` for testing"""
-		return datetime.datetime.now(tz=get_localzone())
+		return datetime.datetime.now(tz=cls.get_local_zone())
+
+	@staticmethod
+	def _now_utc() -> datetime.datetime:
+		"""overwritable `datetime.now` for testing, cheaper than `_now` (used per message)"""
+		return datetime.datetime.now(tz=datetime.UTC)
+
+	@property
+	def name(self) -> str:
+		return self._name
+
+	@property
+	def table_name(self) -> str:
+		return self._table_name
+
+	@property
+	def pool(self) -> asyncpg.Pool | None:
+		return self._pool
+
+	def _get_connection_config(self) -> dict:
+		"""Only the connection related settings are passed to asyncpg, the rest configures the app."""
+		return {
+			key: value for key, value in self._config.items() if key in DatabaseConfKey.CONNECTION_KEYS
+		}
+
+	def _get_pool_config(self) -> dict:
+		config = self._config
+		return {
+			"min_size": config.get(DatabaseConfKey.POOL_MIN_SIZE, self.DEFAULT_POOL_MIN_SIZE),
+			"max_size": config.get(DatabaseConfKey.POOL_MAX_SIZE, self.DEFAULT_POOL_MAX_SIZE),
+			"max_queries": config.get(DatabaseConfKey.POOL_MAX_QUERIES, self.DEFAULT_POOL_MAX_QUERIES),
+			"max_inactive_connection_lifetime": config.get(
+				DatabaseConfKey.MAX_INACTIVE_CONNECTION_LIFETIME,
+				self.DEFAULT_MAX_INACTIVE_CONNECTION_LIFETIME,
+			),
+			"statement_cache_size": config.get(
+				DatabaseConfKey.STATEMENT_CACHE_SIZE, self.DEFAULT_STATEMENT_CACHE_SIZE
+			),
+			"command_timeout": config.get(DatabaseConfKey.COMMAND_TIMEOUT),
+		}
+
+	def get_session_settings(self) -> dict[str, str]:
+		settings = {
+			"timezone": self._timezone or self.get_default_time_zone(),
+			"application_name": self._config.get(
+				DatabaseConfKey.APPLICATION_NAME, self.DEFAULT_APPLICATION_NAME
+			),
+		}
+		synchronous_commit = self._config.get(DatabaseConfKey.SYNCHRONOUS_COMMIT)
+		if synchronous_commit:
+			settings["synchronous_commit"] = synchronous_commit
+		return settings
 
 	async def connect(self) -> None:
-		self._pool = await asyncpg.create_pool(**self._config)
-		await self.set_timezone()
-
-	async def set_timezone(self) -> None:
-		async with self._pool.acquire() as connection:
-			time_zone = self._timezone or self.get_default_time_zone()
-			query = f"set timezone='{time_zone}'"
-			try:
-				await connection.execute(query)
-			except Exception:
-				_logger.error(f"setting timezone failed ({query})!")
-				raise
-
-			self._last_connect_time = self._now()
+		self._pool = await asyncpg.create_pool(
+			**self._get_connection_config(), **self._get_pool_config(), init=self._init_connection
+		)
+		self._last_connect_time = self._now()
+
+	async def _init_connection(self, connection: asyncpg.Connection) -> None:
+		"""Applies the session settings to every new pool connection (also replaced ones)."""
+		settings = self.get_session_settings()
+		calls = [f"set_config(${i * 2 + 1}, ${i * 2 + 2}, false)" for i in range(len(settings))]
+		args = [item for setting in settings.items() for item in setting]
+		try:
+			await connection.execute("SELECT " + ", ".join(calls), *args)
+		except Exception:
+			_logger.error("applying the session settings failed (%s)!", settings)
+			raise
+
+	async def expire_connections(self) -> None:
+		"""Replaces all pool connections (at next use), e.g. after the server restarted."""
+		if self._pool:
+			await self._pool.expire_connections()
 
 	async def close(self) -> None:
 		try:
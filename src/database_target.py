@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from collections.abc import Callable
+
+from src.archiver import Archiver
+from src.database import Database, DatabaseConfKey
+from src.maintenance import MaintenanceScheduler
+from src.message_record import MessageRecord
+from src.payload_store import PayloadStore
+from src.topic_stats import TopicStats
+from src.writer_pipeline import WriterPipeline
+
+_logger = logging.getLogger(__name__)
+
+
+class DatabaseTarget:
+	"""
+	One configured database: its own pool, writer lanes (queues, spill buffers), archiver and
+	maintenance jobs.
+	"""
+
+	DEFAULT_TOPIC_STATS_TABLE = "journal_topic_stats"
+	CONNECT_RETRY_MIN_SECONDS = 1
+	CONNECT_RETRY_MAX_SECONDS = 60
+
+	def __init__(self, config: dict):
+		self._database = Database(config)
+		self._writer = WriterPipeline(self._database, config)
+		self._archiver = Archiver(self._database, config)
+		self._topic_stats_table: str = config.get(
+			DatabaseConfKey.TOPIC_STATS_TABLE, self.DEFAULT_TOPIC_STATS_TABLE
+		)
+		self._maintenance = MaintenanceScheduler(
+			self._database,
+			self._archiver,
+			config.get(DatabaseConfKey.MAINTENANCE),
+			PayloadStore(config.get(DatabaseConfKey.PAYLOAD_STORE)),
+			self.get_queued_count,
+		)
+
+	@property
+	def name(self) -> str:
+		return self._database.name
+
+	@property
+	def database(self) -> Database:
+		return self._database
+
+	@property
+	def writer(self) -> WriterPipeline:
+		return self._writer
+
+	@property
+	def archiver(self) -> Archiver:
+		return self._archiver
+
+	@property
+	def maintenance(self) -> MaintenanceScheduler:
+		return self._maintenance
+
+	def get_queued_count(self) -> int:
+		return sum(writer.queue_size for writer in self._writer.writers)
+
+	@property
+	def connected(self) -> bool:
+		return self._database.pool is not None
+
+	async def connect(self) -> None:
+		await self._database.connect()
+
+	async def connect_with_retry(self) -> None:
+		"""Retries with growing delays, the writers queue (or spill) the records meanwhile."""
+		delay = self.CONNECT_RETRY_MIN_SECONDS
+		while True:
+			try:
+				await self.connect()
+				_logger.info("connected database target %s", self.name)
+				return
+			except Exception as ex:
+				_logger.warning("%s: connecting failed, retry in %ds (%s)", self.name, delay, ex)
+			await asyncio.sleep(delay)
+			delay = min(delay * 2, self.CONNECT_RETRY_MAX_SECONDS)
+
+	async def close(self) -> None:
+		await self._database.close()
+
+	async def store_topic_stats(self, rows: list[tuple]) -> None:
+		async with self._database.pool.acquire() as connection:
+			await connection.copy_records_to_table(
+				self._topic_stats_table, records=rows, columns=TopicStats.COLUMNS
+			)
+
+	async def run(self) -> None:
+		if not self.connected:
+			await self.connect_with_retry()
+		async with asyncio.TaskGroup() as tg:
+			tg.create_task(self._writer.run())
+			if self._maintenance:  # the periodic archiving too
+				tg.create_task(self._maintenance.run())
+
+
+class DatabaseTargets:
+	"""
+	Fans received messages out to all configured databases.
+
+	Every target queues the records on its own, so a slow or failing target doesn't delay the
+	others (see `BatchWriter` for the failure handling). A target which is unreachable at startup
+	connects in the background (`DatabaseTarget.run`) while the others start right away.
+	"""
+
+	def __init__(self, configs: list[dict]):
+		self._targets = [DatabaseTarget(config) for config in configs]
+
+		names = [target.name for target in self._targets]
+		if len(set(names)) != len(names):
+			raise ValueError(f"database targets need unique '{DatabaseConfKey.NAME}'s ({names})!")
+		spill_dirs = [
+			config[DatabaseConfKey.SPILL_DIR] for config in configs if config.get(DatabaseConfKey.SPILL_DIR)
+		]
+		if len(set(spill_dirs)) != len(spill_dirs):
+			raise ValueError(f"database targets need separate '{DatabaseConfKey.SPILL_DIR}'s!")
+
+		self._writers = [target.writer for target in self._targets]
+
+	def __iter__(self):
+		return iter(self._targets)
+
+	def __len__(self) -> int:
+		return len(self._targets)
+
+	def set_on_done(self, callback: Callable[[list[MessageRecord], bool], None] | None) -> None:
+		for writer in self._writers:
+			writer.set_on_done(callback)
+
+	def put(self, record: MessageRecord) -> None:
+		for writer in self._writers:
+			writer.put(record)
+
+	async def connect(self) -> None:
+		"""Fails only if no target is reachable (e.g. a misconfiguration), others get retried."""
+		errors = []
+		for target in self._targets:
+			try:
+				await target.connect()
+				_logger.info("connected database target %s", target.name)
+			except Exception as ex:
+				errors.append(ex)
+				_logger.error("%s: connecting failed (%s)", target.name, ex)
+		if len(errors) == len(self._targets):
+			raise errors[0]
+		if errors:
+			_logger.warning("%d database target(s) get connected in the background", len(errors))
+
+	async def close(self) -> None:
+		for target in self._targets:
+			await target.close()
+
+	async def run(self) -> None:
+		async with asyncio.TaskGroup() as tg:
+			for target in self._targets:
+				tg.create_task(target.run())
+
+	async def store_topic_stats(self, rows: list[tuple]) -> None:
+		"""Stores the rows into every target, a failing target doesn't affect the others."""
+		if not rows:
+			return
+		for target in self._targets:
+			try:
+				await target.store_topic_stats(rows)
+			except Exception as ex:
+				_logger.error("%s: storing %d topic stats failed (%s)", target.name, len(rows), ex)
@@ -0,0 +1,191 @@
+import array
+import datetime
+import hashlib
+import logging
+import random
+import time
+
+from src.topic_filter import TopicRouter
+
+_logger = logging.getLogger(__name__)
+
+
+class DedupConfKey:
+	WINDOW_SECONDS = "window_seconds"
+	CAPACITY = "capacity"
+	TOPICS = "topics"
+
+
+class CuckooFilter:
+	"""
+	Cuckoo filter for 16 byte digests: 32 bit fingerprints, buckets of 4 slots (0: empty) in a flat
+	array, a lookup checks two buckets. False positive rate: ~2e-9 (8 slots / 2^32).
+	"""
+
+	BUCKET_SIZE = 4
+	LOAD_FACTOR = 0.95
+	MAX_KICKS = 500
+	FINGERPRINT_HASH = 0x5BD1E995
+
+	def __init__(self, capacity: int):
+		bucket_count = 1
+		while bucket_count * self.BUCKET_SIZE * self.LOAD_FACTOR < capacity:
+			bucket_count *= 2  # power of two, the alternate bucket is computed by xor
+		self._mask = bucket_count - 1
+		self._slots = array.array("I", bytes(4 * bucket_count * self.BUCKET_SIZE))
+		self._count = 0
+		self._random = random.Random(0)
+
+	def __len__(self) -> int:
+		return self._count
+
+	@property
+	def size_bytes(self) -> int:
+		return self._slots.itemsize * len(self._slots)
+
+	def locate(self, digest: bytes) -> tuple[int, int, int]:
+		"""Returns fingerprint and both bucket indexes of a digest."""
+		fingerprint = int.from_bytes(digest[:4], "little") or 1
+		index = int.from_bytes(digest[4:12], "little") & self._mask
+		return fingerprint, index, self._alternate(index, fingerprint)
+
+	def _alternate(self, index: int, fingerprint: int) -> int:
+		return (index ^ (fingerprint * self.FINGERPRINT_HASH)) & self._mask
+
+	def __contains__(self, digest: bytes) -> bool:
+		return self.contains(self.locate(digest))
+
+	def contains(self, location: tuple[int, int, int]) -> bool:
+		fingerprint, index1, index2 = location
+		slots, size = self._slots, self.BUCKET_SIZE
+		start1, start2 = index1 * size, index2 * size
+		end1, end2 = start1 + size, start2 + size
+		return fingerprint in slots[start1:end1] or fingerprint in slots[start2:end2]
+
+	def add(self, digest: bytes) -> bool:
+		return self.insert(self.locate(digest))
+
+	def insert(self, location: tuple[int, int, int]) -> bool:
+		"""Returns `False` if the filter is full (a previously inserted fingerprint got lost)."""
+		fingerprint, index1, index2 = location
+		if self._insert_into(index1, fingerprint) or self._insert_into(index2, fingerprint):
+			return True
+
+		slots, size = self._slots, self.BUCKET_SIZE
+		index = self._random.choice((index1, index2))
+		for _ in range(self.MAX_KICKS):
+			slot = index * size + self._random.randrange(size)
+			fingerprint, slots[slot] = slots[slot], fingerprint
+			index = self._alternate(index, fingerprint)
+			if self._insert_into(index, fingerprint):
+				return True
+		return False
+
+	def _insert_into(self, index: int, fingerprint: int) -> bool:
+		start = index * self.BUCKET_SIZE
+		end = start + self.BUCKET_SIZE
+		bucket = self._slots[start:end]
+		if 0 not in bucket:
+			return False
+		self._slots[start + bucket.index(0)] = fingerprint
+		self._count += 1
+		return True
+
+
+class DedupFilter:
+	"""
+	Drops redelivered messages before they are queued: a message is a duplicate if the same topic
+	and payload (and publisher timestamp, see `publish_time_property`) was received from the same
+	broker within the window.
+
+	Memory is bounded and decays over time: two cuckoo filters (generations) of `window_seconds`
+	each, sized for `capacity` messages, the older one is dropped on rotation (or if the current
+	one is full). Filters have rare false positives (~2e-9), so very few unique messages are
+	dropped as duplicates. Use it for topics whose payloads are unique (timestamps, sequence
+	numbers), repeated payloads within the window are dropped otherwise.
+
+	The dedup key is stored too (column `dedup_key`), its unique index catches what the filter
+	missed (e.g. after a restart), see `BatchWriter`. The stored key includes the window the
+	message was received in (`get_stored_key`), so repeated payloads are stored again in a later
+	window; a redelivery crossing a window boundary is stored twice.
+	"""
+
+	DEFAULT_WINDOW_SECONDS = 60
+	DEFAULT_CAPACITY = 1000000
+
+	def __init__(self, config: dict | None):
+		self._enabled = config is not None
+		config = config or {}
+		self._window: float = config.get(DedupConfKey.WINDOW_SECONDS, self.DEFAULT_WINDOW_SECONDS)
+		self._capacity: int = config.get(DedupConfKey.CAPACITY, self.DEFAULT_CAPACITY)
+		self._router: TopicRouter[bool] | None = None
+		topics = config.get(DedupConfKey.TOPICS)
+		if topics:
+			self._router = TopicRouter([(topic, True) for topic in topics])
+
+		self._current: CuckooFilter | None = None
+		self._previous: CuckooFilter | None = None
+		self._rotation_time = 0.0
+		self._duplicate_count = 0
+
+	def __bool__(self) -> bool:
+		return self._enabled
+
+	@property
+	def duplicate_count(self) -> int:
+		return self._duplicate_count
+
+	def get_key(
+		self,
+		topic: str,
+		payload: bytes,
+		published: datetime.datetime | None = None,
+		broker: str | None = None,
+	) -> bytes | None:
+		"""Returns `None` for topics which are not deduplicated."""
+		if self._router is not None and not self._router.lookup(topic):
+			return None
+		digest = hashlib.blake2b(topic.encode(), digest_size=16)
+		digest.update(b"\0")
+		digest.update(payload)
+		if published is not None:
+			digest.update(b"\0" + published.isoformat().encode())
+		if broker is not None:
+			digest.update(b"\0" + broker.encode())
+		return digest.digest()
+
+	def get_stored_key(self, key: bytes, received: datetime.datetime) -> bytes:
+		"""The key with the window of the receive time, it expires in the unique index."""
+		window = int(received.timestamp() // self._window)
+		return hashlib.blake2b(key + window.to_bytes(8, "little", signed=True), digest_size=16).digest()
+
+	def is_duplicate(self, key: bytes, now: float | None = None) -> bool:
+		now = time.monotonic() if now is None else now
+		if now >= self._rotation_time:
+			self._rotate(now)
+
+		# both generations have the same size, the location is computed once
+		location = self._current.locate(key)
+		if self._current.contains(location):
+			self._duplicate_count += 1
+			return True
+		duplicate = self._previous is not None and self._previous.contains(location)
+		if duplicate:
+			self._duplicate_count += 1
+
+		# keys of the previous generation are refreshed, so repeated messages stay detected
+		if not self._current.insert(location):
+			_logger.warning("dedup filter full (%d keys), rotated early", len(self._current))
+			self._rotate(now, expired=False)
+			self._current.insert(location)
+		return duplicate
+
+	def _rotate(self, now: float, expired: bool | None = None) -> None:
+		if expired is None:
+			# after a longer pause both generations are outdated
+			expired = now >= self._rotation_time + self._window
+		self._previous = None if expired else self._current
+		self._current = CuckooFilter(self._capacity)
+		self._rotation_time = now + self._window
+		if self._previous is None:
+			_logger.debug("dedup filter: %d bytes per generation", self._current.size_bytes)
@@ -0,0 +1,111 @@
+import datetime
+import json
+import logging
+
+from src.message_record import QOS, RETAIN, TEXT, TIME, TOPIC, MessageRecord
+from src.topic_filter import TopicRouter
+
+_logger = logging.getLogger(__name__)
+
+
+class JobConfKey:
+	TOPIC = "topic"
+	ENTRYPOINT = "entrypoint"
+	PRIORITY = "priority"
+
+
+class JobRule:
+	__slots__ = ("topic", "entrypoint", "priority")
+
+	def __init__(self, config: dict):
+		self.topic: str = config[JobConfKey.TOPIC]
+		self.entrypoint: str = config[JobConfKey.ENTRYPOINT]
+		self.priority: int = config.get(JobConfKey.PRIORITY, 0)
+
+
+class JobFeeder:
+	"""
+	Enqueues messages of selected topics as jobs into the `pgqueuer` table.
+
+	Rules map topic filters to an entrypoint and priority (first match wins). The jobs of a batch
+	are stored by one COPY within the transaction of the batch, followed by a single NOTIFY for all
+	of them, so workers wake up once per batch and only for committed jobs.
+	"""
+
+	DEFAULT_TABLE_NAME = "pgqueuer"
+	DEFAULT_CHANNEL = "ch_pgqueuer"
+	STATUS_QUEUED = "queued"
+
+	# column sizes of the `pgqueuer` table, longer messages would fail the whole batch
+	MAX_TOPIC_LENGTH = 256
+	MAX_TEXT_LENGTH = 4096
+
+	COLUMNS = ["id", "topic", "text", "qos", "retain", "time", "priority", "status", "entrypoint"]
+
+	def __init__(
+		self,
+		rules: list[dict] | None,
+		table_name: str = DEFAULT_TABLE_NAME,
+		channel: str = DEFAULT_CHANNEL,
+	):
+		self._router: TopicRouter[JobRule] = TopicRouter(
+			[(rule[JobConfKey.TOPIC], JobRule(rule)) for rule in rules or []]
+		)
+		self._table_name = table_name
+		self._channel = channel
+		self._skipped_count = 0
+
+	def __bool__(self) -> bool:
+		return bool(self._router)
+
+	@property
+	def skipped_count(self) -> int:
+		return self._skipped_count
+
+	def create_jobs(self, records: list[MessageRecord]) -> list[tuple]:
+		jobs = []
+		lookup = self._router.lookup
+		for record in records:
+			rule = lookup(record[TOPIC])
+			if rule is None:
+				continue
+			topic, text = record[TOPIC], record[TEXT]
+			if len(topic) > self.MAX_TOPIC_LENGTH or len(text) > self.MAX_TEXT_LENGTH:
+				self._skipped_count += 1
+				_logger.warning("message too long for a job, skipped (%s)", topic)
+				continue
+			# `id` is not used by the logger (`pgqueuer_id` is the key)
+			jobs.append(
+				(
+					0,
+					topic,
+					text,
+					record[QOS],
+					int(record[RETAIN]),
+					record[TIME],
+					rule.priority,
+					self.STATUS_QUEUED,
+					rule.entrypoint,
+				)
+			)
+		return jobs
+
+	def get_notification(self, now: datetime.datetime) -> str:
+		"""pgqueuer's table changed event"""
+		return json.dumps(
+			{
+				"channel": self._channel,
+				"operation": "insert",
+				"sent_at": now.isoformat(),
+				"table": self._table_name,
+				"type": "table_changed_event",
+			}
+		)
+
+	async def enqueue(self, connection, jobs: list[tuple], now: datetime.datetime) -> None:
+		"""Call within the transaction of the batch: NOTIFY is delivered on commit."""
+		await connection.copy_records_to_table(self._table_name, records=jobs, columns=self.COLUMNS)
+		await connection.execute(
+			"SELECT pg_notify($1, $2)", self._channel, self.get_notification(now)
+		)
+		_logger.debug("enqueued %d jobs", len(jobs))
@@ -0,0 +1,122 @@
+import bisect
+import datetime
+import logging
+
+from src.message_record import PUBLISHED, TIME, MessageRecord
+
+_logger = logging.getLogger(__name__)
+
+
+def parse_publish_time(value: str) -> datetime.datetime | None:
+	"""Unix time (seconds or milliseconds) or ISO 8601 (UTC if no zone is given)."""
+	try:
+		timestamp = float(value)
+	except ValueError:
+		try:
+			parsed = datetime.datetime.fromisoformat(value)
+		except ValueError:
+			return None
+		return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+	if timestamp > 1e11:  # milliseconds
+		timestamp /= 1000
+	try:
+		return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+	except (OverflowError, OSError, ValueError):
+		return None
+
+
+def get_publish_time(properties, name: str) -> datetime.datetime | None:
+	"""Publisher timestamp from the MQTT v5 user property `name`."""
+	for key, value in getattr(properties, "UserProperty", None) or ():
+		if key == name:
+			return parse_publish_time(value)
+	return None
+
+
+class LatencyHistogram:
+	"""Counts latencies into fixed, roughly logarithmic buckets. Percentiles are bucket bounds."""
+
+	BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60, 300)
+
+	def __init__(self):
+		self.counts = [0] * (len(self.BOUNDS) + 1)
+		self.count = 0
+		self.sum = 0.0
+		self.max = 0.0
+
+	def add(self, latency: float) -> None:
+		self.counts[bisect.bisect_left(self.BOUNDS, latency)] += 1
+		self.count += 1
+		self.sum += latency
+		if latency > self.max:
+			self.max = latency
+
+	def percentile(self, fraction: float) -> float:
+		rank = fraction * self.count
+		seen = 0
+		for index, count in enumerate(self.counts):
+			seen += count
+			if seen >= rank and count:
+				return min(self.BOUNDS[index], self.max) if index < len(self.BOUNDS) else self.max
+		return self.max
+
+
+class LatencyTracker:
+	"""
+	Latency of stored messages: from receiving (and from publishing, if the publisher sent its
+	timestamp as MQTT v5 user property) to the commit of the COPY.
+
+	The histograms are summarized and reset by `summarize`, one row per kind, see `COLUMNS`.
+	"""
+
+	RECEIVE = "receive"
+	PUBLISH = "publish"
+
+	COLUMNS = [
+		"time",
+		"lane",
+		"table_name",
+		"kind",
+		"count",
+		"avg_ms",
+		"p50_ms",
+		"p95_ms",
+		"p99_ms",
+		"max_ms",
+	]
+
+	def __init__(self, lane: str, table_name: str):
+		self._lane = lane
+		self._table_name = table_name
+		self._histograms = {self.RECEIVE: LatencyHistogram(), self.PUBLISH: LatencyHistogram()}
+
+	def on_committed(self, records: list[MessageRecord], commit_time: datetime.datetime) -> None:
+		receive = self._histograms[self.RECEIVE]
+		publish = self._histograms[self.PUBLISH]
+		for record in records:
+			receive.add((commit_time - record[TIME]).total_seconds())
+			if len(record) > PUBLISHED and record[PUBLISHED] is not None:
+				publish.add(max((commit_time - record[PUBLISHED]).total_seconds(), 0.0))
+
+	def summarize(self, now: datetime.datetime) -> list[tuple]:
+		rows = []
+		for kind, histogram in self._histograms.items():
+			if not histogram.count:
+				continue
+			rows.append(
+				(
+					now,
+					self._lane,
+					self._table_name,
+					kind,
+					histogram.count,
+					histogram.sum / histogram.count * 1000,
+					histogram.percentile(0.5) * 1000,
+					histogram.percentile(0.95) * 1000,
+					histogram.percentile(0.99) * 1000,
+					histogram.max * 1000,
+				)
+			)
+			self._histograms[kind] = LatencyHistogram()
+		return rows
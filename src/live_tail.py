@@ -0,0 +1,174 @@
+import asyncio
+import collections
+import json
+import logging
+
+from quart import Quart, websocket
+
+from src.message_record import TOPIC, MessageRecord, to_json
+from src.topic_filter import TopicRouter
+
+_logger = logging.getLogger(__name__)
+
+
+class LiveTailConfKey:
+	HOST = "host"
+	PORT = "port"
+	PATH = "path"
+	MAX_BUFFER = "max_buffer"
+
+
+class LiveTailClient:
+	"""
+	A websocket client of the live tail: its topic filters and a bounded buffer of the messages not
+	sent yet. If the client can't keep up, the oldest messages are dropped.
+	"""
+
+	def __init__(self, max_buffer: int):
+		self._buffer: collections.deque[MessageRecord] = collections.deque(maxlen=max_buffer)
+		self._ready = asyncio.Event()
+		self._filters: list[str] = []
+		self._router: TopicRouter[bool] = TopicRouter([])
+		self._dropped_count = 0
+
+	@property
+	def filters(self) -> list[str]:
+		return self._filters
+
+	@property
+	def dropped_count(self) -> int:
+		return self._dropped_count
+
+	def subscribe(self, filters: list[str]) -> None:
+		"""Raises `ValueError` for invalid topic filters."""
+		filters = self._filters + [topic for topic in filters if topic not in self._filters]
+		self._router = TopicRouter([(topic, True) for topic in filters])
+		self._filters = filters
+
+	def unsubscribe(self, filters: list[str]) -> None:
+		self._filters = [topic for topic in self._filters if topic not in filters]
+		self._router = TopicRouter([(topic, True) for topic in self._filters])
+
+	def offer(self, record: MessageRecord) -> None:
+		if not self._router.lookup(record[TOPIC]):
+			return
+		buffer = self._buffer
+		if len(buffer) == buffer.maxlen:
+			self._dropped_count += 1
+		buffer.append(record)
+		self._ready.set()
+
+	async def get(self) -> list[MessageRecord]:
+		"""Waits for and removes all buffered messages."""
+		await self._ready.wait()
+		self._ready.clear()
+		records = list(self._buffer)
+		self._buffer.clear()
+		return records
+
+
+class LiveTail:
+	"""
+	Streams received messages to websocket clients, without any database query.
+
+	Clients connect to `ws://<host>:<port><path>` and send commands as JSON:
+	`{"subscribe": ["sensors/#"]}` and `{"unsubscribe": ["sensors/#"]}` (MQTT topic filters).
+	Matching messages are sent as JSON objects (`topic`, `text`, `qos`, `retain`, `time`). Every
+	client has a buffer of `max_buffer` messages, a slow client loses the oldest ones and is told
+	so by `{"dropped": <total>}`.
+
+	The server has no authentication, bind it to a trusted interface (default: localhost).
+	"""
+
+	DEFAULT_HOST = "127.0.0.1"
+	DEFAULT_PORT = 8080
+	DEFAULT_PATH = "/tail"
+	DEFAULT_MAX_BUFFER = 1000
+
+	def __init__(self, config: dict | None):
+		self._enabled = config is not None
+		config = config or {}
+		self._host: str = config.get(LiveTailConfKey.HOST, self.DEFAULT_HOST)
+		self._port: int = config.get(LiveTailConfKey.PORT, self.DEFAULT_PORT)
+		self._path: str = config.get(LiveTailConfKey.PATH, self.DEFAULT_PATH)
+		self._max_buffer: int = config.get(LiveTailConfKey.MAX_BUFFER, self.DEFAULT_MAX_BUFFER)
+		self._clients: set[LiveTailClient] = set()
+
+	def __bool__(self) -> bool:
+		return self._enabled
+
+	@property
+	def clients(self) -> set[LiveTailClient]:
+		return self._clients
+
+	def publish(self, record: MessageRecord) -> None:
+		for client in self._clients:
+			client.offer(record)
+
+	def connect(self) -> LiveTailClient:
+		client = LiveTailClient(self._max_buffer)
+		self._clients.add(client)
+		return client
+
+	def disconnect(self, client: LiveTailClient) -> None:
+		self._clients.discard(client)
+
+	def create_app(self) -> Quart:
+		app = Quart(__name__)
+		app.websocket(self._path)(self._serve)
+		return app
+
+	async def run(self) -> None:
+		_logger.info("live tail on ws://%s:%d%s", self._host, self._port, self._path)
+		# stopped by cancellation only, so the server doesn't install signal handlers
+		stopped = asyncio.Event()
+		await self.create_app().run_task(self._host, self._port, shutdown_trigger=stopped.wait)
+
+	async def _serve(self) -> None:
+		client = self.connect()
+		_logger.debug("live tail client connected (%d clients)", len(self._clients))
+		try:
+			async with asyncio.TaskGroup() as tg:
+				tg.create_task(self._receive_commands(client))
+				tg.create_task(self._send_messages(client))
+		finally:
+			self.disconnect(client)
+			_logger.debug("live tail client disconnected (%d clients)", len(self._clients))
+
+	@staticmethod
+	def get_filters(command: dict, key: str) -> list[str]:
+		"""Raises `ValueError` if the command's value is not a list of topic filters."""
+		filters = command.get(key, [])
+		if not isinstance(filters, list) or not all(isinstance(topic, str) for topic in filters):
+			raise ValueError(f"'{key}' expects a list of topic filters")
+		return filters
+
+	@classmethod
+	async def _receive_commands(cls, client: LiveTailClient) -> None:
+		while True:
+			data = await websocket.receive()
+			try:
+				command = json.loads(data)
+				if not isinstance(command, dict):
+					raise ValueError("JSON object expected")
+				subscribe = cls.get_filters(command, "subscribe")
+				unsubscribe = cls.get_filters(command, "unsubscribe")
+				if subscribe:
+					client.subscribe(subscribe)
+				if unsubscribe:
+					client.unsubscribe(unsubscribe)
+			except (ValueError, TypeError) as ex:
+				await websocket.send(json.dumps({"error": str(ex)}))
+				continue
+			await websocket.send(json.dumps({"subscriptions": client.filters}))
+
+	@classmethod
+	async def _send_messages(cls, client: LiveTailClient) -> None:
+		dropped_count = 0
+		while True:
+			records = await client.get()
+			if client.dropped_count != dropped_count:
+				dropped_count = client.dropped_count
+				await websocket.send(json.dumps({"dropped": dropped_count}))
+			for record in records:
+				await websocket.send(to_json(record))
@@ -0,0 +1,242 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import math
+import os
+import socket
+import time
+from collections.abc import Callable
+
+import asyncpg
+
+from src.archiver import Archiver
+from src.database import Database, DatabaseConfKey
+from src.payload_store import PayloadStore
+
+_logger = logging.getLogger(__name__)
+
+
+class MaintenanceConfKey:
+	JOBS = "jobs"
+	TABLE = "table"
+	MAX_QUEUED_MESSAGES = "max_queued_messages"
+
+
+class MaintenanceJobConfKey:
+	JOB = "job"
+	INTERVAL_MINUTES = "interval_minutes"
+	WINDOW = "window"
+	MAX_SECONDS = "max_seconds"
+
+
+class MaintenanceJobKind:
+	CLEAN_UP = "clean_up"  # archive or delete expired messages (see `Archiver.clean_up`)
+	VACUUM = "vacuum"  # VACUUM ANALYZE of the journal (and payloads) table
+
+	ALL = [CLEAN_UP, VACUUM]
+
+
+class MaintenanceStatus:
+	DONE = "done"
+	TIMEOUT = "timeout"
+	FAILED = "failed"
+
+
+def parse_window(window: str) -> tuple[datetime.time, datetime.time]:
+	"""Local time window "HH:MM-HH:MM", may span midnight (e.g. "22:00-04:00")."""
+	try:
+		start, end = window.split("-")
+		return datetime.time.fromisoformat(start.strip()), datetime.time.fromisoformat(end.strip())
+	except ValueError:
+		raise ValueError(f"invalid maintenance window '{window}' (expected 'HH:MM-HH:MM')!") from None
+
+
+def is_in_window(window: tuple[datetime.time, datetime.time] | None, now: datetime.time) -> bool:
+	if window is None:
+		return True
+	start, end = window
+	if start <= end:
+		return start <= now < end
+	return now >= start or now < end
+
+
+def get_lock_key(name: str) -> int:
+	"""Stable 64 bit key (signed) of the advisory lock"""
+	digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+	return int.from_bytes(digest, "big", signed=True)
+
+
+class MaintenanceJob:
+	DEFAULT_INTERVAL_MINUTES = 1440
+
+	def __init__(self, config: dict):
+		self.kind: str = config[MaintenanceJobConfKey.JOB]
+		if self.kind not in MaintenanceJobKind.ALL:
+			raise ValueError(f"unknown maintenance job '{self.kind}'!")
+		self.interval = datetime.timedelta(
+			minutes=config.get(MaintenanceJobConfKey.INTERVAL_MINUTES, self.DEFAULT_INTERVAL_MINUTES)
+		)
+		window = config.get(MaintenanceJobConfKey.WINDOW)
+		self.window = parse_window(window) if window else None
+		self.max_seconds: float | None = config.get(MaintenanceJobConfKey.MAX_SECONDS)
+		self.next_check = 0.0  # monotonic, runs of other instances are looked up after their interval
+
+
+class MaintenanceScheduler:
+	"""
+	Runs heavy periodic work (`maintenance.jobs`) of a database target on exactly one of several
+	logger instances sharing the database.
+
+	A due job takes a Postgres advisory lock (per table and job), instances failing to get it
+	skip the job. The last run of every job is kept in the maintenance table, so a job already done
+	by another instance within its interval isn't repeated.
+
+	Jobs only start within their local time `window` and while the writers are not backlogged
+	(`max_queued_messages`), they are cancelled after `max_seconds` (`statement_timeout` for SQL).
+
+	The periodic archiving (`archive_interval_minutes`) is a `clean_up` job of that interval, so
+	it runs on one instance only as well.
+	"""
+
+	DEFAULT_TABLE_NAME = "journal_maintenance"
+	DEFAULT_MAX_QUEUED_MESSAGES = 10000
+	CHECK_SECONDS = 60
+
+	def __init__(
+		self,
+		database: Database,
+		archiver: Archiver,
+		config: dict | None,
+		payloads: PayloadStore | None = None,
+		queued_messages: Callable[[], int] | None = None,
+	):
+		config = config or {}
+		self._database = database
+		self._archiver = archiver
+		self._payloads = payloads
+		self._queued_messages = queued_messages
+		self._jobs = [MaintenanceJob(job) for job in config.get(MaintenanceConfKey.JOBS) or []]
+		if archiver.periodic:
+			if any(job.kind == MaintenanceJobKind.CLEAN_UP for job in self._jobs):
+				raise ValueError(
+					f"'{DatabaseConfKey.ARCHIVE_INTERVAL_MINUTES}' and a "
+					f"'{MaintenanceJobKind.CLEAN_UP}' maintenance job exclude each other!"
+				)
+			self._jobs.append(
+				MaintenanceJob(
+					{
+						MaintenanceJobConfKey.JOB: MaintenanceJobKind.CLEAN_UP,
+						MaintenanceJobConfKey.INTERVAL_MINUTES: archiver.interval_minutes,
+					}
+				)
+			)
+		self._table_name: str = config.get(MaintenanceConfKey.TABLE, self.DEFAULT_TABLE_NAME)
+		self._max_queued_messages: int = config.get(
+			MaintenanceConfKey.MAX_QUEUED_MESSAGES, self.DEFAULT_MAX_QUEUED_MESSAGES
+		)
+		self._instance = f"{socket.gethostname()}:{os.getpid()}"
+
+	def __bool__(self) -> bool:
+		return bool(self._jobs)
+
+	@property
+	def jobs(self) -> list[MaintenanceJob]:
+		return self._jobs
+
+	def get_lock_name(self, job: MaintenanceJob) -> str:
+		return f"mqtt-pg-logger:{self._database.table_name}:{job.kind}"
+
+	def is_busy(self) -> bool:
+		"""Ingest first: no maintenance while the writers are backlogged."""
+		if self._queued_messages is None:
+			return False
+		return self._queued_messages() > self._max_queued_messages
+
+	def get_due_jobs(self, now: float, local_time: datetime.time) -> list[MaintenanceJob]:
+		return [
+			job for job in self._jobs if job.next_check <= now and is_in_window(job.window, local_time)
+		]
+
+	async def run(self) -> None:
+		while True:
+			await asyncio.sleep(self.CHECK_SECONDS)
+			for job in self.get_due_jobs(time.monotonic(), self._database._now().time()):
+				if self.is_busy():
+					_logger.info("maintenance: %s postponed, writers are backlogged", job.kind)
+					break
+				try:
+					await self.run_job(job)
+				except Exception as ex:
+					job.next_check = time.monotonic() + self.CHECK_SECONDS
+					_logger.exception("maintenance: %s failed: %s", job.kind, ex)
+
+	async def run_job(self, job: MaintenanceJob) -> str | None:
+		"""Returns the status, `None` if the job was not due or runs on another instance."""
+		key = get_lock_key(self.get_lock_name(job))
+		table_name = self._database.table_name
+		async with self._database.pool.acquire() as connection:
+			if not await connection.fetchval("SELECT pg_try_advisory_lock($1)", key):
+				_logger.debug("maintenance: %s runs on another instance", job.kind)
+				job.next_check = time.monotonic() + self.CHECK_SECONDS
+				return None
+			try:
+				last_run = await connection.fetchval(
+					f"SELECT last_run FROM {self._table_name} WHERE table_name = $1 AND job = $2",
+					table_name,
+					job.kind,
+				)
+				now = self._database._now_utc()
+				if last_run is not None and now - last_run < job.interval:
+					remaining = job.interval - (now - last_run)
+					job.next_check = time.monotonic() + remaining.total_seconds()
+					return None
+
+				status = await self._run_timed(connection, job)
+				duration = (self._database._now_utc() - now).total_seconds()
+				await connection.execute(
+					f"INSERT INTO {self._table_name} "
+					"(table_name, job, last_run, duration_seconds, status, instance) "
+					"VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (table_name, job) DO UPDATE SET "
+					"last_run = $3, duration_seconds = $4, status = $5, instance = $6",
+					table_name,
+					job.kind,
+					now,
+					duration,
+					status,
+					self._instance,
+				)
+				job.next_check = time.monotonic() + job.interval.total_seconds()
+				_logger.info("maintenance: %s %s after %.1fs", job.kind, status, duration)
+				return status
+			finally:
+				await connection.execute("SELECT pg_advisory_unlock($1)", key)
+
+	async def _run_timed(self, connection: asyncpg.Connection, job: MaintenanceJob) -> str:
+		try:
+			async with asyncio.timeout(job.max_seconds):
+				await self._run(connection, job)
+			return MaintenanceStatus.DONE
+		except (TimeoutError, asyncpg.QueryCanceledError):
+			_logger.warning("maintenance: %s cancelled after %ss", job.kind, job.max_seconds)
+			return MaintenanceStatus.TIMEOUT
+		except Exception as ex:
+			_logger.exception("maintenance: %s failed: %s", job.kind, ex)
+			return MaintenanceStatus.FAILED
+
+	async def _run(self, connection: asyncpg.Connection, job: MaintenanceJob) -> None:
+		if job.kind == MaintenanceJobKind.CLEAN_UP:
+			await self._archiver.clean_up()
+		elif job.kind == MaintenanceJobKind.VACUUM:
+			tables = [self._database.table_name]
+			if self._payloads:
+				tables.append(self._payloads.table_name)
+			timeout = int(job.max_seconds * 1000) if job.max_seconds else 0
+			await connection.execute(f"SET statement_timeout = {timeout}")
+			try:
+				# not bounded by the pool's `command_timeout` (`None` would fall back to it)
+				await connection.execute(
+					f"VACUUM (ANALYZE) {', '.join(tables)}", timeout=job.max_seconds or math.inf
+				)
+			finally:
+				await connection.execute("RESET statement_timeout")
@@ -0,0 +1,60 @@
+import datetime
+import json
+
+# Queued messages are plain tuples, the most compact object CPython allocates (a NamedTuple or a
+# slotted class costs a Python level constructor call per message). They are passed to COPY as they
+# are, so the field order matches `BatchWriter.COLUMNS`. The listener may append the publisher
+# timestamp (`PUBLISHED`, if `publish_time_property` is configured), the acknowledgement entry
+# (`ACK`, if `ack_after_commit` is configured), the dedup key (`DEDUP_KEY`, if `dedup` is
+# configured) and the broker name (`BROKER`, if `broker_column` is configured). Only the dedup key
+# and the broker name are stored in the journal.
+MessageRecord = tuple[str, str, int, bool, datetime.datetime]
+
+TOPIC = 0
+TEXT = 1
+QOS = 2
+RETAIN = 3
+TIME = 4  # receive time
+PUBLISHED = 5
+ACK = 6
+DEDUP_KEY = 7
+BROKER = 8
+
+
+def to_dict(record: MessageRecord) -> dict:
+	return {
+		"topic": record[TOPIC],
+		"text": record[TEXT],
+		"qos": record[QOS],
+		"retain": bool(record[RETAIN]),
+		"time": record[TIME].isoformat(),
+	}
+
+
+def to_json(record: MessageRecord) -> str:
+	"""JSON object as read by `--replay` (JSON lines)"""
+	return json.dumps(to_dict(record))
+
+
+class TopicCache:
+	"""
+	Bounded cache of topic strings, so all queued records of a topic share one string instance
+	(and its precomputed hash). The cache is dropped as a whole once `max_size` is reached.
+	"""
+
+	DEFAULT_MAX_SIZE = 65536
+
+	def __init__(self, max_size: int = DEFAULT_MAX_SIZE):
+		self._max_size = max_size
+		self._cache: dict[str, str] = {}
+
+	def __len__(self) -> int:
+		return len(self._cache)
+
+	def get(self, topic: str) -> str:
+		cached = self._cache.get(topic)
+		if cached is None:
+			if len(self._cache) >= self._max_size:
+				self._cache.clear()
+			self._cache[topic] = cached = topic
+		return cached
@@ -1,6 +1,10 @@
 import aiomqtt
 import ssl
+from collections.abc import Callable
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 
+from src.ack_tracker import AckTracker
 from src.app_config import AppConfig
 from src.constants import MqttConfKey
 
@@ -12,9 +16,27 @@ class MqttClient:
 	DEFAULT_PORT_SSL = 8883
 	DEFAULT_PROTOCOL = 5  # 5==MQTTv5, default: 4==MQTTv311, 3==MQTTv31
 	DEFAULT_QUALITY = 1
+	ACK_SESSION_EXPIRY_SECONDS = 86400  # unacknowledged messages are kept by the broker meanwhile
 
-	def __init__(self, config: AppConfig):
-		self._mqtt = config.get_mqtt_config()
+	@classmethod
+	def get_port(cls, mqtt_config: dict) -> int:
+		port = mqtt_config.get(MqttConfKey.PORT)
+		if not port:
+			ssl_insecure = mqtt_config.get(MqttConfKey.SSL_INSECURE, False)
+			port = cls.DEFAULT_PORT_SSL if not ssl_insecure else cls.DEFAULT_PORT
+		return port
+
+	def __init__(
+		self,
+		config: AppConfig,
+		mqtt_config: dict | None = None,
+		client_factory: Callable[..., aiomqtt.Client] = aiomqtt.Client,
+	):
+		"""
+		`mqtt_config`: one of the brokers, default: the first one
+		`client_factory`: creates the client (`aiomqtt.Client` arguments), e.g. replaying a recording
+		"""
+		self._mqtt = config.get_mqtt_config() if mqtt_config is None else mqtt_config
 
 		# SSL and TLS context
 		ssl_ca_certs = self._mqtt.get(MqttConfKey.SSL_CA_CERTS)
@@ -23,9 +45,7 @@ class MqttClient:
 		ssl_insecure = self._mqtt.get(MqttConfKey.SSL_INSECURE, False)
 
 		self._host = self._mqtt.get(MqttConfKey.HOST)
-		self._port = self._mqtt.get(MqttConfKey.PORT)
-		if not self._port:
-			self._port = self.DEFAULT_PORT_SSL if not ssl_insecure else self.DEFAULT_PORT
+		self._port = self.get_port(self._mqtt)
 		self._user = self._mqtt.get(MqttConfKey.USER)
 		self._password = self._mqtt.get(MqttConfKey.PASSWORD)
 		self._keepalive = self._mqtt.get(MqttConfKey.KEEPALIVE, self.DEFAULT_KEEPALIVE)
@@ -51,7 +71,24 @@ class MqttClient:
 		if not ssl_insecure:
 			tls_params = aiomqtt.TLSParameters(**tls_params_dict)
 
-		self._client = aiomqtt.Client(
+		# messages are acknowledged after they were committed, so the broker must keep the session
+		# (and redeliver unacknowledged messages) over a restart
+		self._ack_after_commit = self._mqtt.get(MqttConfKey.ACK_AFTER_COMMIT, False)
+		session_params = {}
+		if self._ack_after_commit:
+			if not self._client_id:
+				raise ValueError(
+					f"'{MqttConfKey.ACK_AFTER_COMMIT}' requires a fixed '{MqttConfKey.CLIENT_ID}'!"
+				)
+			if protocol == 5:
+				properties = Properties(PacketTypes.CONNECT)
+				properties.SessionExpiryInterval = self.ACK_SESSION_EXPIRY_SECONDS
+				properties.ReceiveMaximum = min(self.get_max_unacked(), 65535)
+				session_params = {"clean_start": False, "properties": properties}
+			else:
+				session_params = {"clean_session": False}
+
+		self._client = client_factory(
 			hostname=self._host,
 			port=self._port,
 			username=self._user,
@@ -60,4 +97,14 @@ class MqttClient:
 			protocol=aiomqtt.ProtocolVersion(protocol),
 			keepalive=self._keepalive,
 			tls_params=tls_params,
+			**session_params,
 		)
+		if self._ack_after_commit:
+			# not exposed by aiomqtt, the paho client is configured directly
+			self._client._client.manual_ack_set(True)
+
+	def get_max_unacked(self) -> int:
+		return self._mqtt.get(MqttConfKey.MAX_UNACKED_MESSAGES, AckTracker.DEFAULT_MAX_UNACKED)
+
+	def _ack(self, mid: int, qos: int) -> None:
+		self._client._client.ack(mid, qos)
@@ -1,67 +1,442 @@
 import asyncio
 import logging
-import re
+import signal
+from collections.abc import Callable
 
+import aiomqtt
+
+from src.ack_tracker import AckTracker
 from src.app_config import AppConfig
 from src.constants import MqttConfKey
-from src.database import Database
+from src.current_values import CurrentValues
+from src.database import Database, DatabaseConfKey
+from src.database_target import DatabaseTargets
+from src.dedup_filter import DedupFilter
+from src.latency_tracker import get_publish_time
+from src.live_tail import LiveTail
+from src.message_record import TIME, MessageRecord, TopicCache
 from src.mqtt_client import MqttClient
+from src.profiler import Stage, profiler
+from src.rate_limiter import Admission, RateLimiter
+from src.subscription_filter import SubscriptionFilter
+from src.topic_stats import TopicStats
 
 _logger = logging.getLogger(__name__)
 
 
 class MqttListener(MqttClient):
-	def __init__(self, config: AppConfig):
-		super().__init__(config)
+	"""
+	Receives the subscribed messages of one broker and hands them over to the (shared) database
+	targets. A lost connection is reconnected with growing delays (up to `reconnect_max_seconds`),
+	queued messages are kept meanwhile.
+
+	With `topic_stats_interval_seconds` the messages, bytes and drops (dedup, rate limits) per
+	topic are counted in memory and stored into the stats table of every database target.
+
+	Stored messages are also published to the live tail and the current values, if enabled.
+	"""
+
+	SUBSCRIPTION_QOS = 1  # qos for subscriptions, not used, but necessary
+	RECONNECT_MIN_SECONDS = 1
+	DEFAULT_RECONNECT_MAX_SECONDS = 60
+
+	def __init__(
+		self,
+		config: AppConfig,
+		targets: DatabaseTargets,
+		live_tail: LiveTail | None = None,
+		mqtt_config: dict | None = None,
+		store_broker: bool = False,
+		current_values: CurrentValues | None = None,
+		client_factory: Callable[..., aiomqtt.Client] = aiomqtt.Client,
+	):
+		mqtt_config = config.get_mqtt_config() if mqtt_config is None else mqtt_config
+		super().__init__(config, mqtt_config, client_factory)
+
+		self._name: str = self.get_name(mqtt_config)
+		self._broker = self._name if store_broker else None  # stored along with every message
+		self._targets = targets
+		self._live_tail = live_tail if live_tail else None
+		self._current_values = current_values if current_values else None
+		self._connected = False
+		self._ack_tracker: AckTracker | None = None
+		self._reconnect_max_seconds: float = mqtt_config.get(
+			MqttConfKey.RECONNECT_MAX_SECONDS, self.DEFAULT_RECONNECT_MAX_SECONDS
+		)
+
+		self._topic_cache = TopicCache()
+		self._filter = SubscriptionFilter(self._mqtt)
+		self._subscriptions = self._filter.subscriptions
+		self._reloaded = False  # messages are checked against the filter after a reload
+		self._publish_time_property: str | None = self._mqtt.get(MqttConfKey.PUBLISH_TIME_PROPERTY)
+		self._dedup = DedupFilter(self._mqtt.get(MqttConfKey.DEDUP))
+		self._rate_limiter = RateLimiter(
+			self._mqtt.get(MqttConfKey.RATE_LIMITS),
+			self._mqtt.get(MqttConfKey.RATE_LIMIT_MAX_TOPICS, RateLimiter.DEFAULT_MAX_TOPICS),
+			on_shed=self._discard,
+		)
+		self._topic_stats_interval: float = self._mqtt.get(MqttConfKey.TOPIC_STATS_INTERVAL_SECONDS, 0)
+		self._topic_stats: TopicStats | None = None
+		if self._topic_stats_interval > 0:
+			self._topic_stats = TopicStats(
+				self._name,
+				self._mqtt.get(MqttConfKey.TOPIC_STATS_MAX_TOPICS, TopicStats.DEFAULT_MAX_TOPICS),
+			)
 
-		self._mqtt = config.get_mqtt_config()
-		self._database = Database(config.get_database_config())
+	@classmethod
+	def get_name(cls, mqtt_config: dict) -> str:
+		"""`name` of the broker, default: `<host>:<port>`"""
+		name = mqtt_config.get(MqttConfKey.NAME)
+		return name or f"{mqtt_config.get(MqttConfKey.HOST)}:{cls.get_port(mqtt_config)}"
 
-		skip_subscription_regexes = list(set(self._mqtt.get(MqttConfKey.SKIP_SUBSCRIPTION_REGEXES)))
-		self._skip_subscription_regexes = [re.compile(regex) for regex in skip_subscription_regexes]
+	@property
+	def name(self) -> str:
+		return self._name
 
-		subscriptions = self._mqtt.get(MqttConfKey.SUBSCRIPTIONS)
-		valid_subscriptions = [sub for sub in subscriptions if self.is_valid_topic(sub)]
-		self._subscriptions = list(set(valid_subscriptions))
+	@property
+	def subscriptions(self) -> list[str]:
+		return self._subscriptions
+
+	@property
+	def ack_after_commit(self) -> bool:
+		return self._ack_after_commit
+
+	@property
+	def topic_stats(self) -> TopicStats | None:
+		return self._topic_stats
+
+	@property
+	def ack_tracker(self) -> AckTracker | None:
+		"""Tracks the messages of the current connection (`ack_after_commit`)."""
+		return self._ack_tracker
 
 	def is_valid_topic(self, topic: str) -> bool:
-		return not any(regex.match(topic) for regex in self._skip_subscription_regexes)
+		return self._filter.is_valid_topic(topic)
 
-	async def listen(self) -> None:
-		if not self._subscriptions:
-			return
+	def _put(self, record: MessageRecord) -> None:
+		self._targets.put(record)
+		if self._live_tail is not None:
+			self._live_tail.publish(record)
+		if self._current_values is not None:
+			self._current_values.update(record)
+
+	def _discard(self, record: MessageRecord) -> None:
+		"""A held message got shed by the rate limiter, it won't be stored."""
+		if self._ack_tracker is not None:
+			self._ack_tracker.discard(record)
+
+	def _get_put(self) -> Callable[[MessageRecord], None]:
+		"""The plain `DatabaseTargets.put` if nothing else consumes the messages"""
+		if self._live_tail is None and self._current_values is None:
+			return self._targets.put
+		return self._put
 
+	async def run(self) -> None:
 		async with asyncio.TaskGroup() as tg:
-			tg.create_task(self.process())
+			if self._rate_limiter:
+				tg.create_task(self._rate_limiter.run(self._get_put()))
+			if self._topic_stats is not None:
+				tg.create_task(self._run_topic_stats())
+			tg.create_task(self._run_connection())
+
+	async def _run_topic_stats(self) -> None:
+		try:
+			while True:
+				await asyncio.sleep(self._topic_stats_interval)
+				await self.store_topic_stats()
+		except asyncio.CancelledError:
+			await self.store_topic_stats()  # the last period
+			raise
+
+	async def store_topic_stats(self) -> int:
+		rows = self._topic_stats.summarize(Database._now_utc())
+		await self._targets.store_topic_stats(rows)
+		_logger.debug("%s: stored stats of %d topics", self._name, len(rows))
+		return len(rows)
+
+	async def _run_connection(self) -> None:
+		delay = self.RECONNECT_MIN_SECONDS
+		while True:
+			try:
+				await self.process()
+			except aiomqtt.MqttError as ex:
+				if self._connected:
+					delay = self.RECONNECT_MIN_SECONDS
+				_logger.warning("%s: MQTT connection failed, reconnect in %ds (%s)", self._name, delay, ex)
+			finally:
+				self._connected = False
+			await asyncio.sleep(delay)
+			delay = min(delay * 2, self._reconnect_max_seconds)
+
+	async def update_subscriptions(self, mqtt_config: dict) -> None:
+		"""Applies changed subscriptions and skip regexes (`SIGHUP`), only changes are (un)subscribed."""
+		subscription_filter = SubscriptionFilter(mqtt_config)
+		if not subscription_filter.subscriptions:
+			_logger.error(
+				"%s: reloaded config has no (valid) subscriptions, the current ones are kept", self._name
+			)
+			return
+
+		current, reloaded = set(self._subscriptions), set(subscription_filter.subscriptions)
+		removed = [topic for topic in self._subscriptions if topic not in reloaded]
+		added = [topic for topic in subscription_filter.subscriptions if topic not in current]
+
+		if self._connected:  # otherwise subscribed on (re)connect
+			# messages of added subscriptions (e.g. retained ones) may arrive before `subscribe`
+			# returns, until the unsubscribe is done both the old and new subscriptions are accepted
+			self._filter = SubscriptionFilter(
+				{**mqtt_config, MqttConfKey.SUBSCRIPTIONS: self._subscriptions + added}
+			)
+			self._reloaded = True
+			try:
+				for topic in added:
+					await self._client.subscribe(topic=topic, qos=self.SUBSCRIPTION_QOS)
+					_logger.info("subscribed to MQTT topic (%s)", topic)
+				if removed:
+					await self._client.unsubscribe(removed)
+					_logger.info("unsubscribed from MQTT topics (%s)", ", ".join(removed))
+			finally:
+				self._swap_filter(subscription_filter)
+		else:
+			self._swap_filter(subscription_filter)
+		for key in MqttListeners.RELOADABLE_KEYS:
+			self._mqtt[key] = mqtt_config.get(key)
+		_logger.info(
+			"%s: subscriptions reloaded (%d added, %d removed)", self._name, len(added), len(removed)
+		)
+
+	def _swap_filter(self, subscription_filter: SubscriptionFilter) -> None:
+		# swapped at once, the receive loop never sees a partial update: messages of removed
+		# subscriptions still in flight (or of a persistent session) are skipped from now on
+		self._filter, self._subscriptions = subscription_filter, subscription_filter.subscriptions
+		self._reloaded = True
 
 	async def process(self) -> None:
-		subs_qos = 1  # qos for subscriptions, not used, but necessary
 		async with self._client as client:
-			await self._database.connect()
-
 			for topic in self._subscriptions:
-				await client.subscribe(topic=topic, qos=subs_qos)
+				await client.subscribe(topic=topic, qos=self.SUBSCRIPTION_QOS)
 				_logger.info("subscribed to MQTT topic (%s)", topic)
+			self._connected = True
+
+			try:
+				await self._receive(client)
+			finally:
+				self._ack_tracker = None
+
+	async def _receive(self, client: aiomqtt.Client) -> None:
+		topic_cache = self._topic_cache
+		put = self._get_put()
+		broker = self._broker
+		now = Database._now_utc
+		rate_limiter = self._rate_limiter if self._rate_limiter else None
+		publish_time_property = self._publish_time_property
+
+		# message ids are valid per connection only
+		ack_tracker: AckTracker | None = None
+		if self._ack_after_commit:
+			ack_tracker = AckTracker(self._ack, self.get_max_unacked(), copies=len(self._targets))
+		self._ack_tracker = ack_tracker
+
+		dedup = self._dedup if self._dedup else None
+		topic_stats = self._topic_stats
+		# records carry `PUBLISHED`, `ACK`, `DEDUP_KEY` and `BROKER` if any of them is needed
+		extended = bool(publish_time_property or ack_tracker or dedup or broker)
 
-			async for message in client.messages:
-				_logger.info(
-					"received MQTT topic message (%s: %s)",
-					message.topic,
-					message.payload,
+		profile = profiler
+		mark = 0  # end of the previous message (profiling)
+
+		async for message in client.messages:
+			profiling = profile.enabled
+			if profiling:
+				start = profile.lap(Stage.RECEIVE, mark)
+			_logger.debug("received MQTT topic message (%s: %s)", message.topic, message.payload)
+
+			topic = topic_cache.get(message.topic.value)
+			record = (topic, message.payload.decode(), message.qos, message.retain, now())
+			dedup_key = None
+			if extended:
+				published = ack_entry = stored_key = None
+				if publish_time_property:
+					published = get_publish_time(message.properties, publish_time_property)
+				if ack_tracker is not None:
+					ack_entry = ack_tracker.track(message.mid, message.qos)
+				if dedup is not None:
+					dedup_key = dedup.get_key(topic, message.payload, published, broker)
+					if dedup_key is not None:
+						stored_key = dedup.get_stored_key(dedup_key, record[TIME])
+				record += (published, ack_entry, stored_key, broker)
+			if profiling:
+				start = profile.lap(Stage.TRANSFORM, start)
+
+			skipped = self._reloaded and not self._filter.accepts(topic)
+			if not skipped:
+				skipped = dedup_key is not None and dedup.is_duplicate(dedup_key)
+			dropped = skipped
+			held = False
+			if not skipped and rate_limiter is not None:
+				# a message held back (mode "latest") is no drop, but the held one it replaces is
+				shed_total = rate_limiter.shed_total
+				admission = rate_limiter.admit(record)
+				skipped = admission == Admission.DROP
+				held = admission == Admission.HOLD  # acknowledged once stored (or shed)
+				dropped = rate_limiter.shed_total != shed_total
+			if profiling:
+				start = profile.lap(Stage.FILTER, start)
+			if topic_stats is not None:
+				topic_stats.add(topic, len(message.payload), record[TIME], dropped)
+			if skipped:
+				if ack_tracker is not None:
+					ack_tracker.discard(record)
+			elif not held:
+				put(record)  # decoded once, queued by every database target (and the live tail)
+				if profiling:
+					start = profile.lap(Stage.ENQUEUE, start)
+
+			if profiling:
+				mark = start
+			if ack_tracker is not None:
+				if ack_tracker.full:
+					await ack_tracker.wait_for_room()
+				if ack_tracker.failed:
+					# unacknowledged messages are redelivered on the new connection only
+					raise aiomqtt.MqttError("messages were not stored, reconnecting for their redelivery")
+
+
+class MqttListeners:
+	"""
+	Receives the messages of all configured brokers (`mqtt` as list), every broker has a listener
+	(connection, reconnects, filters) of its own. All of them feed the same database targets, so
+	the pools and batches are shared.
+
+	On `SIGHUP` the config file is read again: subscriptions and skip regexes are updated on the
+	connected clients (only the changed subscriptions), queued messages are kept. Other changes
+	need a restart.
+	"""
+
+	RELOADABLE_KEYS = (MqttConfKey.SUBSCRIPTIONS, MqttConfKey.SKIP_SUBSCRIPTION_REGEXES)
+
+	def __init__(
+		self, config: AppConfig, client_factory: Callable[..., aiomqtt.Client] = aiomqtt.Client
+	):
+		"""`client_factory`: creates the client of every broker (see `MqttClient`)"""
+		self._config = config
+		self._targets = DatabaseTargets(config.get_database_configs())
+		self._live_tail = LiveTail(config.get_live_tail_config())
+		self._current_values = CurrentValues(config.get_current_values_config())
+		self._reload_lock = asyncio.Lock()
+		self._reload_task: asyncio.Task | None = None
+
+		store_broker = any(
+			database_config.get(DatabaseConfKey.BROKER_COLUMN)
+			for database_config in config.get_database_configs()
+		)
+		self._listeners: list[MqttListener] = []
+		for mqtt_config in config.get_mqtt_configs():
+			self._listeners.append(
+				MqttListener(
+					config,
+					self._targets,
+					self._live_tail,
+					mqtt_config,
+					store_broker,
+					current_values=self._current_values,
+					client_factory=client_factory,
 				)
+			)
+
+		names = [listener.name for listener in self._listeners]
+		if len(set(names)) != len(names):
+			raise ValueError(f"MQTT brokers need unique '{MqttConfKey.NAME}'s ({names})!")
+
+		if any(listener.ack_after_commit for listener in self._listeners):
+			self._targets.set_on_done(self._on_done)
+
+	@property
+	def targets(self) -> DatabaseTargets:
+		return self._targets
 
-				async with self._database._pool.acquire() as connection:
-					columns = ["topic", "text", "qos", "retain", "time"]
-					record = (
-						str(message.topic),
-						message.payload.decode(),
-						message.qos,
-						message.retain,
-						self._database._now(),
-					)
-
-					await connection.copy_records_to_table(
-						self._database._table_name, records=[record], columns=columns
-					)
-
-					_logger.info("overall message: stored=%s", message.payload.decode())
+	@property
+	def current_values(self) -> CurrentValues:
+		return self._current_values
+
+	def __iter__(self):
+		return iter(self._listeners)
+
+	def __len__(self) -> int:
+		return len(self._listeners)
+
+	def _on_done(self, records: list[MessageRecord], stored: bool) -> None:
+		AckTracker.count_done(records, stored)
+		for listener in self._listeners:
+			if listener.ack_tracker is not None:
+				listener.ack_tracker.send_acks()
+
+	async def listen(self) -> None:
+		if not any(listener.subscriptions for listener in self._listeners):
+			return
+
+		loop = asyncio.get_running_loop()
+		try:
+			await self._targets.connect()
+			loop.add_signal_handler(signal.SIGHUP, self._request_reload)
+			async with asyncio.TaskGroup() as tg:
+				tg.create_task(self._targets.run())
+				if self._live_tail:
+					tg.create_task(self._live_tail.run())
+				if self._current_values:
+					tg.create_task(self._current_values.run())
+				tg.create_task(profiler.run())
+				for listener in self._listeners:
+					if listener.subscriptions:
+						tg.create_task(listener.run())
+		finally:
+			loop.remove_signal_handler(signal.SIGHUP)
+			await self._targets.close()
+
+	def _request_reload(self) -> None:
+		self._reload_task = asyncio.create_task(self.reload())
+
+	async def reload(self) -> None:
+		"""Reads the config file again and applies the subscription changes."""
+		async with self._reload_lock:
+			try:
+				config = AppConfig(self._config.config_file)
+			except Exception as ex:
+				_logger.error("reloading config failed, the current one is kept (%s)", ex)
+				return
+
+			mqtt_configs = {
+				MqttListener.get_name(mqtt_config): mqtt_config
+				for mqtt_config in config.get_mqtt_configs()
+			}
+			if len(mqtt_configs) != len(config.get_mqtt_configs()):
+				_logger.error("reloaded config has brokers of the same name, the current one is kept")
+				return
+
+			# brokers are matched by name, their order doesn't matter
+			listeners = {listener.name: listener for listener in self._listeners}
+			added = [name for name in mqtt_configs if name not in listeners]
+			removed = [name for name in listeners if name not in mqtt_configs]
+			if added:
+				_logger.warning("added MQTT brokers need a restart: %s", ", ".join(added))
+			if removed:
+				_logger.warning("removed MQTT brokers need a restart: %s", ", ".join(removed))
+
+			changed = []
+			for name, listener in listeners.items():
+				mqtt_config = mqtt_configs.get(name)
+				if mqtt_config is None:
+					continue
+				current_config = listener._mqtt
+				keys = (set(current_config) | set(mqtt_config)) - set(self.RELOADABLE_KEYS)
+				changed.extend(
+					f"mqtt.{key}" for key in keys if current_config.get(key) != mqtt_config.get(key)
+				)
+				try:
+					await listener.update_subscriptions(mqtt_config)
+				except Exception as ex:
+					_logger.exception("%s: updating subscriptions failed: %s", listener.name, ex)
+			if config.get_database_configs() != self._config.get_database_configs():
+				changed.append("database")
+			if changed:
+				_logger.warning("config changes need a restart: %s", ", ".join(sorted(set(changed))))
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 import asyncio
+import datetime
 import logging
+import os
 import sys
 from functools import wraps
 
@@ -8,9 +10,16 @@ import click
 
 from src.app_config import AppConfig
 from src.app_logging import AppLogging
+from src.archiver import Archiver
 from src.constants import LOGGING_CHOICES
+from src.database import Database, DatabaseConfKey
+from src.message_record import to_json
+from src.payload_store import PayloadStore
+from src.profiler import profiler
+from src.replayer import Replayer, ReplayFormat
 from src.runner import Runner
 from src.schema_creator import SchemaCreator
+from src.topic_query import TopicQuery
 
 _logger = logging.getLogger(__name__)
 
@@ -36,6 +45,68 @@ def coro(f):
 	is_flag=True,
 	help="Create database table (if not exists) and create or replace a trigger",
 )
+@click.option(
+	"--archive",
+	is_flag=True,
+	help="Move expired messages into archive files (see 'archive_dir') and exit",
+)
+@click.option(
+	"--replay",
+	help="Load a message dump (mosquitto_sub output, JSON lines or archive files) and exit",
+	type=click.Path(exists=True, dir_okay=False),
+)
+@click.option(
+	"--replay-format",
+	default=ReplayFormat.AUTO,
+	help="Replay file format ('auto' detects by file extension)",
+	show_default=True,
+	type=click.Choice(ReplayFormat.ALL),
+)
+@click.option(
+	"--replay-concurrency",
+	default=Replayer.DEFAULT_CONCURRENCY,
+	help="Parallel COPY connections used by replay",
+	show_default=True,
+	type=click.IntRange(min=1),
+)
+@click.option(
+	"--replay-batch-size",
+	default=Replayer.DEFAULT_BATCH_SIZE,
+	help="Rows per COPY used by replay",
+	show_default=True,
+	type=click.IntRange(min=1),
+)
+@click.option(
+	"--query",
+	help="Print stored messages matching an MQTT topic filter (JSON lines) and exit",
+)
+@click.option(
+	"--query-since",
+	help="Only messages received since (local time)",
+	type=click.DateTime(),
+)
+@click.option(
+	"--query-limit",
+	default=TopicQuery.DEFAULT_LIMIT,
+	help="Max number of (latest) messages printed by query",
+	show_default=True,
+	type=click.IntRange(min=1),
+)
+@click.option(
+	"--profile",
+	is_flag=True,
+	help="Profile from the start: stage timings and memory snapshots (toggle with SIGUSR2)",
+)
+@click.option(
+	"--profile-cpu",
+	is_flag=True,
+	help="Sample the CPU usage while profiling (flame graph stacks)",
+)
+@click.option(
+	"--profile-dir",
+	help="Directory of the profile files (default: the log file directory)",
+	type=click.Path(file_okay=False),
+)
 @click.option("--log-file", help="Log file (if stated journal logging is disabled)")
 @click.option(
 	"--log-level",
@@ -49,9 +120,45 @@ def coro(f):
 	help="Systemd/journald integration: skip timestamp + prints to console",
 )
 @coro
-async def _main(config_file, create, log_file, log_level, print_logs, systemd_mode):
+async def _main(
+	config_file,
+	create,
+	archive,
+	replay,
+	replay_format,
+	replay_concurrency,
+	replay_batch_size,
+	query,
+	query_since,
+	query_limit,
+	profile,
+	profile_cpu,
+	profile_dir,
+	log_file,
+	log_level,
+	print_logs,
+	systemd_mode,
+):
 	try:
-		await run_service(config_file, create, log_file, log_level, print_logs, systemd_mode)
+		await run_service(
+			config_file,
+			create,
+			log_file,
+			log_level,
+			print_logs,
+			systemd_mode,
+			archive=archive,
+			replay=replay,
+			replay_format=replay_format,
+			replay_concurrency=replay_concurrency,
+			replay_batch_size=replay_batch_size,
+			query=query,
+			query_since=query_since,
+			query_limit=query_limit,
+			profile=profile,
+			profile_cpu=profile_cpu,
+			profile_dir=profile_dir,
+		)
 
 		# async with asyncio.TaskGroup() as tg:
 		#     tg.create_task(
@@ -73,10 +180,23 @@ async def run_service(
 	log_level: str | int,
 	print_logs: bool,
 	systemd_mode: bool,
+	archive: bool = False,
+	replay: str | None = None,
+	replay_format: str = ReplayFormat.AUTO,
+	replay_concurrency: int = Replayer.DEFAULT_CONCURRENCY,
+	replay_batch_size: int = Replayer.DEFAULT_BATCH_SIZE,
+	query: str | None = None,
+	query_since: datetime.datetime | None = None,
+	query_limit: int = TopicQuery.DEFAULT_LIMIT,
+	profile: bool = False,
+	profile_cpu: bool = False,
+	profile_dir: str | None = None,
 ):
 	"""Logs MQTT messages to a Postgres database."""
 
 	creator: SchemaCreator | None = None
+	database: Database | None = None
+	replayer: Replayer | None = None
 	runner: Runner | None = None
 
 	try:
@@ -91,11 +211,55 @@ async def run_service(
 
 		_logger.debug("start")
 
+		# every database target is handled one after another
 		if create:
-			creator = SchemaCreator(app_config.get_database_config())
-			await creator.connect()
-			await creator.create_schema()
+			for database_config in app_config.get_database_configs():
+				creator = SchemaCreator(database_config)
+				await creator.connect()
+				await creator.create_schema()
+				await creator.close()
+				creator = None
+		elif archive:
+			for database_config in app_config.get_database_configs():
+				database = Database(database_config)
+				await database.connect()
+				archiver = Archiver(database, database_config)
+				count = await archiver.archive()
+				_logger.info("%s: %d messages archived", database.name, count)
+				await database.close()
+				database = None
+		elif replay:
+			for database_config in app_config.get_database_configs():
+				replayer = Replayer(
+					app_config, replay_batch_size, replay_concurrency, database_config=database_config
+				)
+				await replayer.connect()
+				await replayer.replay(replay, replay_format)
+				await replayer.close()
+				replayer = None
+		elif query:
+			# the primary database target
+			database_config = app_config.get_database_config()
+			database = Database(database_config)
+			await database.connect()
+			if query_since is not None and query_since.tzinfo is None:
+				query_since = query_since.replace(tzinfo=Database.get_local_zone())
+			payloads = PayloadStore(database_config.get(DatabaseConfKey.PAYLOAD_STORE))
+			topic_query = TopicQuery(database, payloads.table_name if payloads else None)
+			rows = await topic_query.fetch(query, since=query_since, limit=query_limit)
+			for row in reversed(rows):
+				print(to_json(row))
+			await database.close()
+			database = None
 		else:
+			if not profile_dir:
+				log_file = log_file or app_config.get_logging_config().get("log_file")
+				profile_dir = os.path.dirname(log_file) if log_file else "."
+			profiler.configure(profile_dir or ".", cpu=profile_cpu)
+			profiler.install_signal_handler(asyncio.get_running_loop())
+			if profile:
+				profiler.start()
+
 			runner = Runner(app_config)
 			await runner.loop()
 	finally:
@@ -103,8 +267,13 @@ async def run_service(
 
 		if creator is not None:
 			await creator.close()
+		if database is not None:
+			await database.close()
+		if replayer is not None:
+			await replayer.close()
 		if runner is not None:
 			await runner.close()
+		profiler.stop()
 
 
 if __name__ == "__main__":
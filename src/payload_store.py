@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+import asyncpg
+
+from src.message_record import TEXT
+
+_logger = logging.getLogger(__name__)
+
+
+class PayloadStoreConfKey:
+	MIN_SIZE = "min_size"
+	TABLE = "table"
+	CACHE_SIZE = "cache_size"
+
+
+def get_payload_hash(text: str) -> bytes:
+	"""SHA-256 of the UTF-8 payload, in SQL: `sha256(convert_to(text, 'UTF8'))`"""
+	return hashlib.sha256(text.encode()).digest()
+
+
+class PayloadStore:
+	"""
+	Content addressed storage of large payloads (`payload_store`): texts of at least `min_size`
+	characters are stored once into the payloads table (keyed by hash), the journal rows keep the
+	hash (`payload_hash`) and no text.
+
+	Hashes stored recently are cached (LRU, `cache_size`), their payloads aren't sent again. The
+	cache entries expire after `CACHE_MAX_AGE_SECONDS`, so payloads pruned by the archiver (no
+	longer referenced) are inserted again. Sending a payload refreshes its `last_used` time, the
+	archiver prunes only payloads unused for longer than any cache entry lives: a row referencing
+	a cached hash may be committed after the prune checked the references.
+	"""
+
+	DEFAULT_MIN_SIZE = 1024
+	DEFAULT_TABLE_NAME = "journal_payloads"
+	DEFAULT_CACHE_SIZE = 10000
+	CACHE_MAX_AGE_SECONDS = 3600
+	PRUNE_MIN_UNUSED_SECONDS = 2 * CACHE_MAX_AGE_SECONDS  # margin for long transactions
+
+	HASH_COLUMN = "payload_hash"
+
+	def __init__(self, config: dict | None):
+		self._enabled = config is not None
+		config = config or {}
+		self._min_size: int = config.get(PayloadStoreConfKey.MIN_SIZE, self.DEFAULT_MIN_SIZE)
+		self._table_name: str = config.get(PayloadStoreConfKey.TABLE, self.DEFAULT_TABLE_NAME)
+		self._cache_size: int = config.get(PayloadStoreConfKey.CACHE_SIZE, self.DEFAULT_CACHE_SIZE)
+		self._cache: OrderedDict[bytes, float] = OrderedDict()  # hash: time stored
+		self._stored_count = 0
+		self._reused_count = 0
+
+	def __bool__(self) -> bool:
+		return self._enabled
+
+	@property
+	def table_name(self) -> str:
+		return self._table_name
+
+	@property
+	def stored_count(self) -> int:
+		"""Payloads sent to the database"""
+		return self._stored_count
+
+	@property
+	def reused_count(self) -> int:
+		"""Large payloads not sent again (known or repeated within the batch)"""
+		return self._reused_count
+
+	def is_known(self, payload_hash: bytes, now: float) -> bool:
+		stored = self._cache.get(payload_hash)
+		if stored is None:
+			return False
+		if now - stored > self.CACHE_MAX_AGE_SECONDS:
+			del self._cache[payload_hash]
+			return False
+		self._cache.move_to_end(payload_hash)
+		return True
+
+	def remember(self, payloads: dict[bytes, str], now: float | None = None) -> None:
+		"""Called after the payloads were committed."""
+		now = time.monotonic() if now is None else now
+		cache = self._cache
+		for payload_hash in payloads:
+			cache[payload_hash] = now
+			cache.move_to_end(payload_hash)
+		while len(cache) > self._cache_size:
+			cache.popitem(last=False)
+
+	def prepare(self, rows: list[tuple], now: float | None = None) -> tuple[list[tuple], dict]:
+		"""
+		Appends the payload hash to every row and removes the large texts. Returns the rows and
+		the payloads (hash: text) which have to be stored along with them.
+		"""
+		now = time.monotonic() if now is None else now
+		min_size = self._min_size
+		payloads: dict[bytes, str] = {}
+		prepared = []
+		for row in rows:
+			text = row[TEXT]
+			if len(text) < min_size:
+				prepared.append((*row, None))
+				continue
+			payload_hash = get_payload_hash(text)
+			if payload_hash in payloads or self.is_known(payload_hash, now):
+				self._reused_count += 1
+			else:
+				payloads[payload_hash] = text
+			end = TEXT + 1
+			prepared.append((*row[:TEXT], None, *row[end:], payload_hash))
+		return prepared, payloads
+
+	async def store(self, connection: asyncpg.Connection, payloads: dict[bytes, str]) -> None:
+		"""
+		Inserts new payloads (or refreshes their `last_used`), to be called within the transaction
+		of the journal rows.
+		"""
+		await connection.execute(
+			f"INSERT INTO {self._table_name} (hash, text) "
+			"SELECT * FROM unnest($1::bytea[], $2::text[]) "
+			"ON CONFLICT (hash) DO UPDATE SET last_used = NOW()",
+			list(payloads),
+			list(payloads.values()),
+		)
+		self._stored_count += len(payloads)
+
+	def get_prune_query(self, journal_table: str) -> str:
+		"""
+		Deletes payloads created before `$1` which are no longer referenced by the journal and
+		can't be cached by a writer (`PRUNE_MIN_UNUSED_SECONDS`).
+		"""
+		return (
+			f"DELETE FROM {self._table_name} p WHERE p.created < $1 "
+			f"AND p.last_used < NOW() - INTERVAL '{self.PRUNE_MIN_UNUSED_SECONDS} seconds' "
+			f"AND NOT EXISTS (SELECT 1 FROM {journal_table} j WHERE j.{self.HASH_COLUMN} = p.hash)"
+		)
@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import datetime
+import linecache
+import logging
+import os
+import signal
+import threading
+import time
+import tracemalloc
+
+_logger = logging.getLogger(__name__)
+
+
+class Stage:
+	RECEIVE = "receive"  # waiting for the next message included (no load: mostly idle time)
+	TRANSFORM = "transform"
+	FILTER = "filter"
+	ENQUEUE = "enqueue"
+	COPY = "copy"  # per batch
+
+	ALL = [RECEIVE, TRANSFORM, FILTER, ENQUEUE, COPY]
+
+
+class CpuSampler:
+	"""
+	Sampling CPU profiler: a `SIGPROF` timer (process CPU time) records the Python stack of the main
+	thread every `interval` seconds. Stacks are written in the collapsed format of flame graph tools
+	(`flamegraph.pl`, speedscope).
+	"""
+
+	def __init__(self, interval: float):
+		self._interval = interval
+		self._stacks: collections.Counter[tuple[str, ...]] = collections.Counter()
+
+	@property
+	def sample_count(self) -> int:
+		return sum(self._stacks.values())
+
+	def start(self) -> None:
+		signal.signal(signal.SIGPROF, self._sample)
+		signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+
+	def stop(self) -> None:
+		signal.setitimer(signal.ITIMER_PROF, 0)
+		signal.signal(signal.SIGPROF, signal.SIG_IGN)
+
+	def _sample(self, _signum, frame) -> None:
+		stack = []
+		while frame is not None:
+			code = frame.f_code
+			stack.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+			frame = frame.f_back
+		self._stacks[tuple(reversed(stack))] += 1
+
+	def write(self, path: str) -> None:
+		with open(path, "w") as file:
+			for stack, count in self._stacks.most_common():
+				file.write(f"{';'.join(stack)} {count}\n")
+
+
+class Profiler:
+	"""
+	Diagnoses throughput and memory problems of the running service. Disabled it costs one
+	attribute check per message.
+
+	Enabled (`--profile` or toggled by `SIGUSR2`) it
+	- times the pipeline stages (`Stage`) and logs a summary every `interval` seconds,
+	- writes the top `top_count` allocation sites (and their growth) of periodic `tracemalloc`
+	  snapshots into `directory`,
+	- optionally samples the CPU usage (`cpu`), written into `directory` on every summary.
+
+	There is one profiler per process (`profiler`).
+	"""
+
+	DEFAULT_INTERVAL_SECONDS = 60
+	DEFAULT_TOP_COUNT = 20
+	CPU_SAMPLE_INTERVAL_SECONDS = 0.005
+	TOGGLE_SIGNAL = signal.SIGUSR2
+
+	def __init__(self):
+		self.enabled = False  # read per message
+		self._directory = "."
+		self._cpu = False
+		self._interval = self.DEFAULT_INTERVAL_SECONDS
+		self._top_count = self.DEFAULT_TOP_COUNT
+
+		self._start_ns = 0
+		self._session = ""
+		# stage: [count, total ns, max ns]
+		self._stages: dict[str, list[int]] = {stage: [0, 0, 0] for stage in Stage.ALL}
+		self._sampler: CpuSampler | None = None
+		self._snapshot: tracemalloc.Snapshot | None = None
+		self._tracing = False  # `tracemalloc` started by the profiler (not by `PYTHONTRACEMALLOC`)
+		self._report_lock = threading.Lock()  # a periodic report may still run in its thread
+
+	def configure(
+		self,
+		directory: str,
+		cpu: bool = False,
+		interval: float = DEFAULT_INTERVAL_SECONDS,
+		top_count: int = DEFAULT_TOP_COUNT,
+	) -> None:
+		self._directory = directory
+		self._cpu = cpu
+		self._interval = interval
+		self._top_count = top_count
+
+	def install_signal_handler(self, loop: asyncio.AbstractEventLoop) -> None:
+		loop.add_signal_handler(self.TOGGLE_SIGNAL, self.toggle)
+
+	def toggle(self) -> None:
+		if self.enabled:
+			self.stop()
+		else:
+			self.start()
+
+	def start(self) -> None:
+		if self.enabled:
+			return
+		os.makedirs(self._directory, exist_ok=True)
+		self._session = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+		self._stages = {stage: [0, 0, 0] for stage in Stage.ALL}
+		self._start_ns = time.perf_counter_ns()
+		self._snapshot = None
+		if not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self._tracing = True
+		if self._cpu:
+			self._sampler = CpuSampler(self.CPU_SAMPLE_INTERVAL_SECONDS)
+			self._sampler.start()
+		self.enabled = True
+		_logger.info("profiling started (output: %s)", self._directory)
+
+	def stop(self) -> None:
+		if not self.enabled:
+			return
+		self.enabled = False
+		self.report()
+		if self._sampler is not None:
+			self._sampler.stop()
+			self._sampler = None
+		with self._report_lock:
+			if self._tracing:
+				tracemalloc.stop()
+				self._tracing = False
+		self._snapshot = None
+		_logger.info("profiling stopped")
+
+	def lap(self, stage: str, start_ns: int) -> int:
+		"""Adds the time since `start_ns` to the stage, returns now (start of the next stage)."""
+		now = time.perf_counter_ns()
+		if start_ns >= self._start_ns:  # the start of a stage may precede enabling
+			entry = self._stages[stage]
+			elapsed = now - start_ns
+			entry[0] += 1
+			entry[1] += elapsed
+			if elapsed > entry[2]:
+				entry[2] = elapsed
+		return now
+
+	def get_stage_summary(self) -> str:
+		parts = []
+		for stage, (count, total_ns, max_ns) in self._stages.items():
+			if count:
+				parts.append(
+					f"{stage}: {count} x {total_ns / count / 1000:.1f} µs "
+					f"(max {max_ns / 1000:.0f} µs, total {total_ns / 1e9:.2f} s)"
+				)
+		return ", ".join(parts) or "no samples"
+
+	def report(self) -> None:
+		"""Logs (and resets) the stage timings, writes the snapshots. Blocking, see `run`."""
+		with self._report_lock:
+			_logger.info("profile: %s", self.get_stage_summary())
+			self._stages = {stage: [0, 0, 0] for stage in Stage.ALL}
+			try:
+				self._write_memory_snapshot()
+				sampler = self._sampler
+				if sampler is not None:
+					sampler.write(self._get_path("cpu", "folded"))
+			except OSError as ex:
+				_logger.error("writing profile failed: %s", ex)
+
+	def _get_path(self, kind: str, extension: str) -> str:
+		return os.path.join(self._directory, f"profile-{self._session}-{kind}.{extension}")
+
+	def _write_memory_snapshot(self) -> None:
+		if not tracemalloc.is_tracing():
+			return
+		snapshot = tracemalloc.take_snapshot().filter_traces(
+			[tracemalloc.Filter(False, tracemalloc.__file__)]
+		)
+		now = datetime.datetime.now().isoformat(timespec="seconds")
+		top_count = self._top_count
+		with open(self._get_path("memory", "txt"), "a") as file:
+			file.write(f"# {now}, traced: {tracemalloc.get_traced_memory()[0]} bytes\n")
+			if self._snapshot is not None:
+				file.write(f"# top {top_count} growth since the previous snapshot\n")
+				for diff in snapshot.compare_to(self._snapshot, "lineno")[:top_count]:
+					file.write(f"{diff}\n")
+			file.write(f"# top {top_count} allocations\n")
+			for stat in snapshot.statistics("lineno")[:top_count]:
+				frame = stat.traceback[0]
+				line = linecache.getline(frame.filename, frame.lineno).strip()
+				file.write(f"{stat}  # {line}\n")
+			file.write("\n")
+		self._snapshot = snapshot
+
+	async def run(self) -> None:
+		while True:
+			await asyncio.sleep(self._interval)
+			if self.enabled:
+				# snapshots of large heaps take a while, the messages keep flowing meanwhile
+				await asyncio.to_thread(self.report)
+
+
+profiler = Profiler()
@@ -0,0 +1,191 @@
+import asyncio
+import collections
+import logging
+import time
+from collections.abc import Callable
+
+from src.message_record import TOPIC, MessageRecord
+from src.topic_filter import TopicRouter
+
+_logger = logging.getLogger(__name__)
+
+
+class RateLimitConfKey:
+	TOPIC = "topic"
+	RATE = "rate"
+	BURST = "burst"
+	MODE = "mode"
+
+
+class RateLimitMode:
+	DROP = "drop"  # excess messages are dropped
+	LATEST = "latest"  # excess messages are collapsed, the latest is stored with the next token
+
+	ALL = [DROP, LATEST]
+
+
+class Admission:
+	"""Outcomes of `RateLimiter.admit`"""
+
+	STORE = "store"  # queue the message now
+	HOLD = "hold"  # held back (mode "latest"), queued by `release` or shed later
+	DROP = "drop"
+
+
+class RateLimit:
+	__slots__ = ("topic", "rate", "burst", "mode")
+
+	def __init__(self, config: dict):
+		self.topic: str = config[RateLimitConfKey.TOPIC]
+		self.rate: float = config[RateLimitConfKey.RATE]
+		self.burst: float = config.get(RateLimitConfKey.BURST, max(self.rate, 1))
+		self.mode: str = config.get(RateLimitConfKey.MODE, RateLimitMode.DROP)
+
+
+class RateLimiter:
+	"""
+	Per topic token buckets, configured by topic filters (first matching rule wins).
+
+	Every topic matching a rule gets a bucket of its own: `burst` tokens, refilled by `rate` tokens
+	per second, one token per message. The bucket state is bounded by `max_topics`, the least
+	recently used buckets are evicted first (and start over with a full bucket). Shed messages are
+	counted per topic apart from the buckets (evictions don't lose them) and logged periodically,
+	the counts start over after every log. Held messages (mode "latest") which get shed later on
+	(replaced, outdated or evicted) are passed to `on_shed`, e.g. to acknowledge them.
+	"""
+
+	DEFAULT_MAX_TOPICS = 100000
+	RELEASE_INTERVAL_SECONDS = 0.1
+	LOG_INTERVAL_SECONDS = 60
+	LOG_TOP_TOPICS = 5
+
+	# bucket state: [tokens, last refill (monotonic)]
+	TOKENS = 0
+	STAMP = 1
+
+	OTHER_TOPIC = "#"  # shed counts beyond `max_topics`
+
+	def __init__(
+		self,
+		rules: list[dict] | None,
+		max_topics: int = DEFAULT_MAX_TOPICS,
+		on_shed: Callable[[MessageRecord], None] | None = None,
+	):
+		self._router: TopicRouter[RateLimit] = TopicRouter(
+			[(rule[RateLimitConfKey.TOPIC], RateLimit(rule)) for rule in rules or []]
+		)
+		self._max_topics = max_topics
+		# least recently used first
+		self._buckets: collections.OrderedDict[str, list] = collections.OrderedDict()
+		self._shed_counts: dict[str, int] = {}  # since the last log
+		self._held: dict[str, MessageRecord] = {}  # mode "latest": the latest shed message per topic
+		self._shed_total = 0
+		self._on_shed = on_shed
+
+	def __bool__(self) -> bool:
+		return bool(self._router)
+
+	@property
+	def shed_total(self) -> int:
+		return self._shed_total
+
+	@property
+	def bucket_count(self) -> int:
+		return len(self._buckets)
+
+	def get_shed_counts(self) -> dict[str, int]:
+		"""Shed messages per topic since the last log"""
+		return dict(self._shed_counts)
+
+	def _take_token(self, topic: str, rule: RateLimit, now: float) -> list | None:
+		"""Returns `None` if a token was available, otherwise the bucket state."""
+		buckets = self._buckets
+		state = buckets.get(topic)
+		if state is None:
+			if len(buckets) >= self._max_topics:
+				evicted, _ = buckets.popitem(last=False)
+				self._shed_held(evicted)
+			buckets[topic] = [rule.burst - 1, now]
+			return None
+
+		buckets.move_to_end(topic)
+		tokens = min(rule.burst, state[self.TOKENS] + (now - state[self.STAMP]) * rule.rate)
+		state[self.STAMP] = now
+		if tokens >= 1:
+			state[self.TOKENS] = tokens - 1
+			return None
+
+		state[self.TOKENS] = tokens
+		return state
+
+	def admit(self, record: MessageRecord, now: float | None = None) -> str:
+		"""Returns the `Admission` of the message."""
+		topic = record[TOPIC]
+		rule = self._router.lookup(topic)
+		if rule is None:
+			return Admission.STORE
+
+		state = self._take_token(topic, rule, time.monotonic() if now is None else now)
+		if state is None:
+			if rule.mode == RateLimitMode.LATEST:
+				self._shed_held(topic)  # an older held message must not be stored after this one
+			return Admission.STORE
+
+		if rule.mode == RateLimitMode.LATEST:
+			self._shed_held(topic)
+			self._held[topic] = record
+			return Admission.HOLD
+
+		self._count_shed(topic)
+		return Admission.DROP
+
+	def _shed_held(self, topic: str) -> None:
+		held = self._held.pop(topic, None)
+		if held is not None:
+			self._count_shed(topic)
+			if self._on_shed is not None:
+				self._on_shed(held)
+
+	def _count_shed(self, topic: str) -> None:
+		counts = self._shed_counts
+		if topic not in counts and len(counts) >= self._max_topics:
+			topic = self.OTHER_TOPIC
+		counts[topic] = counts.get(topic, 0) + 1
+		self._shed_total += 1
+
+	def release(self, now: float | None = None) -> list[MessageRecord]:
+		"""Returns the held messages (mode "latest") whose buckets got a token meanwhile."""
+		now = time.monotonic() if now is None else now
+		released = []
+		for topic, record in list(self._held.items()):
+			if self._take_token(topic, self._router.lookup(topic), now) is None:
+				del self._held[topic]
+				released.append(record)
+		return released
+
+	async def run(self, put: Callable[[MessageRecord], None]) -> None:
+		next_log = time.monotonic() + self.LOG_INTERVAL_SECONDS
+		logged_total = 0
+		while True:
+			await asyncio.sleep(self.RELEASE_INTERVAL_SECONDS)
+			for record in self.release():
+				put(record)
+
+			if time.monotonic() >= next_log:
+				next_log += self.LOG_INTERVAL_SECONDS
+				if self._shed_total > logged_total:
+					logged_total = self._shed_total
+					self._log_shed_counts()
+
+	def _log_shed_counts(self) -> None:
+		shed_counts = sorted(self.get_shed_counts().items(), key=lambda item: item[1], reverse=True)
+		top_topics = ", ".join(
+			f"{topic}: {count}" for topic, count in shed_counts[: self.LOG_TOP_TOPICS]
+		)
+		_logger.warning(
+			"rate limits: %d messages shed in total (%d topics limited; top: %s)",
+			self._shed_total,
+			len(shed_counts),
+			top_topics,
+		)
+		self._shed_counts = {}
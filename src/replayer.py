@@ -0,0 +1,267 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import logging
+import time
+from collections.abc import Iterator
+
+from src.app_config import AppConfig
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.message_record import TOPIC, MessageRecord, TopicCache
+from src.subscription_filter import SubscriptionFilter
+
+_logger = logging.getLogger(__name__)
+
+
+class ReplayFormat:
+	AUTO = "auto"
+	MOSQUITTO = "mosquitto"  # `mosquitto_sub -v`: "<topic> <payload>"
+	MOSQUITTO_TS = "mosquitto-ts"  # `mosquitto_sub -F "%U %t %p"`: "<unix time> <topic> <payload>"
+	JSONL = "jsonl"  # one JSON object per line: topic, text/payload, qos, retain, time
+	CSV = "csv"  # archive files, see `Archiver`
+	PARQUET = "parquet"  # archive files, requires `pyarrow`
+
+	ALL = [AUTO, MOSQUITTO, MOSQUITTO_TS, JSONL, CSV, PARQUET]
+
+	@classmethod
+	def detect(cls, file: str) -> str:
+		name = file[:-3] if file.endswith(".gz") else file
+		if name.endswith(".parquet"):
+			return cls.PARQUET
+		if name.endswith(".csv"):
+			return cls.CSV
+		if name.endswith(".jsonl") or name.endswith(".json"):
+			return cls.JSONL
+		return cls.MOSQUITTO
+
+
+class Replayer:
+	"""
+	Loads message dumps into the database without a broker.
+
+	Messages run through the same subscription filter and `BatchWriter` transformation as received
+	messages. Batches are stored by parallel COPY over `concurrency` pool connections.
+
+	Malformed lines (rows) are skipped and counted, so a replay doesn't stop halfway with its first
+	batches already committed.
+	"""
+
+	DEFAULT_BATCH_SIZE = 10000
+	DEFAULT_CONCURRENCY = 4
+	PROGRESS_SECONDS = 10
+	MAX_LOGGED_INVALID = 100
+	# OverflowError, OSError: timestamps out of range
+	INVALID_ERRORS = (ValueError, TypeError, KeyError, AttributeError, OverflowError, OSError)
+
+	def __init__(
+		self,
+		config: AppConfig,
+		batch_size: int = DEFAULT_BATCH_SIZE,
+		concurrency: int = DEFAULT_CONCURRENCY,
+		database_config: dict | None = None,
+	):
+		database_config = config.get_database_config() if database_config is None else database_config
+		self._database = Database(database_config)
+		# a backfill doesn't trigger jobs
+		self._writer = BatchWriter(
+			self._database,
+			{key: value for key, value in database_config.items() if key != DatabaseConfKey.JOBS},
+		)
+		self._filters = [SubscriptionFilter(mqtt_config) for mqtt_config in config.get_mqtt_configs()]
+		self._topic_cache = TopicCache()
+		self._batch_size = batch_size
+		self._concurrency = concurrency
+
+		self._stored_count = 0
+		self._skipped_count = 0
+		self._invalid_count = 0
+
+	@property
+	def invalid_count(self) -> int:
+		"""Malformed lines (rows) skipped by the last replay"""
+		return self._invalid_count
+
+	async def connect(self) -> None:
+		await self._database.connect()
+
+	async def close(self) -> None:
+		await self._database.close()
+
+	def _accepts(self, topic: str) -> bool:
+		"""Accepted by the subscriptions of any broker."""
+		return any(subscription_filter.accepts(topic) for subscription_filter in self._filters)
+
+	async def replay(self, file: str, file_format: str = ReplayFormat.AUTO) -> int:
+		if file_format == ReplayFormat.AUTO:
+			file_format = ReplayFormat.detect(file)
+		_logger.info("replaying %s (format: %s)", file, file_format)
+
+		self._stored_count = 0
+		self._skipped_count = 0
+		self._invalid_count = 0
+		queue: asyncio.Queue[list[MessageRecord] | None] = asyncio.Queue(maxsize=self._concurrency * 2)
+		start_time = time.monotonic()
+
+		async def store_batches():
+			while (batch := await queue.get()) is not None:
+				await self._writer.flush(batch)
+				self._stored_count += len(batch)
+
+		async with asyncio.TaskGroup() as tg:
+			workers = [tg.create_task(store_batches()) for _ in range(self._concurrency)]
+
+			progress_time = start_time + self.PROGRESS_SECONDS
+			batch = []
+			for record in self.read_records(file, file_format):
+				if not self._accepts(record[TOPIC]):
+					self._skipped_count += 1
+					continue
+
+				batch.append(record)
+				if len(batch) >= self._batch_size:
+					await queue.put(batch)
+					batch = []
+
+					if time.monotonic() >= progress_time:
+						progress_time += self.PROGRESS_SECONDS
+						self._log_progress(start_time)
+
+			if batch:
+				await queue.put(batch)
+			for _ in workers:
+				await queue.put(None)
+
+		self._log_progress(start_time)
+		return self._stored_count
+
+	def _log_progress(self, start_time: float) -> None:
+		duration = max(time.monotonic() - start_time, 1e-6)
+		_logger.info(
+			"replay: %d messages stored, %d skipped, %d invalid (%.0f rows/s)",
+			self._stored_count,
+			self._skipped_count,
+			self._invalid_count,
+			self._stored_count / duration,
+		)
+
+	def read_records(self, file: str, file_format: str) -> Iterator[MessageRecord]:
+		"""Yields records as queued by the listener."""
+		if file_format == ReplayFormat.PARQUET:
+			yield from self._read_parquet(file)
+			return
+
+		opener = gzip.open if file.endswith(".gz") else open
+		with opener(file, "rt", encoding="utf-8", newline="") as f:
+			if file_format == ReplayFormat.CSV:
+				yield from self._read_csv(f)
+			elif file_format == ReplayFormat.JSONL:
+				yield from self._read_jsonl(f)
+			else:
+				yield from self._read_mosquitto(f, with_time=file_format == ReplayFormat.MOSQUITTO_TS)
+
+	def _skip_invalid(self, line_number: int, ex: Exception) -> None:
+		self._invalid_count += 1
+		if self._invalid_count <= self.MAX_LOGGED_INVALID:
+			_logger.warning("replay: line %d skipped (%s: %s)", line_number, type(ex).__name__, ex)
+		elif self._invalid_count == self.MAX_LOGGED_INVALID + 1:
+			_logger.warning("replay: further invalid lines are only counted")
+
+	def _read_mosquitto(self, lines, with_time: bool) -> Iterator[MessageRecord]:
+		now = self._database._now()
+		tz = now.tzinfo
+		for line_number, line in enumerate(lines, 1):
+			line = line.rstrip("\r\n")
+			if not line:
+				continue
+			if with_time:
+				timestamp, topic, text = (line.split(" ", 2) + ["", ""])[:3]
+				try:
+					message_time = datetime.datetime.fromtimestamp(float(timestamp), tz=tz)
+				except self.INVALID_ERRORS as ex:
+					self._skip_invalid(line_number, ex)
+					continue
+			else:
+				topic, _, text = line.partition(" ")
+				message_time = now
+			yield self._topic_cache.get(topic), text, 0, False, message_time
+
+	def _read_jsonl(self, lines) -> Iterator[MessageRecord]:
+		now = self._database._now()
+		for line_number, line in enumerate(lines, 1):
+			if not line.strip():
+				continue
+			try:
+				data = json.loads(line)
+				text = data.get("text", data.get("payload"))
+				if not isinstance(text, str):
+					text = json.dumps(text)
+				record = (
+					self._topic_cache.get(self._check_topic(data["topic"])),
+					text,
+					int(data.get("qos") or 0),
+					bool(data.get("retain")),
+					self._parse_time(data.get("time"), now),
+				)
+			except self.INVALID_ERRORS as ex:  # JSONDecodeError is a ValueError
+				self._skip_invalid(line_number, ex)
+				continue
+			yield record
+
+	def _read_csv(self, lines) -> Iterator[MessageRecord]:
+		now = self._database._now()
+		reader = csv.DictReader(lines)
+		for row in reader:
+			try:
+				if row["text"] is None:
+					raise ValueError("missing columns")
+				record = (
+					self._topic_cache.get(self._check_topic(row["topic"])),
+					row["text"],
+					int(row.get("qos") or 0),
+					row.get("retain") in ("1", "True", "true"),
+					self._parse_time(row.get("time"), now),
+				)
+			except self.INVALID_ERRORS as ex:
+				self._skip_invalid(reader.line_num, ex)
+				continue
+			yield record
+
+	def _read_parquet(self, file: str) -> Iterator[MessageRecord]:
+		try:
+			import pyarrow.parquet
+		except ImportError as ex:
+			raise RuntimeError(
+				f"replay format '{ReplayFormat.PARQUET}' requires the package 'pyarrow'!"
+			) from ex
+
+		now = self._database._now()
+		parquet_file = pyarrow.parquet.ParquetFile(file)
+		for chunk in parquet_file.iter_batches(batch_size=self._batch_size):
+			for row in chunk.to_pylist():
+				yield (
+					self._topic_cache.get(row["topic"]),
+					row["text"],
+					row.get("qos") or 0,
+					bool(row.get("retain")),
+					row.get("time") or now,
+				)
+
+	@staticmethod
+	def _check_topic(topic) -> str:
+		if not isinstance(topic, str) or not topic:
+			raise ValueError(f"invalid topic {topic!r}")
+		return topic
+
+	@classmethod
+	def _parse_time(cls, value, default: datetime.datetime) -> datetime.datetime:
+		if value is None or value == "":
+			return default
+		if isinstance(value, (int, float)):
+			return datetime.datetime.fromtimestamp(value, tz=default.tzinfo)
+		parsed = datetime.datetime.fromisoformat(value)
+		if parsed.tzinfo is None:
+			parsed = parsed.replace(tzinfo=default.tzinfo)
+		return parsed
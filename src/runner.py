@@ -2,14 +2,14 @@ import logging
 import time
 
 from src.app_config import AppConfig
-from src.mqtt_listener import MqttListener
+from src.mqtt_listener import MqttListeners
 
 logging.getLogger("asyncio").setLevel(logging.INFO)
 
 
 class Runner:
 	def __init__(self, app_config: AppConfig):
-		self._mqtt = MqttListener(app_config)
+		self._mqtt = MqttListeners(app_config)
 
 	async def loop(self):
 		"""endless loop"""
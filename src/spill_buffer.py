@@ -0,0 +1,159 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+from collections.abc import Iterator
+
+from src.message_record import (
+	BROKER,
+	DEDUP_KEY,
+	PUBLISHED,
+	QOS,
+	RETAIN,
+	TEXT,
+	TIME,
+	TOPIC,
+	MessageRecord,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+class SpillBuffer:
+	"""
+	Queue overflow on disk (JSON lines), so a slow or unreachable database doesn't grow the memory.
+
+	`take` hands the spilled records over for storing: the file is renamed and new records go into
+	a new file. A file left behind by a previous run is stored first (at least once: chunks which
+	were stored before a failure are stored again).
+
+	Besides the journal columns the publisher time, the dedup key and the broker are kept (not the
+	acknowledgement, it belongs to a connection). Every record is written through to the OS (line
+	buffered, it survives a crash of the process). `run_sync` fsyncs the file every
+	`FLUSH_INTERVAL_SECONDS` in a thread, so the receive loop never waits for the disk; `close`
+	fsyncs it too.
+	"""
+
+	FLUSH_INTERVAL_SECONDS = 1.0
+
+	def __init__(self, spill_dir: str, name: str):
+		os.makedirs(spill_dir, exist_ok=True)
+		self._path = os.path.join(spill_dir, f"{name}.jsonl")
+		self._taken_path = self._path + ".taken"
+		self._file = None
+		self._count = 0
+		self._unsynced = False
+
+		if os.path.exists(self._path):
+			with open(self._path, encoding="utf-8") as f:
+				self._count = sum(1 for _ in f)
+			_logger.info("spill buffer %s: %d messages left from previous run", self._path, self._count)
+
+	def __len__(self) -> int:
+		return self._count
+
+	@property
+	def pending(self) -> bool:
+		return self._count > 0 or os.path.exists(self._taken_path)
+
+	def append(self, record: MessageRecord) -> None:
+		if self._file is None:
+			self._file = open(self._path, "a", buffering=1, encoding="utf-8")
+		self._file.write(json.dumps(self.to_line(record)))
+		self._file.write("\n")
+		self._count += 1
+		self._unsynced = True
+
+	async def run_sync(self) -> None:
+		while True:
+			await asyncio.sleep(self.FLUSH_INTERVAL_SECONDS)
+			await self.sync()
+
+	async def sync(self) -> None:
+		"""Writes the appended records through to the disk, without blocking the event loop."""
+		if self._file is None or not self._unsynced:
+			return
+		self._unsynced = False
+		self._file.flush()
+		fd = os.dup(self._file.fileno())  # the file may be closed (taken) meanwhile
+		await asyncio.to_thread(self._fsync, fd)
+
+	@staticmethod
+	def _fsync(fd: int) -> None:
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+	def flush(self) -> None:
+		"""Writes the appended records through to the disk (blocking)."""
+		if self._file is not None:
+			self._file.flush()
+			os.fsync(self._file.fileno())
+			self._unsynced = False
+
+	@staticmethod
+	def to_line(record: MessageRecord) -> list:
+		line = [record[TOPIC], record[TEXT], record[QOS], record[RETAIN], record[TIME].isoformat()]
+		if len(record) > PUBLISHED:
+			published = record[PUBLISHED]
+			dedup_key = record[DEDUP_KEY] if len(record) > DEDUP_KEY else None
+			line += [
+				published.isoformat() if published is not None else None,
+				dedup_key.hex() if dedup_key is not None else None,
+				record[BROKER] if len(record) > BROKER else None,
+			]
+		return line
+
+	@staticmethod
+	def from_line(line: list) -> MessageRecord:
+		topic, text, qos, retain, message_time = line[:PUBLISHED]
+		record = (topic, text, qos, retain, datetime.datetime.fromisoformat(message_time))
+		if len(line) > PUBLISHED:  # publisher time, dedup key and broker
+			published, dedup_key, broker = line[PUBLISHED:]
+			record += (
+				datetime.datetime.fromisoformat(published) if published is not None else None,
+				None,  # the acknowledgement of the former connection
+				bytes.fromhex(dedup_key) if dedup_key is not None else None,
+				broker,
+			)
+		return record
+
+	def take(self) -> str | None:
+		"""Returns the path of a file to store (and `remove` afterwards)."""
+		if os.path.exists(self._taken_path):
+			return self._taken_path
+		if not self._count:
+			return None
+
+		self.close()
+		os.replace(self._path, self._taken_path)
+		self._count = 0
+		return self._taken_path
+
+	@staticmethod
+	def read_chunks(path: str, chunk_size: int) -> Iterator[list[MessageRecord]]:
+		chunk = []
+		with open(path, encoding="utf-8") as f:
+			for line in f:
+				try:
+					chunk.append(SpillBuffer.from_line(json.loads(line)))
+				except (ValueError, TypeError):
+					_logger.warning("spill buffer %s: skipped invalid line (%s)", path, line[:100])
+					continue
+				if len(chunk) >= chunk_size:
+					yield chunk
+					chunk = []
+		if chunk:
+			yield chunk
+
+	@staticmethod
+	def remove(path: str) -> None:
+		os.remove(path)
+
+	def close(self) -> None:
+		if self._file is not None:
+			self.flush()
+			self._file.close()
+			self._file = None
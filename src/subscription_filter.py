@@ -0,0 +1,42 @@
+import re
+
+from src.constants import MqttConfKey
+from src.topic_filter import TopicRouter
+
+SHARED_PREFIX = "$share/"
+
+
+def get_topic_filter(subscription: str) -> str:
+	"""The topic filter of a shared subscription (`$share/<group>/<filter>`, MQTT 5)"""
+	if subscription.startswith(SHARED_PREFIX):
+		parts = subscription.split("/", 2)
+		if len(parts) == 3:
+			return parts[2]
+	return subscription
+
+
+class SubscriptionFilter:
+	"""Subscriptions and skip regexes of the `mqtt` configuration."""
+
+	def __init__(self, mqtt_config: dict):
+		skip_subscription_regexes = mqtt_config.get(MqttConfKey.SKIP_SUBSCRIPTION_REGEXES) or []
+		self._skip_subscription_regexes = [re.compile(regex) for regex in set(skip_subscription_regexes)]
+
+		subscriptions = mqtt_config.get(MqttConfKey.SUBSCRIPTIONS) or []
+		valid_subscriptions = [sub for sub in subscriptions if self.is_valid_topic(sub)]
+		self._subscriptions = list(set(valid_subscriptions))
+
+		self._router: TopicRouter[bool] = TopicRouter(
+			[(get_topic_filter(sub), True) for sub in self._subscriptions], default=False
+		)
+
+	@property
+	def subscriptions(self) -> list[str]:
+		return self._subscriptions
+
+	def is_valid_topic(self, topic: str) -> bool:
+		return not any(regex.match(topic) for regex in self._skip_subscription_regexes)
+
+	def accepts(self, topic: str) -> bool:
+		"""A message topic is accepted if it's covered by a subscription and not skipped."""
+		return self._router.lookup(topic) and self.is_valid_topic(topic)
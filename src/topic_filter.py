@@ -0,0 +1,101 @@
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class TopicFilter:
+	"""MQTT topic filter supporting the single level ("+") and multi level ("#") wildcards."""
+
+	def __init__(self, topic_filter: str):
+		if not topic_filter:
+			raise ValueError("empty topic filter!")
+
+		self._filter = topic_filter
+		self._levels = topic_filter.split("/")
+
+		for index, level in enumerate(self._levels):
+			if "#" in level and (level != "#" or index != len(self._levels) - 1):
+				raise ValueError(f"'#' must be the last level of a topic filter ({topic_filter})!")
+			if "+" in level and level != "+":
+				raise ValueError(f"'+' must occupy an entire topic level ({topic_filter})!")
+
+		self._has_wildcards = "+" in self._levels or "#" in self._levels
+
+	@property
+	def filter(self) -> str:
+		return self._filter
+
+	@property
+	def levels(self) -> list[str]:
+		return self._levels
+
+	@property
+	def has_wildcards(self) -> bool:
+		return self._has_wildcards
+
+	def matches(self, topic: str) -> bool:
+		if not self._has_wildcards:
+			return topic == self._filter
+
+		topic_levels = topic.split("/")
+		if topic_levels[0].startswith("$") and not self._levels[0].startswith("$"):
+			return False  # MQTT spec: wildcards don't match system topics
+
+		for index, level in enumerate(self._levels):
+			if level == "#":
+				return True
+			if index >= len(topic_levels):
+				return False
+			if level != "+" and level != topic_levels[index]:
+				return False
+
+		return len(topic_levels) == len(self._levels)
+
+	def __repr__(self) -> str:
+		return f"TopicFilter({self._filter!r})"
+
+
+class TopicRouter(Generic[T]):
+	"""
+	Maps topics to the target of the first matching topic filter.
+
+	Lookups are memorized per topic. The cache is dropped as a whole once it reaches `cache_size`
+	entries, so memory stays bounded even with a huge number of distinct topics.
+	"""
+
+	DEFAULT_CACHE_SIZE = 65536
+
+	def __init__(
+		self,
+		routes: list[tuple[str, T]],
+		default: T | None = None,
+		cache_size: int = DEFAULT_CACHE_SIZE,
+	):
+		self._routes = [(TopicFilter(topic_filter), target) for topic_filter, target in routes]
+		self._default = default
+		self._cache_size = cache_size
+		self._cache: dict[str, T | None] = {}
+
+	@property
+	def routes(self) -> list[tuple[TopicFilter, T]]:
+		return self._routes
+
+	def __bool__(self) -> bool:
+		return bool(self._routes)
+
+	def lookup(self, topic: str) -> T | None:
+		try:
+			return self._cache[topic]
+		except KeyError:
+			pass
+
+		target = self._default
+		for topic_filter, route_target in self._routes:
+			if topic_filter.matches(topic):
+				target = route_target
+				break
+
+		if len(self._cache) >= self._cache_size:
+			self._cache.clear()
+		self._cache[topic] = target
+		return target
@@ -0,0 +1,110 @@
+import datetime
+
+import asyncpg
+
+from src.database import Database
+from src.payload_store import PayloadStore
+from src.topic_filter import TopicFilter
+
+TOPIC_LEVELS_COLUMN = "topic_levels"
+
+
+def get_topic_condition(
+	topic_filter: str, column: str = TOPIC_LEVELS_COLUMN, first_parameter: int = 1
+) -> tuple[str, list]:
+	"""
+	Translates an MQTT topic filter into a condition on the topic levels array (`text[]`).
+
+	The literal levels are looked up by the GIN index (`@>`), their positions and the number of
+	levels are rechecked on the candidates. Filters without literal levels (e.g. "+/+") can't use
+	the index.
+
+	Returns the SQL condition and its parameters (numbered from `first_parameter`).
+	"""
+	levels = TopicFilter(topic_filter).levels
+	multi_level = levels[-1] == "#"
+	if multi_level:
+		levels = levels[:-1]
+
+	conditions = []
+	parameters = []
+
+	def add_parameter(value) -> str:
+		parameters.append(value)
+		return f"${first_parameter + len(parameters) - 1}"
+
+	literals = [level for level in levels if level != "+"]
+	if literals:
+		conditions.append(f"{column} @> {add_parameter(literals)}::text[]")
+	for index, level in enumerate(levels, start=1):
+		if level != "+":
+			conditions.append(f"{column}[{index}] = {add_parameter(level)}")
+
+	if not multi_level:
+		conditions.append(f"cardinality({column}) = {len(levels)}")
+	elif levels:
+		conditions.append(f"cardinality({column}) >= {len(levels)}")  # "a/#" matches "a" too
+	else:
+		conditions.append(f"{column} IS NOT NULL")
+
+	if not levels or levels[0] == "+":
+		conditions.append(f"{column}[1] NOT LIKE '$%'")  # wildcards don't match system topics
+
+	return " AND ".join(conditions), parameters
+
+
+class TopicQuery:
+	"""
+	Fetches stored messages by MQTT topic filter, served by the GIN index on `topic_levels`.
+
+	Only rows stored with `topic_levels` enabled are found. Older rows can be filled once:
+	`UPDATE journal SET topic_levels = string_to_array(topic, '/') WHERE topic_levels IS NULL`.
+
+	With `payload_table` (see `payload_store`) the texts of large payloads are joined.
+	"""
+
+	DEFAULT_LIMIT = 100
+
+	def __init__(self, database: Database, payload_table: str | None = None):
+		self._database = database
+		self._payload_table = payload_table
+
+	def get_query(
+		self,
+		topic_filter: str,
+		since: datetime.datetime | None = None,
+		until: datetime.datetime | None = None,
+		limit: int = DEFAULT_LIMIT,
+	) -> tuple[str, list]:
+		"""Returns the query (newest messages first) and its parameters."""
+		condition, parameters = get_topic_condition(topic_filter)
+		if since is not None:
+			parameters.append(since)
+			condition += f" AND time >= ${len(parameters)}"
+		if until is not None:
+			parameters.append(until)
+			condition += f" AND time < ${len(parameters)}"
+		parameters.append(limit)
+		source = self._database.table_name
+		columns = "topic, text, qos, retain, time"
+		if self._payload_table:
+			source += (
+				f" j LEFT JOIN {self._payload_table} p ON p.hash = j.{PayloadStore.HASH_COLUMN}"
+			)
+			columns = "j.topic, COALESCE(j.text, p.text) AS text, j.qos, j.retain, j.time"
+		query = (
+			f"SELECT {columns} FROM {source} "
+			f"WHERE {condition} ORDER BY time DESC LIMIT ${len(parameters)}"
+		)
+		return query, parameters
+
+	async def fetch(
+		self,
+		topic_filter: str,
+		since: datetime.datetime | None = None,
+		until: datetime.datetime | None = None,
+		limit: int = DEFAULT_LIMIT,
+	) -> list[asyncpg.Record]:
+		query, parameters = self.get_query(topic_filter, since, until, limit)
+		async with self._database.pool.acquire() as connection:
+			return await connection.fetch(query, *parameters)
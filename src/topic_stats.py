@@ -0,0 +1,82 @@
+import datetime
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# indexes of the per topic counters
+MESSAGES = 0
+BYTES = 1
+DROPS = 2
+FIRST_SEEN = 3
+LAST_SEEN = 4
+
+
+class TopicStats:
+	"""
+	Per topic counters of a listener (received messages, payload bytes, drops, first and last
+	receive time). `summarize` returns one row per topic (see `COLUMNS`) and starts a new period,
+	so the statistics table holds the sums per period and topic, without querying the journal.
+
+	At most `max_topics` topics are counted per period, further topics are summed up as
+	`OTHER_TOPIC`.
+	"""
+
+	DEFAULT_MAX_TOPICS = 100000
+	OTHER_TOPIC = "#"
+
+	COLUMNS = [
+		"time",
+		"period_start",
+		"broker",
+		"topic",
+		"messages",
+		"bytes",
+		"drops",
+		"first_seen",
+		"last_seen",
+	]
+
+	def __init__(self, broker: str, max_topics: int = DEFAULT_MAX_TOPICS):
+		self._broker = broker
+		self._max_topics = max_topics
+		self._counters: dict[str, list] = {}
+		self._period_start: datetime.datetime | None = None
+
+	def __len__(self) -> int:
+		return len(self._counters)
+
+	def add(self, topic: str, size: int, time: datetime.datetime, dropped: bool = False) -> None:
+		counters = self._counters.get(topic)
+		if counters is None:
+			if len(self._counters) >= self._max_topics:
+				topic = self.OTHER_TOPIC
+				counters = self._counters.get(topic)
+			if counters is None:
+				counters = self._counters[topic] = [0, 0, 0, time, time]
+				if self._period_start is None:
+					self._period_start = time
+
+		counters[MESSAGES] += 1
+		counters[BYTES] += size
+		if dropped:
+			counters[DROPS] += 1
+		counters[LAST_SEEN] = time
+
+	def summarize(self, now: datetime.datetime) -> list[tuple]:
+		"""Rows of the current period, the counters are reset."""
+		counters, self._counters = self._counters, {}
+		period_start, self._period_start = self._period_start, None
+		return [
+			(
+				now,
+				period_start,
+				self._broker,
+				topic,
+				values[MESSAGES],
+				values[BYTES],
+				values[DROPS],
+				values[FIRST_SEEN],
+				values[LAST_SEEN],
+			)
+			for topic, values in counters.items()
+		]
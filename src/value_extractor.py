@@ -0,0 +1,121 @@
+import json
+
+from src.topic_filter import TopicRouter
+
+
+class ExtractConfKey:
+	TOPIC = "topic"
+	POINTER = "pointer"
+	UNIT = "unit"
+	UNIT_POINTER = "unit_pointer"
+
+
+def parse_json_pointer(pointer: str | None) -> list[str] | None:
+	"""Splits a JSON pointer (RFC 6901) into its reference tokens. `None`/"" refer to the whole document."""
+	if not pointer:
+		return None
+	if not pointer.startswith("/"):
+		raise ValueError(f"JSON pointer must start with '/' ({pointer})!")
+	return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+
+def resolve_json_pointer(document, tokens: list[str]):
+	for token in tokens:
+		if isinstance(document, dict):
+			document = document.get(token)
+		elif isinstance(document, list) and token.isdigit() and int(token) < len(document):
+			document = document[int(token)]
+		else:
+			return None
+		if document is None:
+			return None
+	return document
+
+
+def to_float(value) -> float | None:
+	if isinstance(value, (int, float, str)):  # includes bool
+		try:
+			return float(value)
+		except (ValueError, OverflowError):  # JSON integers beyond the double range
+			return None
+	return None
+
+
+class ExtractionRule:
+	__slots__ = ("topic", "pointer", "unit", "unit_pointer")
+
+	def __init__(self, config: dict):
+		self.topic: str = config[ExtractConfKey.TOPIC]
+		self.pointer: list[str] | None = parse_json_pointer(config.get(ExtractConfKey.POINTER))
+		self.unit: str | None = config.get(ExtractConfKey.UNIT)
+		self.unit_pointer: list[str] | None = parse_json_pointer(config.get(ExtractConfKey.UNIT_POINTER))
+
+	@property
+	def needs_json(self) -> bool:
+		return self.pointer is not None or self.unit_pointer is not None
+
+
+class ValueExtractor:
+	"""
+	Extracts numeric values (and units) out of message payloads into typed columns.
+
+	Rules are matched per topic filter (first match wins). The extraction runs for a whole batch at
+	once: rows are grouped by their rule, plain number payloads are converted in a single pass and
+	JSON payloads are decoded exactly once each.
+	"""
+
+	def __init__(self, rules: list[dict] | None):
+		self._router: TopicRouter[ExtractionRule] = TopicRouter(
+			[(rule[ExtractConfKey.TOPIC], ExtractionRule(rule)) for rule in rules or []]
+		)
+
+	def __bool__(self) -> bool:
+		return bool(self._router)
+
+	def extract(self, topics: list[str], texts: list[str]) -> tuple[list[float | None], list[str | None]]:
+		count = len(topics)
+		values: list[float | None] = [None] * count
+		units: list[str | None] = [None] * count
+
+		plain_rows: list[tuple[int, ExtractionRule]] = []
+		json_rows: dict[ExtractionRule, list[int]] = {}
+
+		lookup = self._router.lookup
+		for index, topic in enumerate(topics):
+			rule = lookup(topic)
+			if rule is None:
+				continue
+			if rule.needs_json:
+				json_rows.setdefault(rule, []).append(index)
+			else:
+				plain_rows.append((index, rule))
+
+		if plain_rows:
+			parsed = map(to_float, [texts[index] for index, _ in plain_rows])
+			for (index, rule), value in zip(plain_rows, parsed, strict=True):
+				if value is not None:
+					values[index] = value
+					units[index] = rule.unit
+
+		for rule, indices in json_rows.items():
+			for index in indices:
+				try:
+					document = json.loads(texts[index])
+				except ValueError:
+					continue
+
+				if rule.pointer is None:
+					value = to_float(document)
+				else:
+					value = to_float(resolve_json_pointer(document, rule.pointer))
+				if value is None:
+					continue
+
+				values[index] = value
+				units[index] = rule.unit
+				if rule.unit_pointer is not None:
+					unit = resolve_json_pointer(document, rule.unit_pointer)
+					if isinstance(unit, str):
+						units[index] = unit
+
+		return values, units
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from collections.abc import Callable
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.latency_tracker import LatencyTracker
+from src.message_record import TOPIC, MessageRecord
+from src.topic_filter import TopicRouter
+
+_logger = logging.getLogger(__name__)
+
+
+class LaneConfKey:
+	NAME = "name"
+	TOPICS = "topics"
+
+
+class WriterPipeline:
+	"""
+	Routes queued messages into lanes, each lane is a `BatchWriter` of its own.
+
+	Lanes are selected by topic filters (first matching lane wins), everything else goes into the
+	default lane configured by the database section itself. Every lane has its own queue, batch size,
+	max wait and writer tasks, so the backlog of one lane never delays another.
+
+	If `latency_stats_interval_seconds` is set, the latency summaries of all lanes are stored
+	periodically into the stats table (`latency_stats_table`).
+	"""
+
+	DEFAULT_LANE = "default"
+	DEFAULT_LATENCY_STATS_TABLE = "journal_latency"
+
+	def __init__(self, database: Database, config: dict):
+		self._database = database
+		self._latency_stats_interval: float = config.get(
+			DatabaseConfKey.LATENCY_STATS_INTERVAL_SECONDS, 0
+		)
+		self._latency_stats_table: str = config.get(
+			DatabaseConfKey.LATENCY_STATS_TABLE, self.DEFAULT_LATENCY_STATS_TABLE
+		)
+
+		self._default_writer = BatchWriter(database, config, self.DEFAULT_LANE)
+		self._writers = [self._default_writer]
+
+		routes = []
+		for lane_config in config.get(DatabaseConfKey.LANES) or []:
+			writer_config = {
+				**{key: value for key, value in config.items() if key != DatabaseConfKey.LANES},
+				**lane_config,
+			}
+			writer = BatchWriter(database, writer_config, lane_config[LaneConfKey.NAME])
+			self._writers.append(writer)
+			routes.extend((topic, writer) for topic in lane_config[LaneConfKey.TOPICS])
+
+		self._router: TopicRouter[BatchWriter] = TopicRouter(routes, default=self._default_writer)
+
+	@property
+	def writers(self) -> list[BatchWriter]:
+		return self._writers
+
+	def set_on_done(self, callback: Callable[[list[MessageRecord], bool], None] | None) -> None:
+		for writer in self._writers:
+			writer.set_on_done(callback)
+
+	def put(self, record: MessageRecord) -> None:
+		self._router.lookup(record[TOPIC]).put(record)
+
+	async def flush(self, records: list[MessageRecord]) -> None:
+		"""Stores records immediately (bypassing the lanes)."""
+		await self._default_writer.flush(records)
+
+	async def run(self) -> None:
+		if len(self._writers) > 1:
+			_logger.info("writer lanes: %s", ", ".join(writer.name for writer in self._writers))
+
+		async with asyncio.TaskGroup() as tg:
+			for writer in self._writers:
+				tg.create_task(writer.run())
+			if self._latency_stats_interval > 0:
+				tg.create_task(self._run_latency_stats())
+
+	async def _run_latency_stats(self) -> None:
+		while True:
+			await asyncio.sleep(self._latency_stats_interval)
+			try:
+				await self.store_latency_stats()
+			except Exception as ex:
+				_logger.exception("storing latency stats failed: %s", ex)
+
+	async def store_latency_stats(self) -> int:
+		now = self._database._now_utc()
+		rows = [
+			row
+			for writer in self._writers
+			if writer.latency
+			for row in writer.latency.summarize(now)
+		]
+		if not rows:
+			return 0
+
+		async with self._database.pool.acquire() as connection:
+			await connection.copy_records_to_table(
+				self._latency_stats_table, records=rows, columns=LatencyTracker.COLUMNS
+			)
+
+		_logger.debug("stored %d latency summaries", len(rows))
+		return len(rows)
@@ -0,0 +1,124 @@
+"""
+Micro benchmark of the per message work in `MqttListener.process`: the former record creation
+compared to the current one (`TopicCache`, single decode, UTC receive time).
+
+Both record variants log the same DEBUG line (the service's default log level is INFO), so only
+the record creation is compared. The two INFO lines per message the listener logged before are
+measured on their own ("info logs"). Messages are created lazily, so only what the queued records
+keep alive is counted as memory.
+
+Run: python -m test.benchmark_ingest
+"""
+
+import datetime
+import gc
+import logging
+import os
+import time
+import tracemalloc
+from collections.abc import Iterable, Iterator
+
+from aiomqtt import Message
+from tzlocal import get_localzone
+
+from src.database import Database
+from src.message_record import TopicCache
+
+_logger = logging.getLogger("benchmark")
+
+MESSAGE_COUNT = 100000
+TOPIC_COUNT = 200
+REPEAT = 5
+
+
+def create_messages() -> Iterator[Message]:
+	for index in range(MESSAGE_COUNT):
+		yield Message(
+			topic="".join(["plant/line", str(index % TOPIC_COUNT), "/temperature"]),
+			payload=f'{{"value": {index * 0.1:.1f}, "unit": "°C"}}'.encode(),
+			qos=1,
+			retain=False,
+			mid=index,
+			properties=None,
+		)
+
+
+def legacy_records(messages: Iterable[Message]) -> list:
+	records = []
+	for message in messages:
+		_logger.debug("received MQTT topic message (%s: %s)", message.topic, message.payload)
+		columns = ["topic", "text", "qos", "retain", "time"]  # noqa: F841
+		record = (
+			str(message.topic),
+			message.payload.decode(),
+			message.qos,
+			message.retain,
+			datetime.datetime.now(tz=get_localzone()),
+		)
+		records.append(record)
+	return records
+
+
+def info_logs(messages: Iterable[Message]) -> list:
+	"""The per message INFO lines of the former listener, without any record"""
+	for message in messages:
+		_logger.info("received MQTT topic message (%s: %s)", message.topic, message.payload)
+		_logger.info("overall message: stored=%s", message.payload.decode())
+	return []
+
+
+def current_records(messages: Iterable[Message]) -> list:
+	records = []
+	topic_cache = TopicCache()
+	now = Database._now_utc
+	for message in messages:
+		_logger.debug("received MQTT topic message (%s: %s)", message.topic, message.payload)
+		records.append(
+			(
+				topic_cache.get(message.topic.value),
+				message.payload.decode(),
+				message.qos,
+				message.retain,
+				now(),
+			)
+		)
+	return records
+
+
+def measure_cpu(create_records, messages: list[Message]) -> float:
+	start = time.perf_counter()
+	create_records(messages)
+	return (time.perf_counter() - start) / MESSAGE_COUNT * 1e6
+
+
+def measure_memory(create_records) -> float:
+	gc.collect()
+	tracemalloc.start()
+	records = create_records(create_messages())
+	retained, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	del records
+	return retained / MESSAGE_COUNT
+
+
+def main():
+	with open(os.devnull, "w") as devnull:
+		logging.basicConfig(level=logging.INFO, handlers=[logging.StreamHandler(devnull)])
+
+		variants = {"legacy": legacy_records, "current": current_records, "info logs": info_logs}
+		durations = {name: [] for name in variants}
+		messages = list(create_messages())
+		for _ in range(REPEAT):  # interleaved, the minimum is the least disturbed run
+			for name, create_records in variants.items():
+				durations[name].append(measure_cpu(create_records, messages))
+		del messages
+
+		for name, create_records in variants.items():
+			print(
+				f"{name:9s}: {min(durations[name]):6.2f} µs/message, "
+				f"{measure_memory(create_records):6.1f} bytes/queued message"
+			)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,19 +1,112 @@
+import contextlib
 import copy
+import datetime
 import logging
 import os
 import pathlib
 import sys
+from collections.abc import Callable
 
 import yaml
 from jsonschema import validate
 
 from src.constants import MQTT_JSONSCHEMA, MqttConfKey
+from src.message_record import MessageRecord
 
 
 class SetupTestException(Exception):
 	pass
 
 
+class FakeConnection:
+	"""asyncpg connection stand-in, every call is recorded by its pool."""
+
+	def __init__(self, pool: "FakePool"):
+		self._pool = pool
+
+	@contextlib.asynccontextmanager
+	async def transaction(self, **kwargs):
+		self._pool.calls.append(("BEGIN",))
+		yield
+		self._pool.calls.append(("COMMIT",))
+
+	async def execute(self, query: str, *args, timeout: float | None = None):
+		self._pool.calls.append(("execute", query, args))
+		self._pool.timeouts[query] = timeout
+		return self._pool.get_result(query, args, "")
+
+	async def fetchval(self, query: str, *args):
+		self._pool.calls.append(("fetchval", query, args))
+		return self._pool.get_result(query, args)
+
+	async def fetch(self, query: str, *args):
+		self._pool.calls.append(("fetch", query, args))
+		return self._pool.get_result(query, args, [])
+
+	async def copy_records_to_table(self, table_name: str, records, columns: list[str]):
+		if self._pool.errors:
+			raise self._pool.errors.pop(0)
+		if self._pool.reject is not None and self._pool.reject(records):
+			raise ValueError("invalid input")
+		self._pool.calls.append(("copy", table_name, list(records), columns))
+
+
+class FakePool:
+	"""
+	asyncpg pool stand-in (`Database._pool`) without a database. `results` maps query substrings to
+	the results of `execute`, `fetchval` and `fetch` (values or callables getting the arguments),
+	`errors` are raised by the next COPYs, `reject(records)` fails COPYs with invalid rows.
+	"""
+
+	def __init__(
+		self,
+		results: dict | None = None,
+		errors: list | None = None,
+		reject: Callable[[list], bool] | None = None,
+	):
+		self.calls: list[tuple] = []
+		self.timeouts: dict[str, float | None] = {}  # `execute` timeout per query
+		self.results = results or {}
+		self.errors = errors or []
+		self.reject = reject
+		self.expired = 0
+
+	@property
+	def executed(self) -> list[str]:
+		return [call[1] for call in self.calls if call[0] == "execute"]
+
+	@property
+	def copied(self) -> list[tuple]:
+		"""(table name, records, columns) per COPY"""
+		return [call[1:] for call in self.calls if call[0] == "copy"]
+
+	@property
+	def stored(self) -> list[str]:
+		"""Topics of all copied records"""
+		return [record[0] for _, records, _ in self.copied for record in records]
+
+	def get_result(self, query: str, args: tuple, default=None):
+		for key, result in self.results.items():
+			if key in query:
+				return result(*args) if callable(result) else result
+		return default
+
+	@contextlib.asynccontextmanager
+	async def acquire(self):
+		yield FakeConnection(self)
+
+	async def expire_connections(self):
+		self.expired += 1
+
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def record(topic: str, text: str = "1") -> MessageRecord:
+	"""A plain message record (QoS 0, not retained, received at `NOW`)"""
+	return topic, text, 0, False, NOW
+
+
 class SetupTest:
 
 	TEST_DIR = "__test__"
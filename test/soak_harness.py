@@ -0,0 +1,403 @@
+"""
+Soak test: replays recorded MQTT traffic into the listeners for hours and watches the process.
+
+The broker connection is replaced by `ReplayClient`, which delivers the recorded messages of the
+subscribed topics with their recorded inter-arrival times (sped up by `--speed`). The database
+targets of the config file are used as they are, so run it against a local Postgres with the
+schema of `sql/table.sql`.
+
+Every interval RSS, the number of Python objects, the queue depth of all writers and the stored
+rows per second are sampled. The run fails if memory or objects keep growing after the warm up,
+or if the throughput falls below the baseline (`--baseline`, written by `--save-baseline`).
+
+Record traffic from the broker of the config file (until stopped or `--duration` is over):
+	python -m test.soak_harness record --config-file ./mqtt-pg-logger.yaml --recording traffic.jsonl
+
+Replay it at ten times the recorded rate for an hour:
+	python -m test.soak_harness replay --config-file ./mqtt-pg-logger.yaml \\
+		--recording traffic.jsonl --speed 10 --duration 3600 --baseline soak-baseline.json
+"""
+
+import asyncio
+import base64
+import contextlib
+import gc
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import time
+from collections.abc import AsyncIterator, Iterable, Iterator
+
+import aiomqtt
+import attr
+import click
+
+from src.app_config import AppConfig
+from src.constants import MqttConfKey
+from src.database_target import DatabaseTargets
+from src.mqtt_client import MqttClient
+from src.mqtt_listener import MqttListeners
+from src.topic_filter import TopicFilter
+
+_logger = logging.getLogger("soak_harness")
+
+
+@attr.s(frozen=True)
+class RecordedMessage:
+	delay: float = attr.ib()  # seconds since the previous message
+	topic: str = attr.ib()
+	payload: bytes = attr.ib()
+	qos: int = attr.ib(default=0)
+	retain: bool = attr.ib(default=False)
+
+	def to_json(self) -> str:
+		return json.dumps(
+			{
+				"delay": round(self.delay, 6),
+				"topic": self.topic,
+				"payload": base64.b64encode(self.payload).decode(),
+				"qos": self.qos,
+				"retain": self.retain,
+			}
+		)
+
+	@classmethod
+	def from_json(cls, line: str) -> "RecordedMessage":
+		data = json.loads(line)
+		return cls(
+			delay=data["delay"],
+			topic=data["topic"],
+			payload=base64.b64decode(data["payload"]),
+			qos=data.get("qos", 0),
+			retain=data.get("retain", False),
+		)
+
+
+def write_recording(path: str, messages: Iterable[RecordedMessage]) -> int:
+	count = 0
+	with open(path, "w") as file:
+		for message in messages:
+			file.write(message.to_json())
+			file.write("\n")
+			count += 1
+	return count
+
+
+def read_recording(path: str) -> list[RecordedMessage]:
+	with open(path) as file:
+		return [RecordedMessage.from_json(line) for line in file if line.strip()]
+
+
+class TrafficRecorder(MqttClient):
+	"""Subscribes like the logger and appends every message to a recording (JSON lines)."""
+
+	async def record(self, path: str, duration: float | None = None) -> int:
+		count = 0
+		with open(path, "w") as file, contextlib.suppress(TimeoutError):
+			async with asyncio.timeout(duration), self._client as client:
+				for topic in self._mqtt[MqttConfKey.SUBSCRIPTIONS]:
+					await client.subscribe(topic=topic, qos=MqttClient.DEFAULT_QUALITY)
+				previous = None
+				async for message in client.messages:
+					now = time.monotonic()
+					recorded = RecordedMessage(
+						delay=0.0 if previous is None else now - previous,
+						topic=message.topic.value,
+						payload=message.payload,
+						qos=message.qos,
+						retain=message.retain,
+					)
+					previous = now
+					file.write(recorded.to_json())
+					file.write("\n")
+					count += 1
+		return count
+
+
+class ReplayClient:
+	"""
+	Stands in for `aiomqtt.Client`: delivers the recorded messages of the subscribed topics,
+	`speed` times faster than recorded. The recording is repeated `loops` times (`None`: endless).
+	"""
+
+	def __init__(self, recording: list[RecordedMessage], speed: float = 1.0, loops: int | None = 1):
+		if speed <= 0:
+			raise ValueError("speed must be positive!")
+		self._recording = recording
+		self._speed = speed
+		self._loops = loops
+		self._filters: dict[str, TopicFilter] = {}
+		self._client = self  # `MqttClient._ack` acknowledges via the paho client
+		self.delivered_count = 0
+		self.acked_count = 0
+
+	async def __aenter__(self) -> "ReplayClient":
+		return self
+
+	async def __aexit__(self, *args) -> None:
+		self._filters.clear()
+
+	async def subscribe(self, topic: str, qos: int = 0) -> None:
+		self._filters[topic] = TopicFilter(topic)
+
+	async def unsubscribe(self, topics: list[str]) -> None:
+		for topic in topics:
+			self._filters.pop(topic, None)
+
+	def manual_ack_set(self, on: bool) -> None:
+		pass  # `ack_after_commit`: acknowledgements are counted anyway
+
+	def ack(self, mid: int, qos: int) -> None:
+		self.acked_count += 1
+
+	@property
+	def messages(self) -> AsyncIterator[aiomqtt.Message]:
+		return self._replay()
+
+	def _iterate(self) -> Iterator[RecordedMessage]:
+		loop = 0
+		while self._recording and (self._loops is None or loop < self._loops):
+			yield from self._recording
+			loop += 1
+
+	async def _replay(self) -> AsyncIterator[aiomqtt.Message]:
+		loop = asyncio.get_running_loop()
+		due = loop.time()
+		mid = 0
+		for recorded in self._iterate():
+			due += recorded.delay / self._speed
+			delay = due - loop.time()
+			# behind schedule: deliver at once, but let the writers run in between
+			await asyncio.sleep(delay if delay > 0 else 0)
+			if not any(topic_filter.matches(recorded.topic) for topic_filter in self._filters.values()):
+				continue
+			mid = mid % 65535 + 1
+			self.delivered_count += 1
+			yield aiomqtt.Message(
+				topic=recorded.topic,
+				payload=recorded.payload,
+				qos=recorded.qos,
+				retain=recorded.retain,
+				mid=mid,
+				properties=None,
+			)
+
+
+@attr.s(frozen=True)
+class SoakSample:
+	elapsed: float = attr.ib()  # seconds since the start
+	rss_bytes: int = attr.ib()
+	objects: int = attr.ib()
+	queue_depth: int = attr.ib()
+	stored: int = attr.ib()  # rows in total
+	rows_per_second: float = attr.ib()  # since the previous sample
+
+
+def get_rss_bytes() -> int:
+	try:
+		with open("/proc/self/statm") as file:
+			return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except OSError:  # not Linux: peak instead of current RSS
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class SoakMonitor:
+	"""Samples the process and the database targets every `interval` seconds."""
+
+	def __init__(self, targets: DatabaseTargets, interval: float = 10.0):
+		self._writers = [writer for target in targets for writer in target.writer.writers]
+		self._interval = interval
+		self._start = time.monotonic()
+		self.samples: list[SoakSample] = []
+
+	def sample(self) -> SoakSample:
+		elapsed = time.monotonic() - self._start
+		stored = sum(writer.stored_count for writer in self._writers)
+		if self.samples:
+			previous = self.samples[-1]
+			seconds = elapsed - previous.elapsed
+			rows_per_second = (stored - previous.stored) / seconds if seconds > 0 else 0.0
+		else:
+			rows_per_second = 0.0
+		sample = SoakSample(
+			elapsed=elapsed,
+			rss_bytes=get_rss_bytes(),
+			objects=len(gc.get_objects()),
+			queue_depth=sum(writer.queue_size for writer in self._writers),
+			stored=stored,
+			rows_per_second=rows_per_second,
+		)
+		self.samples.append(sample)
+		return sample
+
+	async def run(self) -> None:
+		while True:
+			sample = self.sample()
+			_logger.info(
+				"%6.0fs: rss=%.1f MiB, objects=%d, queued=%d, stored=%d (%.0f rows/s)",
+				sample.elapsed,
+				sample.rss_bytes / 2**20,
+				sample.objects,
+				sample.queue_depth,
+				sample.stored,
+				sample.rows_per_second,
+			)
+			await asyncio.sleep(self._interval)
+
+
+def is_growing(values: list[float], max_growth: float) -> bool:
+	"""
+	Unbounded growth: the medians of the last three quarters rise steadily and the last one is
+	more than `max_growth` (ratio) above the second. A plateau after the warm up passes.
+	"""
+	if len(values) < 8:
+		return False
+	size = len(values) // 4
+	medians = []
+	for start in range(0, 4 * size, size):
+		end = start + size
+		medians.append(statistics.median(values[start:end]))
+	_, second, third, last = medians
+	return second < third < last and last > second * (1 + max_growth)
+
+
+def check_samples(
+	samples: list[SoakSample],
+	warmup_seconds: float = 60.0,
+	max_growth: float = 0.1,
+	baseline_rows_per_second: float | None = None,
+	tolerance: float = 0.2,
+) -> list[str]:
+	"""Returns the failures of a soak run."""
+	samples = [sample for sample in samples if sample.elapsed >= warmup_seconds]
+	if len(samples) < 2:
+		return ["too few samples after the warm up, run longer or sample more often"]
+
+	failures = []
+	if is_growing([sample.rss_bytes for sample in samples], max_growth):
+		failures.append(
+			f"memory keeps growing: {samples[0].rss_bytes / 2**20:.1f} MiB -> "
+			f"{samples[-1].rss_bytes / 2**20:.1f} MiB"
+		)
+	if is_growing([sample.objects for sample in samples], max_growth):
+		failures.append(f"objects keep growing: {samples[0].objects} -> {samples[-1].objects}")
+	if is_growing([sample.queue_depth for sample in samples], max_growth):
+		failures.append(f"queue keeps growing: {samples[-1].queue_depth} messages queued")
+
+	rows_per_second = get_rows_per_second(samples)
+	if baseline_rows_per_second and rows_per_second < baseline_rows_per_second * (1 - tolerance):
+		failures.append(
+			f"throughput dropped: {rows_per_second:.0f} rows/s "
+			f"(baseline: {baseline_rows_per_second:.0f} rows/s)"
+		)
+	return failures
+
+
+def get_rows_per_second(samples: list[SoakSample]) -> float:
+	first, last = samples[0], samples[-1]
+	seconds = last.elapsed - first.elapsed
+	return (last.stored - first.stored) / seconds if seconds > 0 else 0.0
+
+
+async def run_soak(
+	app_config: AppConfig,
+	recording: list[RecordedMessage],
+	speed: float,
+	duration: float,
+	interval: float,
+) -> list[SoakSample]:
+	listeners = MqttListeners(
+		app_config, client_factory=lambda **_: ReplayClient(recording, speed, loops=None)
+	)
+
+	monitor = SoakMonitor(listeners.targets, interval)
+	with contextlib.suppress(TimeoutError):
+		async with asyncio.timeout(duration), asyncio.TaskGroup() as tg:
+			tg.create_task(listeners.listen())
+			tg.create_task(monitor.run())
+	monitor.sample()
+	return monitor.samples
+
+
+LOG_FORMAT = "%(asctime)s [%(levelname)8s] %(name)s: %(message)s"
+
+
+@click.group()
+def cli():
+	logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+
+@cli.command()
+@click.option("--config-file", required=True, type=click.Path(exists=True), help="Config file")
+@click.option("--recording", required=True, type=click.Path(), help="Recording (JSON lines)")
+@click.option("--duration", type=float, help="Seconds to record, default: until stopped")
+def record(config_file, recording, duration):
+	"""Records the subscribed traffic of the (first) broker."""
+	recorder = TrafficRecorder(AppConfig(config_file))
+	with contextlib.suppress(KeyboardInterrupt):
+		count = asyncio.run(recorder.record(recording, duration))
+		_logger.info("%d messages recorded", count)
+
+
+@cli.command()
+@click.option("--config-file", required=True, type=click.Path(exists=True), help="Config file")
+@click.option("--recording", required=True, type=click.Path(exists=True), help="Recording")
+@click.option("--speed", default=1.0, show_default=True, help="Replay speed (e.g. 1 - 50)")
+@click.option("--duration", default=3600.0, show_default=True, help="Seconds")
+@click.option("--interval", default=10.0, show_default=True, help="Seconds between samples")
+@click.option("--warmup", default=60.0, show_default=True, help="Seconds not checked")
+@click.option("--max-growth", default=0.1, show_default=True, help="Growth ratio of a leak")
+@click.option("--baseline", type=click.Path(), help="JSON file with 'rows_per_second'")
+@click.option("--tolerance", default=0.2, show_default=True, help="Allowed throughput drop ratio")
+@click.option("--save-baseline", is_flag=True, help="Write the measured throughput as baseline")
+@click.option("--samples-file", type=click.Path(), help="Write the samples (JSON lines)")
+def replay(
+	config_file,
+	recording,
+	speed,
+	duration,
+	interval,
+	warmup,
+	max_growth,
+	baseline,
+	tolerance,
+	save_baseline,
+	samples_file,
+):
+	"""Replays a recording into the listeners and the configured databases."""
+	messages = read_recording(recording)
+	samples = asyncio.run(run_soak(AppConfig(config_file), messages, speed, duration, interval))
+
+	if samples_file:
+		with open(samples_file, "w") as file:
+			for sample in samples:
+				file.write(json.dumps(attr.asdict(sample)))
+				file.write("\n")
+
+	baseline_rows_per_second = None
+	if baseline and os.path.exists(baseline) and not save_baseline:
+		with open(baseline) as file:
+			baseline_rows_per_second = json.load(file)["rows_per_second"]
+
+	failures = check_samples(samples, warmup, max_growth, baseline_rows_per_second, tolerance)
+	checked = [sample for sample in samples if sample.elapsed >= warmup]
+	rows_per_second = get_rows_per_second(checked) if len(checked) > 1 else 0.0
+	peak_rss = max(sample.rss_bytes for sample in samples)
+	print(f"{rows_per_second:.0f} rows/s, peak rss {peak_rss / 2**20:.1f} MiB")
+
+	if baseline and save_baseline and not failures:
+		with open(baseline, "w") as file:
+			json.dump(
+				{"rows_per_second": rows_per_second, "speed": speed, "recording": recording}, file
+			)
+
+	for failure in failures:
+		print(f"FAILED: {failure}")
+	sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+	cli()
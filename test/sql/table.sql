@@ -34,8 +34,62 @@ CREATE TABLE pgqueuer_statistics (
 CREATE TABLE journal (
     message_id SERIAL PRIMARY KEY,
     topic TEXT NOT NULL,
-    text TEXT NOT NULL,
+    text TEXT,
     qos INTEGER,
     retain INTEGER,
-    time TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    time TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    value DOUBLE PRECISION,
+    unit TEXT,
+    dedup_key BYTEA,
+    topic_levels TEXT[],
+    broker TEXT,
+    payload_hash BYTEA
+);
+
+CREATE UNIQUE INDEX journal_dedup_key_idx ON journal ( dedup_key ) WHERE dedup_key IS NOT NULL;
+
+CREATE INDEX journal_topic_levels_idx ON journal USING GIN ( topic_levels ) WHERE topic_levels IS NOT NULL;
+
+CREATE INDEX journal_payload_hash_idx ON journal ( payload_hash ) WHERE payload_hash IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS journal_payloads (
+    hash BYTEA PRIMARY KEY,
+    text TEXT NOT NULL,
+    created TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_used TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS journal_latency (
+    time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    lane TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    count BIGINT NOT NULL,
+    avg_ms DOUBLE PRECISION,
+    p50_ms DOUBLE PRECISION,
+    p95_ms DOUBLE PRECISION,
+    p99_ms DOUBLE PRECISION,
+    max_ms DOUBLE PRECISION
+);
+
+CREATE TABLE IF NOT EXISTS journal_topic_stats (
+    time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    period_start TIMESTAMP WITH TIME ZONE,
+    broker TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    messages BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    drops BIGINT NOT NULL,
+    first_seen TIMESTAMP WITH TIME ZONE,
+    last_seen TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS journal_maintenance (
+    table_name TEXT NOT NULL,
+    job TEXT NOT NULL,
+    last_run TIMESTAMP WITH TIME ZONE NOT NULL,
+    duration_seconds DOUBLE PRECISION,
+    status TEXT,
+    instance TEXT,
+    PRIMARY KEY (table_name, job)
 );
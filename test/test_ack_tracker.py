@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+
+import pytest
+
+from src.ack_tracker import AckTracker
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def create_tracker(max_unacked: int = 100, copies: int = 1):
+	acked = []
+	tracker = AckTracker(lambda mid, qos: acked.append(mid), max_unacked, copies=copies)
+	return tracker, acked
+
+
+def receive(tracker: AckTracker, mid: int, qos: int = 1):
+	return f"topic/{mid}", "1", qos, False, NOW, None, tracker.track(mid, qos)
+
+
+def test_acks_in_receive_order():
+	tracker, acked = create_tracker()
+	records = [receive(tracker, mid) for mid in range(1, 5)]
+	assert tracker.unacked == 4
+
+	tracker.release(records[2:])  # committed by a faster lane
+	assert acked == []
+	tracker.release(records[:2])
+	assert acked == [1, 2, 3, 4]
+	assert tracker.unacked == 0
+
+
+def test_qos_0_and_2_not_tracked():
+	tracker, acked = create_tracker()
+	record = receive(tracker, 1, qos=0)
+	tracker.release([record])
+	assert tracker.unacked == 0
+	assert acked == []
+
+	receive(tracker, 2, qos=2)  # PUBREC was sent by paho already, PUBCOMP goes out at once
+	assert tracker.unacked == 0
+	assert acked == [2]
+
+
+@pytest.mark.asyncio
+async def test_rejected_holds_acks():
+	tracker, acked = create_tracker(max_unacked=3)
+	records = [receive(tracker, mid) for mid in range(1, 4)]
+	assert tracker.full
+
+	AckTracker.count_done(records[1:2], stored=False)
+	tracker.release(records[:1] + records[2:])
+	assert acked == [1]  # neither the rejected message nor the following ones
+	assert tracker.failed
+	await asyncio.wait_for(tracker.wait_for_room(), 1)  # the receiving wakes up to reconnect
+
+
+def test_copies():
+	tracker, acked = create_tracker(copies=2)
+	record = receive(tracker, 7)
+
+	tracker.release([record])
+	assert acked == []
+	tracker.release([record])
+	assert acked == [7]
+
+
+def test_discard():
+	tracker, acked = create_tracker(copies=2)
+	record = receive(tracker, 3)
+	tracker.discard(record)
+	assert acked == [3]
+
+	tracker.release([record])  # no second acknowledgement
+	assert acked == [3]
+
+
+def test_several_trackers():
+	tracker_a, acked_a = create_tracker()
+	tracker_b, acked_b = create_tracker()
+	records = [receive(tracker_a, 1), receive(tracker_b, 1), receive(tracker_b, 2)]
+
+	AckTracker.count_done(records[1:])  # one batch of several brokers
+	for tracker in (tracker_a, tracker_b):
+		tracker.send_acks()
+	assert acked_a == []
+	assert acked_b == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_backpressure():
+	tracker, acked = create_tracker(max_unacked=2)
+	records = [receive(tracker, 1), receive(tracker, 2)]
+	assert tracker.full
+
+	waiting = asyncio.create_task(tracker.wait_for_room())
+	await asyncio.sleep(0.01)
+	assert not waiting.done()
+
+	tracker.release(records[:1])
+	await asyncio.wait_for(waiting, 1)
+	assert acked == [1]
+	assert not tracker.full
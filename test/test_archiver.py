@@ -0,0 +1,107 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import os
+import threading
+import time
+from test.setup_test import SetupTest
+
+import pytest
+
+from src.archiver import Archiver, CsvArchiveFile
+from src.database import Database, DatabaseConfKey
+
+
+def create_archiver(**config):
+	database = Database({DatabaseConfKey.HOST: "localhost"})
+	return Archiver(database, config)
+
+
+def test_enabled():
+	assert create_archiver().enabled is False
+	assert create_archiver(archive_dir="archive").enabled is True
+	assert create_archiver(archive_dir="archive", clean_up_after_days=0).enabled is False
+	assert create_archiver(archive_dir="archive").periodic is False
+	assert create_archiver(archive_dir="archive", archive_interval_minutes=60).periodic is True
+
+
+def test_partitioning():
+	archiver = create_archiver(archive_dir="archive", archive_topic_levels=2)
+	assert archiver.get_prefix("plant/a/temperature") == "plant/a"
+	assert archiver.get_prefix("plant") == "plant"
+
+	path = archiver.get_file_path(datetime.date(2024, 3, 1), "plant/a", "journal-1.csv.gz")
+	assert path == os.path.join("archive", "day=2024-03-01", "prefix=plant%2Fa", "journal-1.csv.gz")
+
+
+def test_cutoff():
+	archiver = create_archiver(archive_dir="archive", clean_up_after_days=2)
+	archiver._database._now = lambda: datetime.datetime(2024, 3, 10, 15, 30)
+	assert archiver.get_cutoff() == datetime.datetime(2024, 3, 8)
+
+
+def test_payload_store():
+	archiver = create_archiver(archive_dir="archive")
+	assert archiver.get_query() == "SELECT * FROM journal WHERE time >= $1 AND time < $2"
+
+	archiver = create_archiver(archive_dir="archive", payload_store={"min_size": 100})
+	assert archiver.get_query() == (
+		"SELECT j.*, p.text AS payload_text FROM journal j "
+		"LEFT JOIN journal_payloads p ON p.hash = j.payload_hash "
+		"WHERE j.time >= $1 AND j.time < $2"
+	)
+	row = ("a", None, 0, b"hash", "payload")
+	assert Archiver.resolve_payload(row, 1, 4) == ("a", "payload", 0, b"hash")
+	assert Archiver.resolve_payload(("a", "1", 0, None, None), 1, 4) == ("a", "1", 0, None)
+
+
+def test_csv_archive_file():
+	SetupTest.ensure_test_dir()
+	path = SetupTest.get_test_path("archive.csv.gz")
+
+	archive_file = CsvArchiveFile(path, ["topic", "text"], ["text", "text"])
+	archive_file.write_rows([("a/b", "1"), ("a/c", "2")])
+	archive_file.close()
+
+	with gzip.open(path, "rt", newline="") as f:
+		assert list(csv.reader(f)) == [["topic", "text"], ["a/b", "1"], ["a/c", "2"]]
+
+
+def test_csv_postgres_values():
+	SetupTest.ensure_test_dir()
+	path = SetupTest.get_test_path("archive.csv.gz")
+
+	columns = ["topic", "topic_levels", "payload_hash"]
+	archive_file = CsvArchiveFile(path, columns, ["text", "_text", "bytea"])
+	archive_file.write_rows([("a/b c", ["a", "b c", 'q"', None], b"\x01\xff"), ("x", None, None)])
+	archive_file.close()
+
+	with gzip.open(path, "rt", newline="") as f:
+		assert list(csv.reader(f)) == [
+			columns,
+			["a/b c", '{a,"b c","q\\"",NULL}', "\\x01ff"],
+			["x", "", ""],
+		]
+
+
+@pytest.mark.asyncio
+async def test_run_blocking():
+	threads = []
+	await Archiver.run_blocking(lambda: threads.append(threading.get_ident()))
+	assert threads and threads[0] != threading.get_ident()
+
+	# a cancellation waits for the running call
+	started, done = threading.Event(), []
+
+	def write():
+		started.set()
+		time.sleep(0.05)
+		done.append(True)
+
+	task = asyncio.create_task(Archiver.run_blocking(write))
+	await asyncio.to_thread(started.wait)
+	task.cancel()
+	with pytest.raises(asyncio.CancelledError):
+		await task
+	assert done == [True]
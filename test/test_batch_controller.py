@@ -0,0 +1,53 @@
+from src.batch_controller import AdaptiveBatchController
+
+
+def create_controller():
+	config = {
+		"batch_size_min": 10,
+		"batch_size_max": 5000,
+		"wait_min_seconds": 0.05,
+		"target_latency_seconds": 1.0,
+	}
+	return AdaptiveBatchController(config, batch_size=100, wait_max_seconds=2)
+
+
+def receive_and_store(controller, count, copy_seconds, backlog, now):
+	for _ in range(count):
+		controller.on_received()
+	controller.on_stored(copy_seconds, backlog, now=now)
+
+
+def test_initial_values():
+	controller = create_controller()
+	assert controller.batch_size == 100
+	assert controller.wait_seconds == 1.0
+
+
+def test_low_traffic():
+	controller = create_controller()
+	receive_and_store(controller, 0, 0.01, 0, now=0)
+	for second in range(1, 30):
+		receive_and_store(controller, 5, 0.01, 0, now=second)  # 5 messages per second
+
+	assert controller.batch_size == 10  # lower bound
+	assert 0.98 < controller.wait_seconds < 1.0
+
+
+def test_peak_traffic():
+	controller = create_controller()
+	receive_and_store(controller, 0, 0.2, 0, now=0)
+	for second in range(1, 30):
+		receive_and_store(controller, 3000, 0.2, 0, now=second)
+
+	assert 0.79 < controller.wait_seconds < 0.81
+	assert 2350 < controller.batch_size < 2450
+
+	receive_and_store(controller, 3000, 0.2, 20000, now=31)
+	assert controller.batch_size == 5000  # backlog: upper bound
+
+
+def test_slow_database():
+	controller = create_controller()
+	receive_and_store(controller, 0, 3.0, 0, now=0)
+	receive_and_store(controller, 100, 3.0, 0, now=1)
+	assert controller.wait_seconds == 0.05  # target missed anyway: flush as soon as possible
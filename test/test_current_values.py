@@ -0,0 +1,67 @@
+from test.setup_test import NOW, record
+
+import pytest
+
+from src.current_values import CurrentValues
+
+
+@pytest.mark.asyncio
+async def test_update_and_lookup():
+	values = CurrentValues({"max_topics": 3})
+	for topic, text in [("sensors/a", "1"), ("sensors/b", "2"), ("alarm", "3"), ("sensors/a", "4")]:
+		values.update(record(topic, text))
+
+	assert values.version == 4
+	assert [(v, r[1]) for v, r in values.lookup(["sensors/+"])] == [(2, "2"), (4, "4")]
+	assert [v for v, _ in values.lookup(["sensors/a", "unknown"])] == [4]
+	assert [r[0] for _, r in values.lookup(["#"], since=2)] == ["alarm", "sensors/a"]
+
+	values.update(record("new"))  # evicts the least recently updated topic
+	assert len(values) == 3
+	assert values.lookup(["sensors/b"]) == []
+
+	with pytest.raises(ValueError):
+		values.lookup(["a/#/b"])
+
+
+@pytest.mark.asyncio
+async def test_http():
+	values = CurrentValues({})
+	assert values
+	assert not CurrentValues(None)
+	values.update(record("sensors/a", "21.5"))
+	values.update(record("other"))
+	client = values.create_app().test_client()
+
+	response = await client.get("/values", query_string={"filter": "sensors/#"})
+	assert response.status_code == 200
+	assert await response.get_json() == {
+		"version": 2,
+		"values": [
+			{
+				"topic": "sensors/a",
+				"text": "21.5",
+				"qos": 0,
+				"retain": False,
+				"time": NOW.isoformat(),
+				"version": 1,
+			}
+		],
+	}
+
+	etag = response.headers["ETag"]
+	headers = {"If-None-Match": etag}
+	query = {"filter": "sensors/#"}
+	response = await client.get("/values", query_string=query, headers=headers)
+	assert response.status_code == 304
+
+	values.update(record("sensors/a", "22"))
+	response = await client.get("/values", query_string=query, headers=headers)
+	assert response.status_code == 200
+	assert response.headers["ETag"] != etag
+
+	response = await client.get("/values", query_string={"since": 3})
+	assert (await response.get_json())["values"] == []
+
+	response = await client.get("/values", query_string={"filter": "a/#/b"})
+	assert response.status_code == 400
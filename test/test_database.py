@@ -0,0 +1,41 @@
+from test.setup_test import FakeConnection, FakePool
+
+import pytest
+
+from src.database import Database, DatabaseConfKey
+
+
+def test_pool_config():
+	database = Database({DatabaseConfKey.HOST: "localhost", DatabaseConfKey.POOL_MAX_SIZE: 4})
+	config = database._get_pool_config()
+	assert config["min_size"] == Database.DEFAULT_POOL_MIN_SIZE
+	assert config["max_size"] == 4
+	assert config["statement_cache_size"] == Database.DEFAULT_STATEMENT_CACHE_SIZE
+	assert config["command_timeout"] is None
+
+	assert database._get_connection_config() == {DatabaseConfKey.HOST: "localhost"}
+
+
+@pytest.mark.asyncio
+async def test_init_connection():
+	database = Database(
+		{
+			DatabaseConfKey.TIMEZONE: "Europe/Berlin",
+			DatabaseConfKey.SYNCHRONOUS_COMMIT: "off",
+		}
+	)
+	pool = FakePool()
+	await database._init_connection(FakeConnection(pool))
+
+	((_, query, args),) = pool.calls
+	assert query == (
+		"SELECT set_config($1, $2, false), set_config($3, $4, false), set_config($5, $6, false)"
+	)
+	assert args == (
+		"timezone",
+		"Europe/Berlin",
+		"application_name",
+		Database.DEFAULT_APPLICATION_NAME,
+		"synchronous_commit",
+		"off",
+	)
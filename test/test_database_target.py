@@ -0,0 +1,234 @@
+import asyncio
+import contextlib
+import os
+import threading
+from test.setup_test import NOW, FakePool, record
+
+import pytest
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.database_target import DatabaseTarget, DatabaseTargets
+from src.spill_buffer import SpillBuffer
+
+
+def create_config(name: str, **kwargs):
+	return {
+		DatabaseConfKey.NAME: name,
+		DatabaseConfKey.HOST: "localhost",
+		DatabaseConfKey.BATCH_SIZE: 10,
+		DatabaseConfKey.WAIT_MAX_SECONDS: 0.01,
+		**kwargs,
+	}
+
+
+async def run_until(condition, task, timeout: float = 2.0):
+	for _ in range(int(timeout / 0.01)):
+		if condition():
+			break
+		await asyncio.sleep(0.01)
+	task.cancel()
+	with contextlib.suppress(asyncio.CancelledError):
+		await task
+
+
+def test_unique_targets(tmp_path):
+	with pytest.raises(ValueError):
+		DatabaseTargets([create_config("a"), create_config("a")])
+	spill_dir = str(tmp_path)
+	with pytest.raises(ValueError):
+		DatabaseTargets(
+			[
+				create_config("a", **{DatabaseConfKey.SPILL_DIR: spill_dir}),
+				create_config("b", **{DatabaseConfKey.SPILL_DIR: spill_dir}),
+			]
+		)
+
+
+@pytest.mark.asyncio
+async def test_fan_out_with_failing_target(monkeypatch):
+	monkeypatch.setattr(BatchWriter, "RETRY_MIN_SECONDS", 0.01)
+	targets = DatabaseTargets([create_config("dashboards"), create_config("archive")])
+	healthy, failing = list(targets)
+	healthy.database._pool = FakePool()
+	failing.database._pool = FakePool(errors=[OSError("connection refused")] * 3)
+
+	for index in range(25):
+		targets.put(record(f"topic/{index}"))
+
+	task = asyncio.create_task(targets.run())
+	await run_until(lambda: len(failing.database.pool.stored) == 25, task)
+
+	assert sorted(healthy.database.pool.stored) == sorted(f"topic/{i}" for i in range(25))
+	assert sorted(failing.database.pool.stored) == sorted(healthy.database.pool.stored)
+	assert failing.database.pool.expired == 3
+
+
+@pytest.mark.asyncio
+async def test_unreachable_target_connects_in_background(monkeypatch):
+	monkeypatch.setattr(DatabaseTarget, "CONNECT_RETRY_MIN_SECONDS", 0.01)
+	targets = DatabaseTargets([create_config("dashboards"), create_config("archive")])
+	healthy, failing = list(targets)
+	attempts = []
+
+	async def connect_healthy():
+		healthy.database._pool = FakePool()
+
+	async def connect_failing():
+		attempts.append(True)
+		if len(attempts) < 3:
+			raise OSError("connection refused")
+		failing.database._pool = FakePool()
+
+	monkeypatch.setattr(healthy.database, "connect", connect_healthy)
+	monkeypatch.setattr(failing.database, "connect", connect_failing)
+
+	monkeypatch.setattr(healthy.database, "connect", connect_failing)
+	with pytest.raises(OSError):  # no target at all is reachable
+		await targets.connect()
+	attempts.clear()
+
+	monkeypatch.setattr(healthy.database, "connect", connect_healthy)
+	await targets.connect()  # doesn't raise
+	assert healthy.connected and not failing.connected
+
+	for index in range(5):
+		targets.put(record(f"topic/{index}"))
+
+	task = asyncio.create_task(targets.run())
+	await run_until(lambda: failing.connected and len(failing.database.pool.stored) == 5, task)
+
+	assert len(attempts) == 3
+	assert sorted(healthy.database.pool.stored) == sorted(f"topic/{i}" for i in range(5))
+	assert sorted(failing.database.pool.stored) == sorted(healthy.database.pool.stored)
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_are_dropped():
+	targets = DatabaseTargets([create_config("db")])
+	target = next(iter(targets))
+	target.database._pool = FakePool(reject=lambda records: any(r[0] == "topic/3" for r in records))
+
+	for index in range(15):
+		targets.put(record(f"topic/{index}"))
+
+	task = asyncio.create_task(targets.run())
+	await run_until(lambda: len(target.database.pool.stored) == 14, task)
+
+	writer = target.writer.writers[0]
+	assert writer.dropped_count == 1  # only the invalid row of the batch
+	assert sorted(target.database.pool.stored) == sorted(f"topic/{i}" for i in range(15) if i != 3)
+
+
+@pytest.mark.asyncio
+async def test_spill(tmp_path):
+	config = create_config(
+		"db", **{DatabaseConfKey.MAX_QUEUE_SIZE: 5, DatabaseConfKey.SPILL_DIR: str(tmp_path)}
+	)
+	targets = DatabaseTargets([config])
+	target = next(iter(targets))
+	target.database._pool = FakePool()
+
+	for index in range(20):
+		targets.put(record(f"topic/{index}"))
+
+	writer = target.writer.writers[0]
+	assert writer.queue_size == 5
+	assert len(writer.spill) == 15
+
+	task = asyncio.create_task(targets.run())
+	await run_until(lambda: len(target.database.pool.stored) == 20, task)
+
+	assert sorted(target.database.pool.stored) == sorted(f"topic/{i}" for i in range(20))
+	assert not writer.spill.pending
+
+
+@pytest.mark.asyncio
+async def test_unacknowledged_records_not_spilled_or_acked_when_rejected(tmp_path):
+	config = create_config(
+		"db", **{DatabaseConfKey.MAX_QUEUE_SIZE: 2, DatabaseConfKey.SPILL_DIR: str(tmp_path)}
+	)
+	targets = DatabaseTargets([config])
+	target = next(iter(targets))
+	target.database._pool = FakePool(reject=lambda records: any(r[0] == "topic/1" for r in records))
+	done = []
+	targets.set_on_done(lambda records, stored: done.extend((r[0], stored) for r in records))
+
+	for index in range(4):  # awaiting their acknowledgement (`ACK`)
+		targets.put(record(f"topic/{index}") + (None, [1, index, 1, False]))
+
+	writer = target.writer.writers[0]
+	assert writer.queue_size == 4
+	assert len(writer.spill) == 0
+
+	task = asyncio.create_task(targets.run())
+	await run_until(lambda: len(done) == 4, task)
+	assert sorted(done) == [
+		("topic/0", True),
+		("topic/1", False),
+		("topic/2", True),
+		("topic/3", True),
+	]
+
+
+@pytest.mark.asyncio
+async def test_spill_buffer_syncs_in_a_thread(tmp_path, monkeypatch):
+	synced = []
+	fsync = os.fsync
+	monkeypatch.setattr(os, "fsync", lambda fd: synced.append(threading.get_ident()) or fsync(fd))
+
+	spill = SpillBuffer(str(tmp_path), "lane")
+	spill.append(record("topic/a"))
+	assert synced == []  # not while appending (in the receive loop)
+
+	await spill.sync()
+	await spill.sync()  # nothing appended meanwhile
+	assert len(synced) == 1
+	assert synced[0] != threading.get_ident()
+	spill.close()
+
+
+def test_spill_buffer_keeps_stored_fields(tmp_path):
+	spill = SpillBuffer(str(tmp_path), "default")
+	extended = ("topic/a", "1", 1, False, NOW, NOW, [1, 7, 1], b"k" * 16, "site-a")
+	spill.append(extended)
+	spill.append(record("topic/b"))
+	spill.close()
+
+	(chunk,) = SpillBuffer.read_chunks(spill.take(), 10)
+	assert chunk == [(*extended[:6], None, *extended[7:]), record("topic/b")]
+
+
+def test_spill_buffer_restart(tmp_path):
+	spill = SpillBuffer(str(tmp_path), "default")
+	for index in range(3):
+		spill.append(record(f"topic/{index}"))
+	spill.close()
+
+	spill = SpillBuffer(str(tmp_path), "default")
+	assert len(spill) == 3
+
+	path = spill.take()
+	assert [list(chunk) for chunk in SpillBuffer.read_chunks(path, 2)] == [
+		[record("topic/0"), record("topic/1")],
+		[record("topic/2")],
+	]
+	assert spill.take() == path  # until removed
+	SpillBuffer.remove(path)
+	assert not spill.pending
+
+
+@pytest.mark.asyncio
+async def test_writer_stores_broker():
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.BROKER_COLUMN: True}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+
+	await writer.flush(
+		[("a", "1", 0, False, NOW, None, None, None, "site-a"), ("b", "2", 0, False, NOW)]
+	)
+
+	((_, records, columns),) = database.pool.copied
+	assert columns == BatchWriter.COLUMNS + ["broker"]
+	assert records == [("a", "1", 0, False, NOW, "site-a"), ("b", "2", 0, False, NOW, None)]
@@ -0,0 +1,108 @@
+import datetime
+import hashlib
+from test.setup_test import FakePool
+
+import pytest
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.dedup_filter import CuckooFilter, DedupFilter
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def digest(value: int) -> bytes:
+	return hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+
+
+def test_cuckoo_filter():
+	cuckoo = CuckooFilter(1000)
+	digests = [digest(i) for i in range(1000)]
+	assert all(cuckoo.add(value) for value in digests)
+
+	assert len(cuckoo) == 1000
+	assert all(value in cuckoo for value in digests)
+	assert not any(digest(i) in cuckoo for i in range(10000, 20000))
+
+
+def test_full_filter_rotates():
+	dedup = DedupFilter({"capacity": 10})
+	keys = [dedup.get_key("sensor/a", str(i).encode()) for i in range(100)]
+
+	assert not any(dedup.is_duplicate(key, now=1) for key in keys)
+	assert dedup.is_duplicate(keys[-1], now=1)
+
+
+def test_keys():
+	dedup = DedupFilter({"topics": ["sensor/#"]})
+	assert dedup
+	assert not DedupFilter(None)
+
+	key = dedup.get_key("sensor/a", b"21.5")
+	assert len(key) == 16
+	assert key == dedup.get_key("sensor/a", b"21.5")
+	assert key != dedup.get_key("sensor/b", b"21.5")
+	assert key != dedup.get_key("sensor/a", b"21.5", published=NOW)
+	assert key != dedup.get_key("sensor/a", b"21.5", broker="other")
+	assert dedup.get_key("other/a", b"21.5") is None
+	assert DedupFilter({})
+
+
+def test_stored_keys_expire():
+	dedup = DedupFilter({"window_seconds": 60})
+	key = dedup.get_key("switch/a", b"ON")
+
+	stored = dedup.get_stored_key(key, NOW)
+	assert len(stored) == 16
+	assert stored == dedup.get_stored_key(key, NOW + datetime.timedelta(seconds=59))
+	assert stored != dedup.get_stored_key(key, NOW + datetime.timedelta(seconds=60))
+
+
+def test_window():
+	dedup = DedupFilter({"window_seconds": 10, "capacity": 1000})
+	key = dedup.get_key("sensor/a", b'{"ts": 1}')
+
+	assert not dedup.is_duplicate(key, now=100)
+	assert dedup.is_duplicate(key, now=105)
+	assert dedup.is_duplicate(key, now=112)  # previous generation
+	assert dedup.is_duplicate(key, now=125)  # refreshed at 112
+	assert not dedup.is_duplicate(key, now=200)  # expired
+	assert dedup.duplicate_count == 3
+
+
+@pytest.mark.asyncio
+async def test_insert_deduplicated():
+	config = {DatabaseConfKey.HOST: "localhost"}
+	database = Database(config)
+	database._pool = FakePool(results={"INSERT INTO journal ": [(b"k" * 16,)]})
+	writer = BatchWriter(database, config)
+
+	key = b"k" * 16
+	records = [
+		("sensor/a", "1", 1, False, NOW, None, None, key),
+		("sensor/a", "1", 1, False, NOW, None, None, key),
+	]
+	await writer.flush(records)
+
+	(create,) = database.pool.executed
+	(copy,) = database.pool.copied
+	_, insert, _ = database.pool.calls[-2]  # fetch (RETURNING)
+	assert create.startswith("CREATE TEMPORARY TABLE IF NOT EXISTS journal_staging")
+	assert copy[0] == "journal_staging"
+	assert copy[1][0] == ("sensor/a", "1", 1, False, NOW, key)
+	assert copy[2] == BatchWriter.COLUMNS + ["dedup_key"]
+	assert insert.endswith("ON CONFLICT DO NOTHING RETURNING dedup_key")
+	assert writer.duplicate_count == 1
+
+
+@pytest.mark.asyncio
+async def test_no_dedup_keys_use_copy():
+	config = {DatabaseConfKey.HOST: "localhost"}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+
+	await writer.flush([("sensor/a", "1", 1, False, NOW, None, None, None)])
+	assert database.pool.calls == [
+		("copy", "journal", [("sensor/a", "1", 1, False, NOW)], BatchWriter.COLUMNS)
+	]
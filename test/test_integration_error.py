@@ -26,7 +26,7 @@ def config_file(database_config):
 	return create_config_file(config_data, database_config, ["#"])
 
 
+@pytest.mark.asyncio
 async def test_no_database_abort(config_file):
-	with pytest.raises(TypeError) as ex:
+	with pytest.raises(OSError):  # app settings (e.g. table_name) are not passed to asyncpg anymore
 		await run_service(config_file, False, None, "info", True, True)
-		assert "connect() got an unexpected keyword argument" in str(ex)
@@ -0,0 +1,84 @@
+import datetime
+import json
+from test.setup_test import FakePool
+
+import pytest
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.job_feeder import JobFeeder
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+RULES = [
+	{"topic": "alarm/#", "entrypoint": "on_alarm", "priority": 10},
+	{"topic": "device/+/event", "entrypoint": "on_event"},
+]
+
+
+def test_create_jobs():
+	feeder = JobFeeder(RULES)
+	assert feeder
+	assert not JobFeeder(None)
+
+	records = [
+		("alarm/fire", "1", 1, False, NOW),
+		("device/a/state", "on", 0, True, NOW),
+		("device/a/event", "x" * (JobFeeder.MAX_TEXT_LENGTH + 1), 0, False, NOW),
+		("device/b/event", '{"a": 1}', 2, True, NOW),
+	]
+	assert feeder.create_jobs(records) == [
+		(0, "alarm/fire", "1", 1, 0, NOW, 10, "queued", "on_alarm"),
+		(0, "device/b/event", '{"a": 1}', 2, 1, NOW, 0, "queued", "on_event"),
+	]
+	assert feeder.skipped_count == 1
+
+
+@pytest.mark.asyncio
+async def test_enqueue_per_flush():
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.JOBS: RULES}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+
+	await writer.flush([("alarm/fire", "1", 1, False, NOW)] * 3 + [("other", "1", 0, False, NOW)])
+
+	begin, journal, jobs, notify, commit = database.pool.calls
+	assert (begin, commit) == (("BEGIN",), ("COMMIT",))
+	assert (journal[1], len(journal[2])) == ("journal", 4)
+	assert (jobs[1], len(jobs[2])) == ("pgqueuer", 3)
+	_, query, (channel, payload) = notify
+	assert query == "SELECT pg_notify($1, $2)"
+	assert channel == "ch_pgqueuer"
+	assert json.loads(payload)["table"] == "pgqueuer"
+
+
+@pytest.mark.asyncio
+async def test_no_jobs_without_transaction():
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.JOBS: RULES}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+
+	await writer.flush([("other", "1", 0, False, NOW)])
+	assert [(call[0], call[1]) for call in database.pool.calls] == [("copy", "journal")]
+
+
+@pytest.mark.asyncio
+async def test_no_jobs_for_duplicates():
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.JOBS: RULES}
+	database = Database(config)
+	database._pool = FakePool(results={"INSERT INTO journal ": [(b"new",), (None,)]})
+	writer = BatchWriter(database, config)
+
+	records = [
+		("alarm/a", "1", 1, False, NOW, None, None, b"known"),
+		("alarm/b", "1", 1, False, NOW, None, None, b"new"),
+		("alarm/b", "1", 1, False, NOW, None, None, b"new"),
+		("alarm/c", "1", 1, False, NOW, None, None, None),
+	]
+	await writer.flush(records)
+
+	_, jobs = database.pool.copied
+	assert [job[1] for job in jobs[1]] == ["alarm/b", "alarm/c"]
+	assert writer.duplicate_count == 2
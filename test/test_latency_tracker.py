@@ -0,0 +1,102 @@
+import datetime
+from test.setup_test import FakePool
+
+import pytest
+
+from src.database import Database, DatabaseConfKey
+from src.latency_tracker import (
+	LatencyHistogram,
+	LatencyTracker,
+	get_publish_time,
+	parse_publish_time,
+)
+from src.writer_pipeline import WriterPipeline
+
+UTC = datetime.timezone.utc
+COMMIT_TIME = datetime.datetime(2024, 5, 1, 12, 0, 0, tzinfo=UTC)
+
+
+class FakeProperties:
+	def __init__(self, user_properties):
+		self.UserProperty = user_properties
+
+
+def test_parse_publish_time():
+	expected = datetime.datetime(2024, 5, 1, 12, 0, 0, tzinfo=UTC)
+	assert parse_publish_time("1714564800") == expected
+	assert parse_publish_time("1714564800000") == expected
+	assert parse_publish_time("1714564800.5") == expected + datetime.timedelta(seconds=0.5)
+	assert parse_publish_time("2024-05-01T12:00:00") == expected
+	assert parse_publish_time("2024-05-01T14:00:00+02:00") == expected
+	assert parse_publish_time("yesterday") is None
+
+
+def test_get_publish_time():
+	properties = FakeProperties([("source", "plc"), ("ts", "1714564800")])
+	assert get_publish_time(properties, "ts") == datetime.datetime(2024, 5, 1, 12, tzinfo=UTC)
+	assert get_publish_time(properties, "time") is None
+	assert get_publish_time(FakeProperties(None), "ts") is None
+	assert get_publish_time(None, "ts") is None
+
+
+def test_histogram():
+	histogram = LatencyHistogram()
+	for _ in range(90):
+		histogram.add(0.004)
+	for _ in range(9):
+		histogram.add(0.3)
+	histogram.add(7)
+
+	assert histogram.count == 100
+	assert histogram.max == 7
+	assert histogram.percentile(0.5) == 0.005
+	assert histogram.percentile(0.95) == 0.5
+	assert histogram.percentile(0.99) == 0.5
+	assert histogram.percentile(1.0) == 7
+
+
+def test_tracker():
+	tracker = LatencyTracker("alarm", "journal")
+	received = COMMIT_TIME - datetime.timedelta(milliseconds=40)
+	published = COMMIT_TIME - datetime.timedelta(seconds=3)
+	records = [
+		("a", "1", 0, False, received),
+		("a", "2", 0, False, received, published),
+		("a", "3", 0, False, received, None),
+	]
+	tracker.on_committed(records, COMMIT_TIME)
+
+	rows = {row[3]: row for row in tracker.summarize(COMMIT_TIME)}
+	assert rows[LatencyTracker.RECEIVE][:5] == (COMMIT_TIME, "alarm", "journal", "receive", 3)
+	assert rows[LatencyTracker.RECEIVE][5] == pytest.approx(40)
+	assert rows[LatencyTracker.PUBLISH][4] == 1
+	assert rows[LatencyTracker.PUBLISH][9] == pytest.approx(3000)
+
+	assert tracker.summarize(COMMIT_TIME) == []  # reset
+
+
+@pytest.mark.asyncio
+async def test_store_latency_stats():
+	config = {
+		DatabaseConfKey.HOST: "localhost",
+		DatabaseConfKey.LATENCY_STATS_INTERVAL_SECONDS: 60,
+		DatabaseConfKey.LANES: [{"name": "alarm", "topics": ["alarm/#"]}],
+	}
+	database = Database(config)
+	database._pool = pool = FakePool()
+	pipeline = WriterPipeline(database, config)
+
+	assert await pipeline.store_latency_stats() == 0
+
+	record = ("alarm/1", "1", 0, False, database._now_utc(), database._now_utc())
+	await pipeline.writers[1].flush([record])
+	pipeline.writers[1].latency.on_committed([record], database._now_utc())
+
+	assert await pipeline.store_latency_stats() == 2
+	stats_table, rows, columns = pool.copied[-1]
+	assert stats_table == "journal_latency"
+	assert columns == LatencyTracker.COLUMNS
+	assert [(row[1], row[3]) for row in rows] == [("alarm", "receive"), ("alarm", "publish")]
+
+	# the publish time is not stored in the journal
+	assert pool.copied[0][1] == [record[:5]]
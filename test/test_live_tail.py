@@ -0,0 +1,72 @@
+import asyncio
+import json
+from test.setup_test import NOW, record
+
+import pytest
+
+from src.live_tail import LiveTail, LiveTailClient
+
+
+@pytest.mark.asyncio
+async def test_client_filters():
+	client = LiveTailClient(max_buffer=10)
+	client.subscribe(["sensors/+/temperature", "alarm/#"])
+	for topic in ["sensors/a/temperature", "sensors/a/humidity", "alarm/fire", "other"]:
+		client.offer(record(topic))
+
+	assert [r[0] for r in await client.get()] == ["sensors/a/temperature", "alarm/fire"]
+
+	client.unsubscribe(["alarm/#"])
+	client.offer(record("alarm/fire"))
+	assert client.filters == ["sensors/+/temperature"]
+	assert not client._buffer
+
+	with pytest.raises(ValueError):
+		client.subscribe(["a/#/b"])
+
+
+@pytest.mark.asyncio
+async def test_slow_client_drops_oldest():
+	client = LiveTailClient(max_buffer=3)
+	client.subscribe(["#"])
+	for index in range(5):
+		client.offer(record("topic", str(index)))
+
+	assert [r[1] for r in await client.get()] == ["2", "3", "4"]
+	assert client.dropped_count == 2
+
+
+def test_enabled():
+	assert LiveTail({})
+	assert not LiveTail(None)
+
+
+@pytest.mark.asyncio
+async def test_websocket():
+	live_tail = LiveTail({"max_buffer": 10})
+	app = live_tail.create_app()
+
+	async with app.test_client().websocket("/tail") as ws:
+		await ws.send(json.dumps({"subscribe": ["sensors/#"]}))
+		assert json.loads(await ws.receive()) == {"subscriptions": ["sensors/#"]}
+
+		live_tail.publish(record("other/a"))
+		live_tail.publish(record("sensors/a", "21.5"))
+		message = json.loads(await asyncio.wait_for(ws.receive(), 1))
+		assert message == {
+			"topic": "sensors/a",
+			"text": "21.5",
+			"qos": 0,
+			"retain": False,
+			"time": NOW.isoformat(),
+		}
+
+		await ws.send("no json")
+		assert "error" in json.loads(await ws.receive())
+		await ws.send(json.dumps({"subscribe": "alarm/#"}))  # not split into characters
+		assert json.loads(await ws.receive()) == {
+			"error": "'subscribe' expects a list of topic filters"
+		}
+
+	await asyncio.sleep(0.01)
+	assert not live_tail.clients
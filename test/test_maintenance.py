@@ -0,0 +1,111 @@
+import datetime
+from test.setup_test import FakePool
+
+import pytest
+
+from src.archiver import Archiver
+from src.database import Database, DatabaseConfKey
+from src.maintenance import (
+	MaintenanceJobKind,
+	MaintenanceScheduler,
+	MaintenanceStatus,
+	get_lock_key,
+	is_in_window,
+	parse_window,
+)
+from src.payload_store import PayloadStore
+
+NOW = datetime.datetime(2024, 1, 1, 3, tzinfo=datetime.timezone.utc)
+
+
+def test_window():
+	window = parse_window("22:00 - 04:30")
+	assert is_in_window(window, datetime.time(23, 0))
+	assert is_in_window(window, datetime.time(4, 0))
+	assert not is_in_window(window, datetime.time(4, 30))
+	assert not is_in_window(parse_window("01:00-05:00"), datetime.time(12, 0))
+	assert is_in_window(None, datetime.time(12, 0))
+
+	with pytest.raises(ValueError):
+		parse_window("22-4")
+
+
+def test_lock_key():
+	key = get_lock_key("mqtt-pg-logger:journal:vacuum")
+	assert key == get_lock_key("mqtt-pg-logger:journal:vacuum")
+	assert key != get_lock_key("mqtt-pg-logger:journal:clean_up")
+	assert -(2**63) <= get_lock_key("x") < 2**63
+
+
+def create_fake_pool(locked: bool = True, last_run: datetime.datetime | None = None) -> FakePool:
+	return FakePool(results={"pg_try_advisory_lock": locked, "SELECT last_run": last_run})
+
+
+def create_scheduler(pool: FakePool, queued: int = 0, **job_config) -> MaintenanceScheduler:
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.PAYLOAD_STORE: {"min_size": 100}}
+	database = Database(config)
+	database._pool = pool
+	database._now_utc = lambda: NOW
+	return MaintenanceScheduler(
+		database,
+		Archiver(database, config),
+		{"jobs": [{"job": MaintenanceJobKind.VACUUM, **job_config}]},
+		PayloadStore(config[DatabaseConfKey.PAYLOAD_STORE]),
+		lambda: queued,
+	)
+
+
+@pytest.mark.asyncio
+async def test_vacuum():
+	pool = create_fake_pool()
+	scheduler = create_scheduler(pool, max_seconds=60)
+	(job,) = scheduler.jobs
+
+	assert await scheduler.run_job(job) == MaintenanceStatus.DONE
+	assert pool.executed[:3] == [
+		"SET statement_timeout = 60000",
+		"VACUUM (ANALYZE) journal, journal_payloads",
+		"RESET statement_timeout",
+	]
+	assert pool.timeouts["VACUUM (ANALYZE) journal, journal_payloads"] == 60  # not command_timeout
+	assert pool.executed[3].startswith("INSERT INTO journal_maintenance")
+	assert pool.executed[4] == "SELECT pg_advisory_unlock($1)"
+
+
+@pytest.mark.asyncio
+async def test_runs_on_one_instance():
+	pool = create_fake_pool(locked=False)  # locked by another instance
+	scheduler = create_scheduler(pool)
+	assert await scheduler.run_job(scheduler.jobs[0]) is None
+	assert pool.executed == []
+
+	pool = create_fake_pool(last_run=NOW - datetime.timedelta(hours=1))  # done by another instance
+	scheduler = create_scheduler(pool, interval_minutes=120)
+	assert await scheduler.run_job(scheduler.jobs[0]) is None
+	assert pool.executed == ["SELECT pg_advisory_unlock($1)"]
+
+
+def test_due_jobs():
+	scheduler = create_scheduler(create_fake_pool(), queued=20000, window="01:00-05:00")
+	assert scheduler.get_due_jobs(0.0, datetime.time(3, 0)) == scheduler.jobs
+	assert scheduler.get_due_jobs(0.0, datetime.time(12, 0)) == []
+	assert scheduler.is_busy()
+
+
+def test_periodic_archiving_is_a_job():
+	config = {
+		DatabaseConfKey.HOST: "localhost",
+		DatabaseConfKey.ARCHIVE_DIR: "archive",
+		DatabaseConfKey.ARCHIVE_INTERVAL_MINUTES: 60,
+	}
+	database = Database(config)
+	archiver = Archiver(database, config)
+
+	scheduler = MaintenanceScheduler(database, archiver, None)
+	assert scheduler
+	(job,) = scheduler.jobs
+	assert job.kind == MaintenanceJobKind.CLEAN_UP
+	assert job.interval == datetime.timedelta(minutes=60)
+
+	with pytest.raises(ValueError):
+		MaintenanceScheduler(database, archiver, {"jobs": [{"job": MaintenanceJobKind.CLEAN_UP}]})
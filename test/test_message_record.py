@@ -0,0 +1,13 @@
+from src.message_record import TopicCache
+
+
+def test_topic_cache():
+	cache = TopicCache(max_size=2)
+
+	topic = cache.get("".join(["a/", "b"]))
+	assert cache.get("".join(["a/", "b"])) is topic  # shared instance
+
+	cache.get("a/c")
+	assert len(cache) == 2
+	cache.get("a/d")
+	assert len(cache) == 1  # bounded: dropped as a whole
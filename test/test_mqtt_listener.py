@@ -1,18 +1,25 @@
+import logging
 from test.setup_test import SetupTest
 
+import aiomqtt
 import pytest
+import yaml
 
 from src.app_config import AppConfig
 from src.constants import MqttConfKey
-from src.mqtt_listener import MqttListener
+from src.mqtt_listener import MqttListeners
 
 
-def create_listener(skip_subscriptions):
+def create_listener(skip_subscriptions, client=None):
 	config_file = SetupTest.get_test_config_path()
 	config = AppConfig(config_file)
 	config._config_data["mqtt"][MqttConfKey.SUBSCRIPTIONS] = ["base1/#", "base2/#"]
 	config._config_data["mqtt"][MqttConfKey.SKIP_SUBSCRIPTION_REGEXES] = skip_subscriptions
-	return MqttListener(config)
+	if client is None:
+		(listener,) = MqttListeners(config)
+	else:
+		(listener,) = MqttListeners(config, client_factory=lambda **_: client)
+	return listener
 
 
 @pytest.mark.asyncio
@@ -27,3 +34,115 @@ async def test_accept_topic():
 	assert listener.is_valid_topic("base2/exclude") is False
 	assert listener.is_valid_topic("base2/exclude/2") is False
 	assert listener.is_valid_topic("base2/exclude2") is False
+
+
+class FakeClient:
+	def __init__(self, topics=()):
+		self.subscribed = []
+		self.unsubscribed = []
+		self._topics = topics
+
+	@property
+	async def messages(self):
+		for mid, topic in enumerate(self._topics, 1):
+			yield aiomqtt.Message(topic, b"1", 1, False, mid, None)
+
+	async def subscribe(self, topic, qos):
+		self.subscribed.append(topic)
+
+	async def unsubscribe(self, topic):
+		self.unsubscribed.extend(topic)
+
+
+@pytest.mark.asyncio
+async def test_update_subscriptions():
+	client = FakeClient()
+	listener = create_listener([], client)
+	listener._connected = True
+
+	await listener.update_subscriptions(
+		{
+			MqttConfKey.SUBSCRIPTIONS: ["base1/#", "base3/#", "base3/skip/#"],
+			MqttConfKey.SKIP_SUBSCRIPTION_REGEXES: ["^base3/skip"],
+		}
+	)
+	assert client.subscribed == ["base3/#"]
+	assert client.unsubscribed == ["base2/#"]
+	assert sorted(listener._subscriptions) == ["base1/#", "base3/#"]
+	assert listener.is_valid_topic("base3/skip") is False
+
+	await listener.update_subscriptions({MqttConfKey.SUBSCRIPTIONS: []})  # kept
+	assert sorted(listener._subscriptions) == ["base1/#", "base3/#"]
+
+	# messages of removed subscriptions, still in flight
+	stored = []
+	listener._targets.put = lambda record: stored.append(record[0])
+	await listener._receive(FakeClient(["base1/a", "base2/a", "base3/skip/a", "base3/a"]))
+	assert stored == ["base1/a", "base3/a"]
+
+
+@pytest.mark.asyncio
+async def test_added_subscriptions_accepted_while_subscribing():
+	accepted = []
+
+	class CheckingClient(FakeClient):
+		async def subscribe(self, topic, qos):
+			# e.g. retained messages arrive before the subscribe returns
+			accepted.append((listener._filter.accepts("base3/a"), listener._filter.accepts("base2/a")))
+
+		async def unsubscribe(self, topic):
+			accepted.append((listener._filter.accepts("base3/a"), listener._filter.accepts("base2/a")))
+
+	listener = create_listener([], CheckingClient())
+	listener._connected = True
+	await listener.update_subscriptions({MqttConfKey.SUBSCRIPTIONS: ["base1/#", "$share/g/base3/#"]})
+
+	assert accepted == [(True, True), (True, True)]  # in flight: both the added and removed
+	assert listener._filter.accepts("base3/a") is True
+	assert listener._filter.accepts("base2/a") is False
+
+
+def create_listeners(mqtt_configs):
+	config = AppConfig(SetupTest.get_test_config_path())
+	config._config_data["mqtt"] = [
+		{**config._config_data["mqtt"], **mqtt_config} for mqtt_config in mqtt_configs
+	]
+	return MqttListeners(config)
+
+
+@pytest.mark.asyncio
+async def test_multiple_brokers():
+	listeners = create_listeners(
+		[{MqttConfKey.NAME: "site-a"}, {MqttConfKey.HOST: "broker-b", MqttConfKey.PORT: 1884}]
+	)
+	assert [listener.name for listener in listeners] == ["site-a", "broker-b:1884"]
+
+	with pytest.raises(ValueError):
+		create_listeners([{MqttConfKey.NAME: "site-a"}, {MqttConfKey.NAME: "site-a"}])
+
+
+@pytest.mark.asyncio
+async def test_reload_matches_brokers_by_name(tmp_path, caplog):
+	listeners = create_listeners([{MqttConfKey.NAME: "site-a"}, {MqttConfKey.NAME: "site-b"}])
+	site_a, site_b = listeners
+	site_b_subscriptions = site_b.subscriptions
+
+	config_data = dict(listeners._config._config_data)
+	mqtt_config = config_data["mqtt"][0]
+	config_data["mqtt"] = [  # reordered, "site-b" removed, "site-c" added
+		{**mqtt_config, MqttConfKey.NAME: "site-c"},
+		{**mqtt_config, MqttConfKey.NAME: "site-a", MqttConfKey.SUBSCRIPTIONS: ["base3/#"]},
+	]
+	config_file = tmp_path / "config.yaml"
+	config_file.write_text(yaml.dump(config_data))
+	config_file.chmod(0o600)
+	listeners._config._config_file = str(config_file)
+
+	with caplog.at_level(logging.WARNING):
+		await listeners.reload()
+
+	assert site_a.subscriptions == ["base3/#"]
+	assert site_b.subscriptions == site_b_subscriptions
+	assert "added MQTT brokers need a restart: site-c" in caplog.text
+	assert "removed MQTT brokers need a restart: site-b" in caplog.text
+	assert "config changes need a restart" not in caplog.text
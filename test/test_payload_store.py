@@ -0,0 +1,89 @@
+import datetime
+from test.setup_test import FakePool
+
+import pytest
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.payload_store import PayloadStore, PayloadStoreConfKey, get_payload_hash
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+LARGE = '{"status": "' + "x" * 100 + '"}'
+
+
+def test_prepare():
+	store = PayloadStore({PayloadStoreConfKey.MIN_SIZE: 100})
+	rows = [("a", "small", 0, False, NOW), ("b", LARGE, 0, False, NOW), ("c", LARGE, 1, True, NOW)]
+	payload_hash = get_payload_hash(LARGE)
+
+	prepared, payloads = store.prepare(rows, now=0)
+	assert prepared == [
+		("a", "small", 0, False, NOW, None),
+		("b", None, 0, False, NOW, payload_hash),
+		("c", None, 1, True, NOW, payload_hash),
+	]
+	assert payloads == {payload_hash: LARGE}
+	assert store.reused_count == 1
+
+	store.remember(payloads, now=0)
+	prepared, payloads = store.prepare(rows, now=10)
+	assert payloads == {}
+	assert store.reused_count == 3
+
+	_, payloads = store.prepare(rows, now=PayloadStore.CACHE_MAX_AGE_SECONDS + 1)  # expired
+	assert payloads == {payload_hash: LARGE}
+
+
+def test_prune_spares_cached_payloads():
+	assert PayloadStore({})
+	assert not PayloadStore(None)
+
+	query = PayloadStore({}).get_prune_query("journal")
+	assert query == (
+		"DELETE FROM journal_payloads p WHERE p.created < $1 "
+		"AND p.last_used < NOW() - INTERVAL '7200 seconds' "
+		"AND NOT EXISTS (SELECT 1 FROM journal j WHERE j.payload_hash = p.hash)"
+	)
+	assert PayloadStore.PRUNE_MIN_UNUSED_SECONDS > PayloadStore.CACHE_MAX_AGE_SECONDS
+
+
+def test_lru():
+	store = PayloadStore({PayloadStoreConfKey.CACHE_SIZE: 2})
+	hashes = [bytes([index]) for index in range(3)]
+	store.remember({hashes[0]: "0", hashes[1]: "1"}, now=0)
+	assert store.is_known(hashes[0], now=0)  # most recently used now
+	store.remember({hashes[2]: "2"}, now=0)
+	assert store.is_known(hashes[0], now=0)
+	assert not store.is_known(hashes[1], now=0)
+	assert store.is_known(hashes[2], now=0)
+
+
+@pytest.mark.asyncio
+async def test_writer_stores_payloads_once():
+	config = {
+		DatabaseConfKey.HOST: "localhost",
+		DatabaseConfKey.PAYLOAD_STORE: {PayloadStoreConfKey.MIN_SIZE: 100},
+	}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+	payload_hash = get_payload_hash(LARGE)
+
+	await writer.flush([("a", LARGE, 0, False, NOW)])
+	await writer.flush([("a", LARGE, 0, False, NOW), ("b", "1", 0, False, NOW)])
+
+	(_, query, args) = next(call for call in database.pool.calls if call[0] == "execute")
+	assert query.startswith("INSERT INTO journal_payloads (hash, text)")
+	assert query.endswith("ON CONFLICT (hash) DO UPDATE SET last_used = NOW()")
+	assert args == ([payload_hash], [LARGE])
+	first_copy, second_copy = database.pool.copied
+	assert first_copy == (
+		"journal",
+		[("a", None, 0, False, NOW, payload_hash)],
+		BatchWriter.COLUMNS + ["payload_hash"],
+	)
+	assert second_copy[1] == [
+		("a", None, 0, False, NOW, payload_hash),
+		("b", "1", 0, False, NOW, None),
+	]
+	assert writer.payloads.stored_count == 1
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from src.profiler import CpuSampler, Profiler, Stage
+
+
+def test_stage_timings(tmp_path):
+	profiler = Profiler()
+	profiler.configure(str(tmp_path))
+	before = time.perf_counter_ns()
+	profiler.start()
+	try:
+		profiler.lap(Stage.RECEIVE, before)  # started before profiling: ignored
+		start = profiler.lap(Stage.TRANSFORM, time.perf_counter_ns())
+		profiler.lap(Stage.ENQUEUE, start)
+
+		summary = profiler.get_stage_summary()
+		assert "receive" not in summary
+		assert "transform: 1 x" in summary
+		assert "enqueue: 1 x" in summary
+	finally:
+		profiler.stop()
+
+	assert not profiler.enabled
+	assert profiler.get_stage_summary() == "no samples"
+	(memory_file,) = tmp_path.glob("profile-*-memory.txt")
+	assert "top 20 allocations" in memory_file.read_text()
+
+
+def test_toggle(tmp_path):
+	profiler = Profiler()
+	profiler.configure(str(tmp_path))
+	profiler.toggle()
+	assert profiler.enabled
+	profiler.toggle()
+	assert not profiler.enabled
+
+
+def test_keeps_foreign_tracing(tmp_path):
+	tracemalloc.start()  # e.g. PYTHONTRACEMALLOC
+	try:
+		profiler = Profiler()
+		profiler.configure(str(tmp_path))
+		profiler.start()
+		profiler.stop()
+		assert tracemalloc.is_tracing()
+	finally:
+		tracemalloc.stop()
+
+
+@pytest.mark.asyncio
+async def test_periodic_report_in_thread(tmp_path):
+	profiler = Profiler()
+	profiler.configure(str(tmp_path), interval=0.01)
+	threads = []
+	profiler.report = lambda: threads.append(threading.get_ident())
+	profiler.enabled = True
+
+	task = asyncio.create_task(profiler.run())
+	for _ in range(100):
+		if threads:
+			break
+		await asyncio.sleep(0.01)
+	task.cancel()
+	assert threads and threads[0] != threading.get_ident()
+
+
+def test_cpu_sampler(tmp_path):
+	sampler = CpuSampler(0.001)
+	sampler.start()
+	try:
+		end = time.process_time() + 0.2
+		while time.process_time() < end:
+			pass
+	finally:
+		sampler.stop()
+
+	assert sampler.sample_count > 0
+	path = tmp_path / "cpu.folded"
+	sampler.write(str(path))
+	assert "test_cpu_sampler (test_profiler.py:" in path.read_text()
@@ -0,0 +1,104 @@
+from test.setup_test import record
+
+from src.ack_tracker import AckTracker
+from src.rate_limiter import Admission, RateLimiter, RateLimitMode
+
+LATEST_RULES = [{"topic": "sensor/#", "rate": 1, "burst": 1, "mode": RateLimitMode.LATEST}]
+
+
+def test_unlimited_topics():
+	limiter = RateLimiter([{"topic": "limited/#", "rate": 1, "burst": 1}])
+	assert limiter
+	assert not RateLimiter(None)
+
+	assert all(limiter.admit(record("other/topic"), now=0) == Admission.STORE for _ in range(100))
+	assert limiter.bucket_count == 0
+
+
+def test_drop():
+	limiter = RateLimiter([{"topic": "sensor/+", "rate": 2, "burst": 3}])
+
+	admitted = [limiter.admit(record("sensor/a"), now=0) for _ in range(5)]
+	assert admitted == [Admission.STORE] * 3 + [Admission.DROP] * 2
+	# buckets are per topic
+	assert limiter.admit(record("sensor/b"), now=0) == Admission.STORE
+
+	assert limiter.admit(record("sensor/a"), now=0.5) == Admission.STORE  # one token refilled
+	assert limiter.admit(record("sensor/a"), now=0.5) == Admission.DROP
+
+	assert limiter.shed_total == 3
+	assert limiter.get_shed_counts() == {"sensor/a": 3}
+	assert limiter.release(now=10) == []
+
+
+def test_latest():
+	shed = []
+	limiter = RateLimiter(LATEST_RULES, on_shed=shed.append)
+
+	assert limiter.admit(record("sensor/a", "1"), now=0) == Admission.STORE
+	assert limiter.admit(record("sensor/a", "2"), now=0.1) == Admission.HOLD
+	assert limiter.admit(record("sensor/a", "3"), now=0.2) == Admission.HOLD
+	assert limiter.shed_total == 1  # "2" got replaced by "3"
+	assert shed == [record("sensor/a", "2")]
+
+	assert limiter.release(now=0.5) == []
+	assert limiter.release(now=1.0) == [record("sensor/a", "3")]
+	assert limiter.release(now=5.0) == []
+
+
+def test_latest_not_stored_after_newer():
+	shed = []
+	limiter = RateLimiter(LATEST_RULES, on_shed=shed.append)
+
+	assert limiter.admit(record("sensor/a", "1"), now=0) == Admission.STORE
+	assert limiter.admit(record("sensor/a", "2"), now=0.1) == Admission.HOLD
+	assert limiter.admit(record("sensor/a", "3"), now=1.5) == Admission.STORE
+	assert limiter.release(now=10) == []
+	assert limiter.shed_total == 1
+	assert shed == [record("sensor/a", "2")]
+
+
+def test_latest_acknowledged_once_stored():
+	acked = []
+	tracker = AckTracker(lambda mid, qos: acked.append(mid), 10)
+	limiter = RateLimiter(LATEST_RULES, on_shed=tracker.discard)
+	records = [record("sensor/a", str(mid)) + (None, tracker.track(mid, 1)) for mid in (1, 2, 3)]
+
+	admissions = [limiter.admit(r, now=0) for r in records]
+	assert admissions == [Admission.STORE, Admission.HOLD, Admission.HOLD]
+	tracker.release(records[:1])
+	assert acked == [1, 2]  # "2" got replaced
+
+	assert limiter.release(now=1.0) == records[2:]
+	assert acked == [1, 2]  # the held one is acknowledged once stored
+	tracker.release(records[2:])
+	assert acked == [1, 2, 3]
+
+
+def test_bounded_state():
+	shed = []
+	limiter = RateLimiter(
+		[{"topic": "#", "rate": 1, "burst": 1, "mode": RateLimitMode.LATEST}],
+		max_topics=100,
+		on_shed=shed.append,
+	)
+	for index in range(1000):
+		limiter.admit(record(f"device/{index}"), now=0)
+		limiter.admit(record(f"device/{index}"), now=0)
+
+	assert limiter.bucket_count == 100
+	assert len(shed) == 900  # held by evicted buckets
+	assert len(limiter.release(now=10)) == 100
+
+
+def test_least_recently_used_evicted():
+	limiter = RateLimiter([{"topic": "#", "rate": 1, "burst": 1}], max_topics=2)
+	assert limiter.admit(record("hot"), now=0) == Admission.STORE
+	assert limiter.admit(record("cold"), now=0) == Admission.STORE
+	assert limiter.admit(record("hot"), now=0) == Admission.DROP  # flooding, used most recently
+	assert limiter.admit(record("new"), now=0) == Admission.STORE  # evicts "cold"
+
+	assert limiter.admit(record("hot"), now=0) == Admission.DROP  # no fresh bucket
+	assert limiter.admit(record("cold"), now=0) == Admission.STORE  # evicts "new"
+	assert limiter.get_shed_counts() == {"hot": 2}
+	assert limiter.bucket_count == 2
@@ -0,0 +1,124 @@
+import datetime
+import gzip
+import json
+from test.setup_test import SetupTest
+
+from src.app_config import AppConfig
+from src.constants import MqttConfKey
+from src.replayer import Replayer, ReplayFormat
+from src.subscription_filter import SubscriptionFilter
+
+
+def create_replayer():
+	config = AppConfig(SetupTest.get_test_config_path())
+	config._config_data["mqtt"][MqttConfKey.SUBSCRIPTIONS] = ["base1/#"]
+	config._config_data["mqtt"][MqttConfKey.SKIP_SUBSCRIPTION_REGEXES] = ["base1/exclude"]
+	return Replayer(config)
+
+
+def write_test_file(file_name: str, lines: list[str]) -> str:
+	SetupTest.ensure_test_dir()
+	path = SetupTest.get_test_path(file_name)
+	opener = gzip.open if path.endswith(".gz") else open
+	with opener(path, "wt") as f:
+		f.write("\n".join(lines))
+	return path
+
+
+def test_detect_format():
+	assert ReplayFormat.detect("dump.txt") == ReplayFormat.MOSQUITTO
+	assert ReplayFormat.detect("dump.jsonl.gz") == ReplayFormat.JSONL
+	assert ReplayFormat.detect("journal-1.csv.gz") == ReplayFormat.CSV
+	assert ReplayFormat.detect("journal-1.parquet") == ReplayFormat.PARQUET
+
+
+def test_read_mosquitto():
+	replayer = create_replayer()
+	path = write_test_file(
+		"replay.txt", ["base1/a 21.5", "base1/b hello world", "", "1700000000.5 c x"]
+	)
+
+	records = list(replayer.read_records(path, ReplayFormat.MOSQUITTO))
+	assert [(r[0], r[1]) for r in records] == [
+		("base1/a", "21.5"),
+		("base1/b", "hello world"),
+		("1700000000.5", "c x"),
+	]
+
+	path = write_test_file("replay-ts.txt", ["1700000000.5 base1/a {\"a\": 1}"])
+	records = list(replayer.read_records(path, ReplayFormat.MOSQUITTO_TS))
+	assert records[0][0:2] == ("base1/a", '{"a": 1}')
+	assert records[0][4].timestamp() == 1700000000.5
+
+
+def test_read_jsonl_and_csv():
+	replayer = create_replayer()
+	path = write_test_file(
+		"replay.jsonl.gz",
+		[
+			json.dumps({"topic": "base1/a", "payload": {"v": 1}, "qos": 1, "time": 1700000000}),
+			json.dumps(
+				{"topic": "base1/b", "text": "x", "retain": True, "time": "2024-03-01T10:00:00+00:00"}
+			),
+		],
+	)
+	records = list(replayer.read_records(path, ReplayFormat.JSONL))
+	assert records[0][0:4] == ("base1/a", '{"v": 1}', 1, False)
+	assert records[1][0:4] == ("base1/b", "x", 0, True)
+	assert records[1][4] == datetime.datetime(2024, 3, 1, 10, tzinfo=datetime.UTC)
+
+	path = write_test_file(
+		"replay.csv",
+		["message_id,topic,text,qos,retain,time", "1,base1/a,21.5,2,1,2024-03-01 10:00:00+00:00"],
+	)
+	records = list(replayer.read_records(path, ReplayFormat.CSV))
+	message_time = datetime.datetime(2024, 3, 1, 10, tzinfo=datetime.UTC)
+	assert records == [("base1/a", "21.5", 2, True, message_time)]
+
+
+def test_subscription_filter():
+	subscription_filter = SubscriptionFilter(
+		{
+			MqttConfKey.SUBSCRIPTIONS: ["base1/#"],
+			MqttConfKey.SKIP_SUBSCRIPTION_REGEXES: ["base1/exclude"],
+		}
+	)
+	assert subscription_filter.accepts("base1/a") is True
+	assert subscription_filter.accepts("base1/exclude/a") is False
+	assert subscription_filter.accepts("base2/a") is False
+
+
+def test_shared_subscription_filter():
+	subscription_filter = SubscriptionFilter({MqttConfKey.SUBSCRIPTIONS: ["$share/loggers/base1/#"]})
+	assert subscription_filter.subscriptions == ["$share/loggers/base1/#"]  # subscribed as is
+	assert subscription_filter.accepts("base1/a") is True
+	assert subscription_filter.accepts("base2/a") is False
+	assert subscription_filter.accepts("$share/loggers/base1/a") is False
+
+
+def test_invalid_lines_skipped():
+	replayer = create_replayer()
+	path = write_test_file(
+		"replay-invalid.jsonl",
+		[
+			json.dumps({"topic": "base1/a", "text": "1"}),
+			"{not json",
+			json.dumps({"text": "no topic"}),
+			json.dumps({"topic": "base1/b", "text": "2", "time": "yesterday"}),
+			json.dumps({"topic": "base1/c", "text": "3"}),
+		],
+	)
+	records = list(replayer.read_records(path, ReplayFormat.JSONL))
+	assert [r[0] for r in records] == ["base1/a", "base1/c"]
+	assert replayer.invalid_count == 3
+
+	path = write_test_file("replay-invalid.txt", ["1700000000 base1/a 1", "x base1/b 2"])
+	records = list(replayer.read_records(path, ReplayFormat.MOSQUITTO_TS))
+	assert [r[0] for r in records] == ["base1/a"]
+
+	path = write_test_file(
+		"replay-invalid.csv", ["topic,text,qos", "base1/a,1,x", "base1/b", "base1/c,3,0"]
+	)
+	records = list(replayer.read_records(path, ReplayFormat.CSV))
+	assert [r[0] for r in records] == ["base1/c"]
+	assert replayer.invalid_count == 6
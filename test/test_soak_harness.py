@@ -0,0 +1,88 @@
+import asyncio
+from test.setup_test import SetupTest
+from test.soak_harness import (
+	RecordedMessage,
+	ReplayClient,
+	SoakSample,
+	check_samples,
+	read_recording,
+	write_recording,
+)
+
+import pytest
+
+from src.app_config import AppConfig
+from src.constants import MqttConfKey
+from src.mqtt_listener import MqttListener
+
+RECORDING = [
+	RecordedMessage(0.0, "base1/a", b"1", qos=1),
+	RecordedMessage(0.01, "other/b", b"\xff\x00"),
+	RecordedMessage(0.02, "base1/c", b'{"value": 3}', retain=True),
+]
+
+
+def test_recording():
+	SetupTest.ensure_test_dir()
+	path = SetupTest.get_test_path("recording.jsonl")
+	assert write_recording(path, RECORDING) == 3
+	assert read_recording(path) == RECORDING
+
+
+class FakeTargets:
+	def __init__(self):
+		self.records = []
+
+	def __len__(self) -> int:
+		return 1
+
+	def put(self, record) -> None:
+		self.records.append(record)
+
+
+@pytest.mark.asyncio
+async def test_replay_into_listener():
+	config = AppConfig(SetupTest.get_test_config_path())
+	config._config_data["mqtt"][MqttConfKey.SUBSCRIPTIONS] = ["base1/#"]
+	targets = FakeTargets()
+	client = ReplayClient(RECORDING, speed=10, loops=2)
+	listener = MqttListener(config, targets, client_factory=lambda **_: client)
+
+	loop = asyncio.get_running_loop()
+	start = loop.time()
+	await listener.process()
+
+	assert loop.time() - start >= 0.005  # 2 * 0.03s recorded, 10x faster
+	assert [record[:4] for record in targets.records] == [
+		("base1/a", "1", 1, False),
+		("base1/c", '{"value": 3}', 0, True),
+	] * 2
+	assert client.delivered_count == 4
+
+
+def create_samples(rss: list[int], rows_per_sample: int = 1000) -> list[SoakSample]:
+	return [
+		SoakSample(
+			elapsed=index * 10.0,
+			rss_bytes=value,
+			objects=100000,
+			queue_depth=0,
+			stored=index * rows_per_sample,
+			rows_per_second=rows_per_sample / 10,
+		)
+		for index, value in enumerate(rss)
+	]
+
+
+def test_check_samples():
+	mib = 2**20
+	plateau = create_samples([50 * mib] * 2 + [80 * mib] * 14)
+	assert check_samples(plateau, warmup_seconds=20) == []
+
+	leaking = create_samples([(50 + index * 2) * mib for index in range(16)])
+	(failure,) = check_samples(leaking, warmup_seconds=20)
+	assert failure.startswith("memory keeps growing")
+
+	failures = check_samples(plateau, warmup_seconds=20, baseline_rows_per_second=200)
+	assert failures == ["throughput dropped: 100 rows/s (baseline: 200 rows/s)"]
+	assert check_samples(plateau, warmup_seconds=20, baseline_rows_per_second=120) == []
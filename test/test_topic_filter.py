@@ -0,0 +1,33 @@
+import pytest
+
+from src.topic_filter import TopicFilter, TopicRouter
+
+
+def test_matches():
+	assert TopicFilter("a/b").matches("a/b") is True
+	assert TopicFilter("a/b").matches("a/b/c") is False
+	assert TopicFilter("a/+/c").matches("a/b/c") is True
+	assert TopicFilter("a/+/c").matches("a/b/d") is False
+	assert TopicFilter("a/+").matches("a/b/c") is False
+	assert TopicFilter("a/#").matches("a") is True
+	assert TopicFilter("a/#").matches("a/b/c") is True
+	assert TopicFilter("#").matches("a/b") is True
+	assert TopicFilter("#").matches("$SYS/broker") is False
+	assert TopicFilter("+/+").matches("a/") is True
+
+
+def test_invalid_filter():
+	with pytest.raises(ValueError):
+		TopicFilter("a/#/b")
+	with pytest.raises(ValueError):
+		TopicFilter("a/b+")
+	with pytest.raises(ValueError):
+		TopicFilter("")
+
+
+def test_router():
+	router = TopicRouter([("alarm/#", "alarm"), ("+/temperature", "temp")], default="other", cache_size=2)
+	assert router.lookup("alarm/temperature") == "alarm"
+	assert router.lookup("room/temperature") == "temp"
+	assert router.lookup("room/humidity") == "other"
+	assert router.lookup("room/temperature") == "temp"  # cache dropped and rebuilt
@@ -0,0 +1,68 @@
+import datetime
+from test.setup_test import FakePool
+
+import pytest
+
+from src.batch_writer import BatchWriter
+from src.database import Database, DatabaseConfKey
+from src.topic_query import TopicQuery, get_topic_condition
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def test_single_level_wildcard():
+	condition, parameters = get_topic_condition("plant/+/temperature")
+	assert condition == (
+		"topic_levels @> $1::text[] AND topic_levels[1] = $2 AND topic_levels[3] = $3 "
+		"AND cardinality(topic_levels) = 3"
+	)
+	assert parameters == [["plant", "temperature"], "plant", "temperature"]
+
+
+def test_multi_level_wildcard():
+	condition, parameters = get_topic_condition("plant/a/#", first_parameter=3)
+	assert condition == (
+		"topic_levels @> $3::text[] AND topic_levels[1] = $4 AND topic_levels[2] = $5 "
+		"AND cardinality(topic_levels) >= 2"
+	)
+	assert parameters == [["plant", "a"], "plant", "a"]
+
+
+def test_leading_wildcards():
+	condition, parameters = get_topic_condition("+/status")
+	assert condition == (
+		"topic_levels @> $1::text[] AND topic_levels[2] = $2 AND cardinality(topic_levels) = 2 "
+		"AND topic_levels[1] NOT LIKE '$%'"
+	)
+
+	condition, parameters = get_topic_condition("#")
+	assert condition == "topic_levels IS NOT NULL AND topic_levels[1] NOT LIKE '$%'"
+	assert parameters == []
+
+	with pytest.raises(ValueError):
+		get_topic_condition("plant/#/a")
+
+
+def test_query():
+	database = Database({DatabaseConfKey.HOST: "localhost"})
+	query, parameters = TopicQuery(database).get_query("a/+", since=NOW, limit=10)
+	assert query == (
+		"SELECT topic, text, qos, retain, time FROM journal WHERE topic_levels @> $1::text[] "
+		"AND topic_levels[1] = $2 AND cardinality(topic_levels) = 2 AND time >= $3 "
+		"ORDER BY time DESC LIMIT $4"
+	)
+	assert parameters == [["a"], "a", NOW, 10]
+
+
+@pytest.mark.asyncio
+async def test_writer_stores_topic_levels():
+	config = {DatabaseConfKey.HOST: "localhost", DatabaseConfKey.TOPIC_LEVELS: True}
+	database = Database(config)
+	database._pool = FakePool()
+	writer = BatchWriter(database, config)
+
+	await writer.flush([("plant/a/temperature", "21.5", 0, False, NOW, None, None, None)])
+
+	((_, records, columns),) = database.pool.copied
+	assert columns == BatchWriter.COLUMNS + ["topic_levels"]
+	assert records == [("plant/a/temperature", "21.5", 0, False, NOW, ["plant", "a", "temperature"])]
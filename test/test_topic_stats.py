@@ -0,0 +1,87 @@
+import datetime
+from test.setup_test import FakePool, SetupTest
+from test.soak_harness import RecordedMessage, ReplayClient
+
+import pytest
+
+from src.app_config import AppConfig
+from src.constants import MqttConfKey
+from src.database import DatabaseConfKey
+from src.database_target import DatabaseTargets
+from src.mqtt_listener import MqttListener
+from src.topic_stats import TopicStats
+
+NOW = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+SECOND = datetime.timedelta(seconds=1)
+
+
+def test_summarize():
+	stats = TopicStats("broker", max_topics=2)
+	stats.add("a", 10, NOW)
+	stats.add("b", 5, NOW + SECOND, dropped=True)
+	stats.add("a", 20, NOW + 2 * SECOND)
+	stats.add("c", 1, NOW + 3 * SECOND)  # beyond max_topics
+	stats.add("d", 2, NOW + 4 * SECOND)
+
+	end = NOW + 10 * SECOND
+	assert stats.summarize(end) == [
+		(end, NOW, "broker", "a", 2, 30, 0, NOW, NOW + 2 * SECOND),
+		(end, NOW, "broker", "b", 1, 5, 1, NOW + SECOND, NOW + SECOND),
+		(end, NOW, "broker", "#", 2, 3, 0, NOW + 3 * SECOND, NOW + 4 * SECOND),
+	]
+	assert len(stats) == 0
+	assert stats.summarize(end) == []
+
+
+@pytest.mark.asyncio
+async def test_listener_stores_topic_stats():
+	config = AppConfig(SetupTest.get_test_config_path())
+	config._config_data["mqtt"][MqttConfKey.SUBSCRIPTIONS] = ["base1/#"]
+	config._config_data["mqtt"][MqttConfKey.TOPIC_STATS_INTERVAL_SECONDS] = 60
+	config._config_data["mqtt"][MqttConfKey.NAME] = "site-a"
+	targets = DatabaseTargets(
+		[{DatabaseConfKey.HOST: "localhost", DatabaseConfKey.TOPIC_STATS_TABLE: "topic_stats"}]
+	)
+	(target,) = targets
+	target.database._pool = FakePool()
+
+	client = ReplayClient(
+		[RecordedMessage(0.0, "base1/a", b"123"), RecordedMessage(0.0, "base1/b", b"1")], loops=2
+	)
+	listener = MqttListener(config, targets, client_factory=lambda **_: client)
+	await listener.process()
+	assert await listener.store_topic_stats() == 2
+
+	((table_name, records, columns),) = target.database.pool.copied
+	assert table_name == "topic_stats"
+	assert columns == TopicStats.COLUMNS
+	assert [record[2:7] for record in records] == [
+		("site-a", "base1/a", 2, 6, 0),
+		("site-a", "base1/b", 2, 2, 0),
+	]
+
+
+@pytest.mark.asyncio
+async def test_held_messages_are_no_drops():
+	config = AppConfig(SetupTest.get_test_config_path())
+	config._config_data["mqtt"][MqttConfKey.SUBSCRIPTIONS] = ["base1/#"]
+	config._config_data["mqtt"][MqttConfKey.TOPIC_STATS_INTERVAL_SECONDS] = 60
+	config._config_data["mqtt"][MqttConfKey.RATE_LIMITS] = [
+		{"topic": "base1/latest", "rate": 0.001, "burst": 1, "mode": "latest"},
+		{"topic": "base1/drop", "rate": 0.001, "burst": 1},
+	]
+	targets = DatabaseTargets([{DatabaseConfKey.HOST: "localhost"}])
+
+	client = ReplayClient(
+		[RecordedMessage(0.0, "base1/latest", b"1"), RecordedMessage(0.0, "base1/drop", b"1")],
+		loops=3,
+	)
+	listener = MqttListener(config, targets, client_factory=lambda **_: client)
+	await listener.process()
+
+	rows = listener.topic_stats.summarize(NOW)
+	# "latest": stored, held, replacing the held one (a drop); "drop": stored, 2 drops
+	assert sorted((row[3], row[4], row[6]) for row in rows) == [
+		("base1/drop", 3, 2),
+		("base1/latest", 3, 1),
+	]
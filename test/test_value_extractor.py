@@ -0,0 +1,53 @@
+from src.value_extractor import ValueExtractor, parse_json_pointer
+
+
+def test_parse_json_pointer():
+	assert parse_json_pointer(None) is None
+	assert parse_json_pointer("") is None
+	assert parse_json_pointer("/a/b~1c/d~0e/0") == ["a", "b/c", "d~e", "0"]
+
+
+def test_extract():
+	extractor = ValueExtractor(
+		[
+			{"topic": "plant/+/temperature", "unit": "°C"},
+			{"topic": "plant/+/status", "pointer": "/sensor/value", "unit_pointer": "/sensor/unit"},
+			{"topic": "plant/+/list", "pointer": "/values/1", "unit": "bar"},
+		]
+	)
+	topics = [
+		"plant/a/temperature",
+		"plant/b/temperature",
+		"plant/a/status",
+		"plant/b/status",
+		"plant/a/list",
+		"plant/a/other",
+	]
+	texts = [
+		"21.5",
+		"off",
+		'{"sensor": {"value": 3, "unit": "kW"}}',
+		"no json",
+		'{"values": [1, "2.5"]}',
+		"42",
+	]
+
+	values, units = extractor.extract(topics, texts)
+
+	assert values == [21.5, None, 3.0, None, 2.5, None]
+	assert units == ["°C", None, "kW", None, "bar", None]
+
+
+def test_no_rules():
+	extractor = ValueExtractor(None)
+	assert not extractor
+	assert extractor.extract(["a"], ["1"]) == ([None], [None])
+
+
+def test_out_of_range_integer():
+	extractor = ValueExtractor([{"topic": "plant/+/status", "pointer": "/value"}])
+	huge = "1" + "0" * 400
+	values, _ = extractor.extract(
+		["plant/a/status", "plant/b/status"], ['{"value": ' + huge + "}", '{"value": 1}']
+	)
+	assert values == [None, 1.0]
@@ -0,0 +1,58 @@
+import asyncio
+import contextlib
+from test.setup_test import FakePool
+
+import pytest
+
+from src.database import Database, DatabaseConfKey
+from src.writer_pipeline import WriterPipeline
+
+
+def create_pipeline():
+	config = {
+		DatabaseConfKey.HOST: "localhost",
+		DatabaseConfKey.BATCH_SIZE: 1000,
+		DatabaseConfKey.WAIT_MAX_SECONDS: 60,
+		DatabaseConfKey.LANES: [
+			{
+				"name": "alarm",
+				"topics": ["plant/+/alarm"],
+				DatabaseConfKey.BATCH_SIZE: 10,
+				DatabaseConfKey.WAIT_MAX_SECONDS: 0.01,
+			},
+		],
+	}
+	database = Database(config)
+	database._pool = FakePool()
+	return WriterPipeline(database, config), database._pool
+
+
+def test_routing():
+	pipeline, _ = create_pipeline()
+	default_lane, alarm_lane = pipeline.writers
+	assert alarm_lane.name == "alarm"
+
+	pipeline.put(("plant/a/alarm", "1", 0, False, None))
+	pipeline.put(("plant/a/temperature", "2", 0, False, None))
+	pipeline.put(("plant/b/alarm", "3", 0, False, None))
+
+	assert alarm_lane.queue_size == 2
+	assert default_lane.queue_size == 1
+
+
+@pytest.mark.asyncio
+async def test_lanes_are_independent():
+	pipeline, pool = create_pipeline()
+	task = asyncio.create_task(pipeline.run())
+
+	for index in range(500):
+		pipeline.put((f"plant/{index}/temperature", "1", 0, False, None))
+	pipeline.put(("plant/a/alarm", "1", 0, False, None))
+
+	await asyncio.sleep(0.1)
+	assert pool.stored == ["plant/a/alarm"]  # the default lane still waits for its batch
+
+	task.cancel()
+	with contextlib.suppress(asyncio.CancelledError):
+		await task
+	assert [len(records) for _, records, _ in pool.copied] == [1, 500]  # flushed on shutdown
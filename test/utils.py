@@ -4,7 +4,7 @@ from test.setup_test import SetupTest
 
 import yaml
 
-from src.mqtt_listener import MqttConfKey
+from src.constants import MqttConfKey
 
 
 def create_config_file(test_config_data, database_config, topics):